@@ -1,72 +1,145 @@
 # app.py
+import os
+
 import streamlit as st
 import plotly.express as px
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- CONFIGURATION ---
-BACKEND_URL = "http://127.0.0.1:5000/api/query"
+BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:5000/api/query")
+BACKEND_TIMEOUT = (3.05, float(os.getenv("BACKEND_TIMEOUT", 60))) # (connect, read) seconds
+PLOT_POINTS = int(os.getenv("PLOT_POINTS", 200)) # Points per profile the backend downsamples plot results to
+PROFILE_VARIABLES = ("salinity", "temperature")
+GROUP_COLUMNS = ("profile_id", "float_id")
+
+# --------------------------
+# Backend client: one pooled session per server process (keep-alive, timeouts, connect retries)
+# --------------------------
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3, allowed_methods=None)
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+def ask_backend(prompt, cursor=None, plot=False):
+    """Returns (summary text, rows, next_cursor) for a question, or for its next page when given a cursor.
+
+    With `plot`, profile results come back downsampled to about PLOT_POINTS points each (the "plot"
+    payload, flattened into rows here) instead of as pages of raw rows.
+    """
+    payload = {"query": prompt}
+    if plot:
+        payload["plot"] = {"points": PLOT_POINTS}
+    if cursor:
+        payload["cursor"] = cursor
+    try:
+        response = get_session().post(BACKEND_URL, json=payload, timeout=BACKEND_TIMEOUT)
+        response.raise_for_status()  # Raise an exception for bad status codes
+        response_data = response.json()
+        summary = response_data.get("summary", "An error occurred.")
+        if response_data.get("plot"):
+            return summary, plot_rows(response_data["plot"]), None
+        return summary, response_data.get("data", []), response_data.get("next_cursor")
+    except requests.exceptions.Timeout:
+        return "The backend took too long to answer. Please try again.", [], None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return f"Could not connect to the backend server. Error: {e}", [], None
+
+def plot_rows(plot):
+    """Flattens the backend's downsampled profiles ({"pressure": [...], "temperature": [...], ...}) into rows."""
+    rows = []
+    for profile in plot.get("profiles", []):
+        meta = {c: profile[c] for c in GROUP_COLUMNS + ("date",) if c in profile}
+        variables = [v for v in PROFILE_VARIABLES if v in profile]
+        for i, pressure in enumerate(profile.get("pressure", [])):
+            rows.append(dict(meta, pressure=pressure, **{v: profile[v][i] for v in variables}))
+    return rows
+
+# --------------------------
+# Plotting: the figure is built once, when the reply arrives, and kept with the message
+# --------------------------
+def choose_plot(columns):
+    """Picks a plot for the result columns: ("profile", variable), ("series", variable), ("map", None) or None."""
+    variable = next((v for v in PROFILE_VARIABLES if v in columns), None)
+    if variable and "pressure" in columns:
+        return "profile", variable
+    if variable and "date" in columns:
+        return "series", variable
+    if "latitude" in columns and "longitude" in columns:
+        return "map", None
+    return None
+
+def build_figure(rows):
+    if not rows:
+        return None
+    df = pd.DataFrame(rows)
+    plot = choose_plot(df.columns)
+    if plot is None:
+        return None
+    kind, variable = plot
+    group = next((c for c in GROUP_COLUMNS if c in df.columns and df[c].nunique() > 1), None)
+    if kind == "profile":
+        df = df.sort_values([group, "pressure"] if group else "pressure")
+        fig = px.line(df, x=variable, y="pressure", color=group, title=f"{variable.capitalize()} Profile")
+        fig.update_yaxes(autorange="reversed")
+    elif kind == "series":
+        df = df.assign(date=pd.to_datetime(df["date"], errors="coerce")).sort_values("date")
+        fig = px.line(df, x="date", y=variable, color=group, title=f"{variable.capitalize()} over Time")
+    else:
+        points = df.drop_duplicates(["latitude", "longitude"])
+        fig = px.scatter_geo(points, lat="latitude", lon="longitude", color=group, title="Float Positions")
+        fig.update_geos(fitbounds="locations")
+    return fig
+
+def render_message(message, index):
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        if message.get("figure") is not None:
+            st.plotly_chart(message["figure"], use_container_width=True, key=f"figure-{index}")
+        if message.get("next_cursor") and st.button("More results", key=f"more-{index}"):
+            st.session_state.more_results = index
+
+def add_reply(prompt, cursor=None, plot=False):
+    """Asks the backend (for the page after `cursor`, if given) and appends and shows the reply."""
+    with st.spinner("Thinking..." if cursor is None else "Fetching more results..."):
+        text_response, data_to_plot, next_cursor = ask_backend(prompt, cursor, plot)
+        figure = build_figure(data_to_plot)
+    # The question, options and cursor stay with the reply so "More results" can fetch the next page.
+    st.session_state.messages.append({"role": "assistant", "content": text_response, "figure": figure,
+                                      "query": prompt, "plot": plot, "next_cursor": next_cursor})
+    render_message(st.session_state.messages[-1], len(st.session_state.messages) - 1)
 
 # --- STREAMLIT FRONTEND ---
 st.set_page_config(page_title="FloatChat", layout="wide")
 st.title("FloatChat: Ocean Data Discovery")
 st.markdown("Ask me anything about ARGO float data in the Indian Ocean!")
+plot_mode = st.sidebar.checkbox("Plot profiles (downsampled by the server)", value=False,
+                                help="Faster plots of long profiles; the reply carries no raw rows.")
 
 # Initialize chat history
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Hello! What ocean data are you curious about?"}]
 
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-        if "data" in message and message["data"]:
-            df = pd.DataFrame(message["data"])
-            
-            # This is a very basic plotting logic. You'll need to expand this.
-            if 'salinity' in df.columns and 'pressure' in df.columns:
-                fig = px.line(df, x="salinity", y="pressure", title="Salinity Profile")
-                fig.update_yaxes(autorange="reversed")
-                st.plotly_chart(fig, use_container_width=True)
-            elif 'temperature' in df.columns and 'pressure' in df.columns:
-                 fig = px.line(df, x="temperature", y="pressure", title="Temperature Profile")
-                 fig.update_yaxes(autorange="reversed")
-                 st.plotly_chart(fig, use_container_width=True)
-            # You can add more plot types here
+# Display chat messages from history on app rerun (stored figures only, nothing is rebuilt)
+for i, message in enumerate(st.session_state.messages):
+    render_message(message, i)
+
+# "More results" clicked on a paged reply: fetch its next page as a new reply
+more = st.session_state.pop("more_results", None)
+if more is not None:
+    message = st.session_state.messages[more]
+    cursor, message["next_cursor"] = message["next_cursor"], None
+    add_reply(message["query"], cursor, message.get("plot", False))
 
 # Accept user input
 if prompt := st.chat_input("Ask a question about ARGO data..."):
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    with st.spinner("Thinking..."):
-        try:
-            # Send the query to the backend API
-            response = requests.post(BACKEND_URL, json={"query": prompt})
-            response.raise_for_status()  # Raise an exception for bad status codes
-            response_data = response.json()
-            
-            text_response = response_data.get("summary", "An error occurred.")
-            data_to_plot = response_data.get("data", [])
-        except requests.exceptions.RequestException as e:
-            text_response = f"Could not connect to the backend server. Error: {e}"
-            data_to_plot = []
-
-    with st.chat_message("assistant"):
-        st.markdown(text_response)
-        if data_to_plot:
-            df = pd.DataFrame(data_to_plot)
-            if 'salinity' in df.columns and 'pressure' in df.columns:
-                fig = px.line(df, x="salinity", y="pressure", title="Salinity Profile")
-                fig.update_yaxes(autorange="reversed")
-                st.plotly_chart(fig, use_container_width=True)
-            elif 'temperature' in df.columns and 'pressure' in df.columns:
-                fig = px.line(df, x="temperature", y="pressure", title="Temperature Profile")
-                fig.update_yaxes(autorange="reversed")
-                st.plotly_chart(fig, use_container_width=True)
-            # You can add more plot types here
-
-    # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": text_response, "data": data_to_plot})
\ No newline at end of file
+    render_message(st.session_state.messages[-1], len(st.session_state.messages) - 1)
+
+    add_reply(prompt, plot=plot_mode)
@@ -0,0 +1,239 @@
+"""Latency / throughput benchmark for the query, route and QR endpoints, with the stub LLM.
+
+Usage:
+    python synth_db.py --rows 1000000 --out bench.db
+    python benchmark.py --db bench.db [--mode client|http] [--requests 500] [--concurrency 8] [--out bench.json]
+
+--mode client drives the app in-process through the Flask test client (no network, no server).
+--mode http sends real HTTP requests to --url, or, without --url, starts `gunicorn test:app` on a free
+port with the same environment and stops it afterwards. The LLM is always the deterministic stub
+(LLM_BACKEND=stub, optionally slowed down with --llm-latency-ms) so runs are reproducible.
+
+Results are printed as JSON: per endpoint count, errors, p50/p95/p99/mean latency (ms) and
+throughput (requests/s), plus the git commit and settings, so runs can be diffed across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+QUERY_TEMPLATES = [
+    "show temperature and salinity for float {float_id}",
+    "average of temperature for float {float_id}",
+    "max of pressure between {start} to {end}",
+    "salinity profiles near latitude {lat} longitude {lon}",
+    "nearest 20 floats near lat {lat} lon {lon}",
+    "temperature at latitude between {lat_lo} and {lat_hi} limit 200",
+    "count of profile_id from {start} to {end}",
+]
+
+
+def sample_workload(db_path, count, seed):
+    """Builds `count` request bodies per endpoint from real float IDs, dates and positions in the DB."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    floats = [row[0] for row in conn.execute("SELECT float_id FROM argo_metadata ORDER BY float_id LIMIT 1000")]
+    max_rowid = conn.execute("SELECT max(rowid) FROM argo_profiles").fetchone()[0] or 0
+    rowids = sorted(rng.randint(1, max_rowid) for _ in range(200)) if max_rowid else []
+    positions = conn.execute(
+        f"SELECT latitude, longitude, substr(date, 1, 10) FROM argo_profiles WHERE rowid IN ({','.join('?' * len(rowids))})",
+        rowids,
+    ).fetchall()
+    conn.close()
+    if not floats or not positions:
+        raise ValueError(f"{db_path} has no profiles; generate one with synth_db.py first.")
+
+    queries = []
+    for _ in range(count):
+        lat, lon, day = rng.choice(positions)
+        float_id = floats[rng.randrange(len(floats))]
+        queries.append({"query": rng.choice(QUERY_TEMPLATES).format(
+            float_id=str(float_id).strip("b' "), lat=round(lat, 2), lon=round(lon, 2),
+            lat_lo=round(lat - 2, 1), lat_hi=round(lat + 2, 1), start=day, end=f"{int(day[:4]) + 1}{day[4:]}",
+        ), "language": "en"})
+    routes = [{
+        "start_lat": round(rng.uniform(-60, 25), 4), "start_lon": round(rng.uniform(30, 120), 4),
+        "end_lat": round(rng.uniform(-60, 25), 4), "end_lon": round(rng.uniform(30, 120), 4),
+    } for _ in range(count)]
+    qr_codes = [{"history": [{"role": "user", "content": q["query"]}, {"role": "assistant", "content": "ok"}]}
+                for q in queries]
+    return {
+        "query": ("/api/query", queries),
+        "route_info": ("/api/route_info", routes),
+        "qr_code": ("/api/qr_code", qr_codes),
+    }
+
+
+def summarize(latencies_ms, errors, wall_seconds):
+    lat = np.asarray(latencies_ms, dtype=np.float64)
+    return {
+        "count": int(lat.size),
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "mean_ms": round(float(lat.mean()), 3),
+        "max_ms": round(float(lat.max()), 3),
+        "throughput_rps": round(lat.size / wall_seconds, 2) if wall_seconds > 0 else None,
+    }
+
+
+def run_phase(send, bodies, concurrency, warmup):
+    """Sends the first `warmup` bodies unmeasured, then the rest with `concurrency` threads; returns stats."""
+    for body in bodies[:warmup]:
+        send(body)
+
+    def timed(body):
+        start = time.perf_counter()
+        ok = send(body)
+        return (time.perf_counter() - start) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, bodies[warmup:]))
+    wall = time.perf_counter() - started
+    return summarize([ms for ms, _ in results], sum(1 for _, ok in results if not ok), wall)
+
+
+def client_sender(path):
+    import test  # imported lazily: the environment must be configured first
+    client = test.app.test_client()
+
+    def send(body):
+        resp = client.post(path, json=body)
+        resp.get_data()
+        return resp.status_code < 400
+    return send
+
+
+def http_sender(base_url, path):
+    url = base_url.rstrip("/") + path
+
+    def send(body):
+        req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                resp.read()
+                return resp.status < 400
+        except (urllib.error.URLError, OSError):
+            return False
+    return send
+
+
+def start_server(workers, threads):
+    """Starts gunicorn on a free local port and waits for /readyz. Returns (process, base_url)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+           "--threads", str(threads), "test:app"]
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), env=os.environ.copy())
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup.")
+        try:
+            with urllib.request.urlopen(base_url + "/readyz", timeout=2) as resp:
+                # /readyz only awaits the database; also wait for the probed worker's warm-up to finish.
+                if resp.status == 200 and not json.loads(resp.read())["warming_up"]:
+                    return proc, base_url
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become ready within 120s.")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/query, /api/route_info and /api/qr_code.")
+    parser.add_argument("--db", default="argo_data.db")
+    parser.add_argument("--mode", choices=["client", "http"], default="client")
+    parser.add_argument("--url", help="Base URL of a running server (http mode). Default: start gunicorn.")
+    parser.add_argument("--endpoints", default="query,route_info,qr_code")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per endpoint.")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers when the server is started here.")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker.")
+    parser.add_argument("--llm-latency-ms", type=int, default=0, help="Simulated stub LLM latency.")
+    parser.add_argument("--no-result-cache", action="store_true", help="Measure SQLite, not the result cache.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Database not found: {args.db} (create one with synth_db.py)")
+        return 1
+    scratch = tempfile.mkdtemp(prefix="argo-bench-")
+    os.environ.update({
+        "DB_FILE": os.path.abspath(args.db),
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms),
+        "LLM_CACHE_FILE": "",
+        "HISTORY_DB_FILE": os.path.join(scratch, "history.db"),
+        "WARM_UP": "eager",
+    })
+    if args.no_result_cache:
+        os.environ["RESULT_CACHE_MB"] = "0"
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    workload = sample_workload(args.db, args.requests + args.warmup, args.seed)
+    proc, base_url = None, args.url
+    if args.mode == "http" and not base_url:
+        proc, base_url = start_server(args.workers, args.threads)
+    try:
+        results = {}
+        for name in endpoints:
+            path, bodies = workload[name]
+            send = client_sender(path) if args.mode == "client" else http_sender(base_url, path)
+            results[name] = run_phase(send, bodies, args.concurrency, args.warmup)
+            print(f"{name}: {results[name]}", file=sys.stderr)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "settings": {
+            "db": os.path.basename(args.db), "db_bytes": os.path.getsize(args.db), "mode": args.mode,
+            "requests": args.requests, "warmup": args.warmup, "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms, "result_cache": not args.no_result_cache,
+            "workers": args.workers if proc is not None else None, "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
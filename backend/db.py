@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+# --------------------------
+# Read-only SQLite connection pool (one connection per thread, bounded checkouts)
+# --------------------------
+class ConnectionPool:
+    """Hands out per-thread read-only connections so concurrent requests never share a cursor."""
+
+    def __init__(self, db_path, max_connections=8, cache_size_kb=64 * 1024, mmap_size=256 * 1024 * 1024,
+                 statement_cache=256, timeout=30.0, on_connect=None):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.statement_cache = statement_cache
+        self.timeout = timeout
+        self.on_connect = on_connect
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._stats_lock = threading.Lock()
+        self._stats = {"connections": 0, "checkouts": 0, "waits": 0, "in_use": 0, "max_connections": max_connections}
+        self._enable_wal()
+
+    def _enable_wal(self):
+        """WAL lets readers run alongside the ingester; it is a file property, so set it once read-write."""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not enable WAL on {self.db_path}: {e}")
+
+    def _open(self):
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            timeout=self.timeout,
+            cached_statements=self.statement_cache,
+        )
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if self.on_connect:
+            self.on_connect(conn)
+        with self._stats_lock:
+            self._stats["connections"] += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["waits"] += 1
+            self._slots.acquire()
+        with self._stats_lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+        try:
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._open()
+            yield conn
+        finally:
+            with self._stats_lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
@@ -0,0 +1,149 @@
+import numpy as np
+
+PLOT_MODES = ("bins", "lttb")
+PLOT_VARIABLES = ("temperature", "salinity")
+PROFILE_KEYS = ("profile_id", "float_id")
+PROFILE_META = ("float_id", "cycle_number", "date", "latitude", "longitude")
+
+
+# --------------------------
+# Profile resampling for plots (pressure on x, one or more variables on y)
+# --------------------------
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that preserve the curve's shape.
+
+    x must be sorted. The first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.floor(np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # Mean point of every bucket (for the "next bucket" vertex), via cumulative sums.
+    cx, cy = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.diff(edges)
+    avg_x = np.append((cx[edges[1:]] - cx[edges[:-1]]) / counts, x[-1])
+    avg_y = np.append((cy[edges[1:]] - cy[edges[:-1]]) / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def bin_means(pressure, values, edges):
+    """Mean pressure and mean of each variable per pressure bin (empty bins dropped)."""
+    idx = np.digitize(pressure, edges) - 1
+    valid = (idx >= 0) & (idx < len(edges) - 1)
+    idx, nbins = idx[valid], len(edges) - 1
+    counts = np.bincount(idx, minlength=nbins)
+    keep = counts > 0
+    mean_p = np.bincount(idx, weights=pressure[valid], minlength=nbins)[keep] / counts[keep]
+    means = {}
+    for name, v in values.items():
+        v = v[valid]
+        ok = ~np.isnan(v)
+        n = np.bincount(idx[ok], minlength=nbins)
+        s = np.bincount(idx[ok], weights=v[ok], minlength=nbins)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[name] = (s / n)[keep]
+    return mean_p, means
+
+
+def _column(rows, i):
+    return np.array([row[i] if row[i] is not None else np.nan for row in rows], dtype=np.float64)
+
+
+def _clean(values, decimals):
+    """Rounded list with NaN -> None (JSON null)."""
+    rounded = np.round(values, decimals)
+    return [None if v != v else v for v in rounded.tolist()]
+
+
+def missing_plot_columns(col_names):
+    """What a result set lacks to be downsampled per profile: pressure, a plotted variable, a profile key."""
+    missing = []
+    if "pressure" not in col_names:
+        missing.append("pressure")
+    if not any(v in col_names for v in PLOT_VARIABLES):
+        missing.append(" or ".join(PLOT_VARIABLES))
+    if not any(k in col_names for k in PROFILE_KEYS):
+        missing.append(" or ".join(PROFILE_KEYS))
+    return missing
+
+
+def downsample_profiles(col_names, rows, mode="bins", points=100, bin_dbar=None, max_profiles=200, max_bins=2000):
+    """Groups rows into profiles and resamples each to about `points` points along pressure.
+
+    mode "bins" averages fixed pressure bins (bin_dbar wide, or `points` bins over the observed depth
+    range, shared by all profiles so they line up; bins are widened so there are never more than
+    max_bins of them); mode "lttb" keeps the shape-preserving subset chosen
+    on the first plotted variable (the other variables use the same samples). Returns None when the
+    rows have no pressure column or nothing to plot.
+    """
+    if "pressure" not in col_names or not rows:
+        return None
+    variables = [v for v in PLOT_VARIABLES if v in col_names]
+    if not variables:
+        return None
+    key_col = next((k for k in PROFILE_KEYS if k in col_names), None)
+    p_idx = col_names.index("pressure")
+    pressure = _column(rows, p_idx)
+    values = {v: _column(rows, col_names.index(v)) for v in variables}
+
+    if key_col is not None:
+        keys = [row[col_names.index(key_col)] for row in rows]
+        _, group_ids = np.unique(np.array([str(k) for k in keys]), return_inverse=True)
+    else:
+        group_ids = np.zeros(len(rows), dtype=np.int64)
+    has_p = ~np.isnan(pressure)
+    order = np.lexsort((pressure, group_ids))
+    order = order[has_p[order]]
+    bounds = np.flatnonzero(np.diff(group_ids[order])) + 1
+    groups = np.split(order, bounds) if len(order) else []
+
+    if mode == "bins":
+        top = float(np.nanmax(pressure)) if has_p.any() else 0.0
+        width = max(bin_dbar or top / max(points, 1), top / max(max_bins, 1), 1e-9)
+        edges = np.arange(0.0, top + width, width)
+        if len(edges) < 2:
+            edges = np.array([0.0, width])
+        edges[-1] = max(edges[-1], top + 1e-9)
+
+    profiles = []
+    for members in groups[:max_profiles]:
+        p = pressure[members]
+        vals = {v: values[v][members] for v in variables}
+        if mode == "lttb":
+            first = vals[variables[0]]
+            ok = ~np.isnan(first)
+            p, vals = p[ok], {v: a[ok] for v, a in vals.items()}
+            if len(p) == 0:
+                continue
+            keep = lttb_indices(p, vals[variables[0]], points)
+            p, vals = p[keep], {v: a[keep] for v, a in vals.items()}
+        else:
+            p, vals = bin_means(p, vals, edges)
+        first_row = rows[members[0]]
+        profile = {c: first_row[col_names.index(c)] for c in PROFILE_META if c in col_names}
+        if key_col == "profile_id":
+            profile["profile_id"] = first_row[col_names.index("profile_id")]
+        profile["raw_points"] = int(len(members))
+        profile["pressure"] = _clean(p, 1)
+        for v in variables:
+            profile[v] = _clean(vals[v], 3)
+        profiles.append(profile)
+
+    return {
+        "mode": mode,
+        "points": points,
+        "bin_dbar": round(width, 3) if mode == "bins" else None,
+        "profiles": profiles,
+        "truncated_profiles": max(len(groups) - max_profiles, 0),
+        "raw_rows": len(rows),
+    }
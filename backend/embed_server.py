@@ -0,0 +1,165 @@
+"""Single-process embedding server: one SentenceTransformer (and one torch runtime) for all gunicorn workers.
+
+Usage:
+    python embed_server.py [--socket /tmp/argo-embed.sock] [--model all-MiniLM-L6-v2] [--threads N]
+
+Workers started with EMBED_SERVER_SOCKET set use RemoteEncoder instead of loading the model, so they
+never import torch. gunicorn.conf.py starts and stops this server when EMBED_SERVER=1.
+Protocol (Unix stream socket, one connection per worker thread, any number of requests each):
+    request:  4-byte big-endian length + JSON {"texts": [...]}
+    response: 4-byte big-endian row count n + 4-byte dimension d + n * d float32 values,
+              or n = 0xFFFFFFFF + 4-byte length + UTF-8 error message
+Requests arriving together are encoded in one batch (retrieval.EmbeddingBatcher).
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+import numpy as np
+
+DEFAULT_SOCKET = "/tmp/argo-embed.sock"
+ERROR = 0xFFFFFFFF
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+
+def _read_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def freeze_model(model):
+    """Inference-only: no autograd state, so the weights are never written after load (and copy-on-write
+    pages shared with forked workers stay shared)."""
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return model
+
+
+# --------------------------
+# Client (used by the web workers in place of a SentenceTransformer)
+# --------------------------
+class RemoteEncoder:
+    """SentenceTransformer-compatible encode() backed by embed_server.py; one socket per thread."""
+
+    def __init__(self, socket_path, timeout=10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _socket(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, texts):
+        body = json.dumps({"texts": texts}).encode("utf-8")
+        sock = self._socket()
+        sock.sendall(struct.pack("!I", len(body)) + body)
+        n, d = struct.unpack("!II", _read_exact(sock, 8))
+        if n == ERROR:
+            raise RuntimeError(f"embedding server error: {_read_exact(sock, d).decode('utf-8', 'replace')}")
+        return np.frombuffer(_read_exact(sock, n * d * 4), dtype=np.float32).reshape(n, d)
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        try:
+            vectors = self._request(texts)
+        except (OSError, ConnectionError):
+            # The server may have restarted; retry once on a fresh connection.
+            self.reconnect()
+            vectors = self._request(texts)
+        return vectors[0] if single else vectors
+
+    def reconnect(self):
+        sock = getattr(self._local, "sock", None)
+        self._local = threading.local()
+        if sock is not None:
+            sock.close()
+
+
+# --------------------------
+# Server
+# --------------------------
+class EmbeddingHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                (length,) = struct.unpack("!I", _read_exact(self.request, 4))
+            except ConnectionError:
+                return
+            if length > MAX_REQUEST_BYTES:
+                # The body is never read, so the stream cannot be resynchronised: answer and hang up.
+                message = b"request too large"
+                self.request.sendall(struct.pack("!II", ERROR, len(message)) + message)
+                return
+            try:
+                texts = json.loads(_read_exact(self.request, length))["texts"]
+                futures = [self.server.batcher.submit(str(t)) for t in texts]
+                vectors = np.ascontiguousarray([f.result() for f in futures], dtype=np.float32)
+                n, d = vectors.shape if len(texts) else (0, 0)
+                self.request.sendall(struct.pack("!II", n, d) + vectors.tobytes())
+            except ConnectionError:
+                return
+            except Exception as e:
+                message = str(e).encode("utf-8")
+                self.request.sendall(struct.pack("!II", ERROR, len(message)) + message)
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 256  # every worker thread connects on its first query
+
+    def __init__(self, socket_path, model, max_batch=64, window_ms=5):
+        from retrieval import EmbeddingBatcher
+        self.batcher = EmbeddingBatcher(model, max_batch=max_batch, window_ms=window_ms)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, EmbeddingHandler)
+        os.chmod(socket_path, 0o660)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve sentence embeddings over a Unix socket.")
+    parser.add_argument("--socket", default=os.getenv("EMBED_SERVER_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default).")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--window-ms", type=int, default=5)
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = freeze_model(SentenceTransformer(args.model))
+    with torch.inference_mode():
+        model.encode(["warm up"])
+    server = EmbeddingServer(args.socket, model, max_batch=args.max_batch, window_ms=args.window_ms)
+    print(f"Embedding server ({args.model}) listening on {args.socket}.")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
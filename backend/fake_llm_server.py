@@ -0,0 +1,131 @@
+"""Local fake LLM provider for testing the rate limiter, retries and circuit breaker without an API key.
+
+Usage:
+    python fake_llm_server.py [--port 8090] [--latency-ms 300] [--jitter-ms 100] [--error-rate 0.2]
+                              [--rpm 60] [--retry-after 2]
+    LLM_BACKEND=http LLM_HTTP_URL=http://127.0.0.1:8090/generate python test.py
+
+POST /generate {"prompt": ...} answers like the stub model (heuristic SQL for SQL prompts, a canned
+summary otherwise) after --latency-ms (+ up to --jitter-ms). It replies 429 with Retry-After for a
+random --error-rate fraction of requests and whenever more than --rpm requests arrive within a
+minute (0 = no limit). GET /stats returns request counts; POST /config {"error_rate": 1.0, ...}
+changes the injected faults while running (keys: latency_ms, jitter_ms, error_rate, rpm, retry_after).
+"""
+import argparse
+import collections
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm import StubModel
+from llm_client import estimate_tokens
+from nl_sql import compile_query, inline_params
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def do_GET(self):
+        if self.path != "/stats":
+            return self._reply(404, {"error": "not found"})
+        self._reply(200, self.server.stats())
+
+    def do_POST(self):
+        try:
+            payload = self._body()
+        except ValueError:
+            return self._reply(400, {"error": "invalid JSON"})
+        if self.path == "/config":
+            self.server.configure(payload)
+            return self._reply(200, self.server.config)
+        if self.path != "/generate" or not isinstance(payload.get("prompt"), str):
+            return self._reply(404, {"error": "not found"})
+        limited = self.server.admit()
+        config = self.server.config
+        time.sleep((config["latency_ms"] + random.uniform(0, config["jitter_ms"])) / 1000.0)
+        if limited:
+            return self._reply(429, {"error": "Resource has been exhausted (e.g. check quota)."},
+                               {"Retry-After": str(config["retry_after"])})
+        text = self.server.model.generate_content(payload["prompt"]).text
+        self._reply(200, {"text": text, "total_tokens": estimate_tokens(payload["prompt"]) + len(text) // 4})
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, jitter_ms=0, error_rate=0.0, rpm=0, retry_after=1):
+        super().__init__(address, FakeLLMHandler)
+        self.model = StubModel(sql_fn=lambda q, plot=False: inline_params(*compile_query(q, for_plot=plot)))
+        self.config = {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate, "rpm": rpm,
+                       "retry_after": retry_after}
+        self._lock = threading.Lock()
+        self._recent = collections.deque()
+        self._counts = {"requests": 0, "ok": 0, "rate_limited": 0}
+
+    def configure(self, changes):
+        with self._lock:
+            for key in self.config:
+                if key in changes:
+                    self.config[key] = type(self.config[key])(changes[key])
+
+    def admit(self):
+        """True if this request should be answered with a 429."""
+        now = time.monotonic()
+        with self._lock:
+            self._counts["requests"] += 1
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            limited = random.random() < self.config["error_rate"] or \
+                (self.config["rpm"] and len(self._recent) >= self.config["rpm"])
+            if not limited:
+                self._recent.append(now)
+            self._counts["rate_limited" if limited else "ok"] += 1
+            return limited
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, config=dict(self.config))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake LLM endpoint with injected latency and 429s.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--jitter-ms", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429s (0 = unlimited).")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with each 429.")
+    args = parser.parse_args()
+
+    server = FakeLLMServer((args.host, args.port), args.latency_ms, args.jitter_ms, args.error_rate, args.rpm,
+                           args.retry_after)
+    print(f"Fake LLM server listening on http://{args.host}:{server.server_port}/generate.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+DIRECTIONS = np.array(["North", "North-East", "East", "South-East", "South", "South-West", "West", "North-West"])
+
+
+# --------------------------
+# Vectorized great-circle helpers (inputs broadcast like NumPy arrays, degrees in, km / degrees out)
+# --------------------------
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between broadcastable arrays of points."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def initial_bearing_deg(lat1, lon1, lat2, lon2):
+    """Initial compass bearing in [0, 360) from point 1 to point 2."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dlmb = np.radians(np.subtract(lon2, lon1))
+    y = np.sin(dlmb) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlmb)
+    return (np.degrees(np.arctan2(y, x)) + 360.0) % 360.0
+
+
+def compass_direction(bearing_deg):
+    """Maps bearings to the eight compass names used by /api/route_info."""
+    return DIRECTIONS[np.round(np.asarray(bearing_deg) / 45).astype(int) % 8]
+
+
+def distance_matrix_km(lats_a, lons_a, lats_b, lons_b):
+    """N x M distance matrix between point sets A (rows) and B (columns)."""
+    lats_a, lons_a = np.asarray(lats_a)[:, None], np.asarray(lons_a)[:, None]
+    return haversine_km(lats_a, lons_a, np.asarray(lats_b)[None, :], np.asarray(lons_b)[None, :])
@@ -0,0 +1,73 @@
+"""Production gunicorn settings: `gunicorn -c gunicorn.conf.py test:app` (used by the Dockerfile).
+
+The app is imported once in the master (preload_app), which loads the FAISS index and the embedding
+model read-only and freezes the GC, so every worker shares those pages copy-on-write instead of
+loading its own copy. Workers reopen their SQLite handles in post_fork. Each worker caps torch at
+TORCH_THREADS intra-op threads (default: cores / workers) so workers do not oversubscribe the CPU.
+
+With EMBED_SERVER=1 a single embed_server.py process owns the model instead, and workers reach it
+over a Unix socket (they never import torch). Identical concurrent questions are coalesced across
+workers through lock files in COALESCE_DIR (set it to an empty string to coalesce per worker only).
+Environment: PORT, WEB_CONCURRENCY (workers), GUNICORN_THREADS, TORCH_THREADS, EMBED_SERVER,
+EMBED_SERVER_SOCKET, COALESCE_DIR.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+cpus = multiprocessing.cpu_count()
+
+bind = f":{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, cpus)))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))  # requests mostly wait on the LLM, not the CPU
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+# Read by test.py at import (the master imports it after this file is loaded).
+os.environ["APP_PRELOAD"] = "1"
+os.environ.setdefault("TORCH_THREADS", str(max(1, cpus // workers)))
+os.environ.setdefault("OMP_NUM_THREADS", os.environ["TORCH_THREADS"])
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+os.environ.setdefault("COALESCE_DIR", "/tmp/argo-coalesce")
+if os.getenv("EMBED_SERVER") == "1":
+    os.environ.setdefault("EMBED_SERVER_SOCKET", "/tmp/argo-embed.sock")
+
+_embed_server = None
+
+
+def on_starting(server):
+    """Starts the shared embedding server before the app is imported, and waits for its socket."""
+    global _embed_server
+    if os.getenv("EMBED_SERVER") != "1":
+        return
+    socket_path = os.environ["EMBED_SERVER_SOCKET"]
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    _embed_server = subprocess.Popen(
+        [sys.executable, "embed_server.py", "--socket", socket_path, "--threads", str(max(1, cpus // 2))],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    deadline = time.time() + 120
+    while not os.path.exists(socket_path):
+        if _embed_server.poll() is not None or time.time() > deadline:
+            server.log.error("Embedding server did not start; workers will retry on first use.")
+            return
+        time.sleep(0.2)
+
+
+def post_fork(server, worker):
+    import test
+    test.after_fork()
+
+
+def on_exit(server):
+    if _embed_server is not None and _embed_server.poll() is None:
+        _embed_server.terminate()
+        _embed_server.wait(timeout=10)
@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# --------------------------
+# Shared chat history store (SQLite, safe across gunicorn workers)
+# --------------------------
+class HistoryStore:
+    """Chat histories keyed by ID: O(1) inserts, primary-key lookups, TTL and size-based eviction.
+
+    Each thread gets its own connection; WAL plus a busy timeout lets several worker processes
+    write to the same file without clobbering each other (unlike rewriting one JSON document).
+    """
+
+    def __init__(self, db_path, ttl_seconds=30 * 86400, max_entries=100000, evict_every=100):
+        self.db_path = db_path
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS histories (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS histories_created ON histories(created);
+            CREATE TABLE IF NOT EXISTS imported_files (path TEXT PRIMARY KEY, imported REAL NOT NULL);
+        """)
+
+    def after_fork(self):
+        """Drops connections inherited from the parent process (SQLite handles must not cross fork())."""
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, history, history_id=None, created=None):
+        history_id = history_id or str(uuid.uuid4())
+        self._conn().execute(
+            "INSERT OR REPLACE INTO histories (id, payload, created) VALUES (?, ?, ?)",
+            (history_id, json.dumps(history, ensure_ascii=False), created or time.time()),
+        )
+        with self._writes_lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self.evict()
+        return history_id
+
+    def get(self, history_id):
+        row = self._conn().execute(
+            "SELECT payload FROM histories WHERE id = ? AND created >= ?", (history_id, time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def evict(self):
+        """Drops expired histories, then the oldest ones beyond max_entries."""
+        conn = self._conn()
+        conn.execute("DELETE FROM histories WHERE created < ?", (time.time() - self.ttl,))
+        conn.execute(
+            "DELETE FROM histories WHERE id IN (SELECT id FROM histories ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def import_json(self, json_path, unwrap_key=None):
+        """One-time import of a legacy {id: history} JSON file (skipped once recorded as imported).
+
+        unwrap_key handles files whose values are {"history": [...], "timestamp": "..."}. Imported histories
+        count as created at import time, so each gets the full TTL rather than expiring on import because
+        the legacy file is older than the TTL.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        conn = self._conn()
+        abs_path = os.path.abspath(json_path)
+        if conn.execute("SELECT 1 FROM imported_files WHERE path = ?", (abs_path,)).fetchone():
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not import legacy history file {json_path}: {e}")
+            return 0
+        now = time.time()
+        rows = []
+        for history_id, value in data.items():
+            if unwrap_key and isinstance(value, dict):
+                value = value.get(unwrap_key, [])
+            rows.append((history_id, json.dumps(value, ensure_ascii=False), now))
+        # Re-check inside the write lock: another worker may have imported the file meanwhile.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM imported_files WHERE path = ?", (abs_path,)).fetchone():
+                conn.execute("ROLLBACK")
+                return 0
+            conn.executemany("INSERT OR IGNORE INTO histories (id, payload, created) VALUES (?, ?, ?)", rows)
+            conn.execute("INSERT INTO imported_files (path, imported) VALUES (?, ?)", (abs_path, now))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"Imported {len(rows)} histories from {json_path}.")
+        return len(rows)
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM histories").fetchone()[0]
@@ -0,0 +1,379 @@
+"""Bulk-loads ARGO profile NetCDF files (GDAC layout) into argo_data.db and rebuilds the RAG index.
+
+Usage:
+    python ingest.py <dir or .nc files...> [--db argo_data.db] [--workers N] [--drop-indexes auto|always|never]
+                     [--no-embeddings] [--embed-all] [--faiss faiss_index.bin] [--meta vector_meta.db]
+
+Files are parsed in a process pool (one file per task, all cores by default) and streamed, in completion
+order and a bounded number of files at a time, to this process, which writes them in large executemany()
+transactions. Every file is recorded in ingested_files (path, size, mtime), so a rerun only reads new or
+changed files. A profile that reappears replaces the rows loaded for it earlier, unless those came from a
+delayed-mode (D) file and the new one is real-time (R).
+Large loads drop the indexes and the R*Tree first and rebuild them once at the end; the rollups are
+refreshed (rebuilt if profiles were replaced). A running app notices within DB_RECHECK_SECONDS (see test.py)
+and answers without the R*Tree and rollups until they are back. Finally the per-float summaries of every touched float are
+re-embedded and upserted into the vector index (see vector_index.py).
+
+Needs netCDF4 (pip install netCDF4); embeddings need sentence-transformers and faiss.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from rollups import refresh_rollups
+from schema import PROFILE_COLUMNS, SCHEMA_VERSION, build_indexes, create_schema, detect_schema, drop_indexes
+
+try:
+    import netCDF4
+except Exception:
+    netCDF4 = None
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+JULD_EPOCH_OFFSET_DAYS = 7305  # 1950-01-01 -> 1970-01-01
+BAD_QC = (b"3", b"4")
+DROP_INDEX_MIN_FILES = 2000  # --drop-indexes auto: drop when at least this many files are pending (or the DB is empty)
+FILES_IN_FLIGHT_PER_WORKER = 32  # parsed-but-unwritten files are bounded to this many per worker
+DATA_CENTRES = {
+    "AO": "USA", "NA": "USA", "BO": "UK", "CS": "Australia", "IF": "France", "GE": "Germany", "IN": "India",
+    "JA": "Japan", "JM": "Japan", "KM": "Korea", "KO": "Korea", "ME": "Canada", "NM": "China", "HZ": "China",
+    "PL": "Poland", "VL": "Russia",
+}
+
+TRACKING_DDL = """
+CREATE TABLE IF NOT EXISTS ingested_files (
+    path TEXT PRIMARY KEY, size INTEGER, mtime REAL, profiles INTEGER, ingested REAL
+);
+CREATE TABLE IF NOT EXISTS ingested_profiles (
+    float_id INTEGER NOT NULL, cycle_number INTEGER NOT NULL, first_rowid INTEGER, last_rowid INTEGER,
+    source_file TEXT, PRIMARY KEY (float_id, cycle_number)
+);
+"""
+
+
+# --------------------------
+# NetCDF parsing (runs in worker processes)
+# --------------------------
+def _strings(ds, name, n_prof):
+    if name not in ds.variables:
+        return [""] * n_prof
+    values = netCDF4.chartostring(ds.variables[name][:])
+    return [str(v).strip() for v in np.atleast_1d(values)]
+
+
+def _measured(ds, name, data_modes):
+    """Level values with fill values and bad QC as NaN; adjusted values for A/D-mode profiles."""
+    raw = np.ma.filled(ds.variables[name][:].astype(np.float64), np.nan)
+    qc_name = f"{name}_QC"
+    if qc_name in ds.variables:
+        raw[np.isin(np.ma.filled(ds.variables[qc_name][:], b" "), BAD_QC)] = np.nan
+    adjusted_name = f"{name}_ADJUSTED"
+    if adjusted_name in ds.variables:
+        adjusted = np.ma.filled(ds.variables[adjusted_name][:].astype(np.float64), np.nan)
+        adjusted_qc = f"{adjusted_name}_QC"
+        if adjusted_qc in ds.variables:
+            adjusted[np.isin(np.ma.filled(ds.variables[adjusted_qc][:], b" "), BAD_QC)] = np.nan
+        use_adjusted = np.isin(np.array(data_modes), ["A", "D"])
+        raw[use_adjusted] = adjusted[use_adjusted]
+    return raw
+
+
+def parse_profile_file(path):
+    """Returns {"path", "size", "mtime", "profiles": [...]} (or "error"); one entry per ascending profile."""
+    stat = os.stat(path)
+    result = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "profiles": []}
+    try:
+        with netCDF4.Dataset(path) as ds:
+            n_prof = len(ds.dimensions["N_PROF"])
+            platforms = _strings(ds, "PLATFORM_NUMBER", n_prof)
+            data_modes = [m[:1] or "R" for m in _strings(ds, "DATA_MODE", n_prof)] if "DATA_MODE" in ds.variables \
+                else ["R"] * n_prof
+            if len(data_modes) == 1 and n_prof > 1:
+                data_modes = list(data_modes[0].ljust(n_prof, "R"))
+            directions = _strings(ds, "DIRECTION", n_prof)
+            if len(directions) == 1 and n_prof > 1:
+                directions = list(directions[0].ljust(n_prof, "A"))
+            platform_types = _strings(ds, "PLATFORM_TYPE", n_prof)
+            centres = _strings(ds, "DATA_CENTRE", n_prof)
+            cycles = np.ma.filled(ds.variables["CYCLE_NUMBER"][:], -1)
+            juld = np.ma.filled(ds.variables["JULD"][:].astype(np.float64), np.nan)
+            lats = np.ma.filled(ds.variables["LATITUDE"][:].astype(np.float64), np.nan)
+            lons = np.ma.filled(ds.variables["LONGITUDE"][:].astype(np.float64), np.nan)
+            pres = _measured(ds, "PRES", data_modes)
+            temp = _measured(ds, "TEMP", data_modes) if "TEMP" in ds.variables else np.full_like(pres, np.nan)
+            psal = _measured(ds, "PSAL", data_modes) if "PSAL" in ds.variables else np.full_like(pres, np.nan)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    for i in range(n_prof):
+        if (directions[i] if i < len(directions) else "A") == "D" or cycles[i] < 0 or np.isnan(juld[i]):
+            continue
+        try:
+            float_id = int(platforms[i])
+        except ValueError:
+            continue
+        keep = ~np.isnan(pres[i])
+        if not keep.any():
+            continue
+        epoch = int(round((juld[i] - JULD_EPOCH_OFFSET_DAYS) * 86400))
+        iso = str(np.datetime64(epoch, "s")).replace("T", " ")
+        lat = None if np.isnan(lats[i]) else round(float(lats[i]), 5)
+        lon = None if np.isnan(lons[i]) else round(float(lons[i]), 5)
+        cycle = int(cycles[i])
+        profile_id = float_id * 10000 + cycle
+        rows = [
+            (profile_id, float_id, cycle, lat, lon, iso, epoch, p, None if t != t else t, None if s != s else s)
+            for p, t, s in zip(pres[i][keep].tolist(), temp[i][keep].tolist(), psal[i][keep].tolist())
+        ]
+        result["profiles"].append({
+            "float_id": float_id,
+            "cycle_number": cycle,
+            "date": iso,
+            "platform_type": platform_types[i] if i < len(platform_types) else "",
+            "country": DATA_CENTRES.get(centres[i] if i < len(centres) else "", ""),
+            "rows": rows,
+        })
+    return result
+
+
+# --------------------------
+# Writer (main process)
+# --------------------------
+def find_files(inputs):
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                files.extend(os.path.join(root, n) for n in names if n.endswith(".nc"))
+        elif item.endswith(".nc"):
+            files.append(item)
+    return sorted(os.path.abspath(f) for f in files)
+
+
+def delayed_mode(path):
+    """True for delayed-mode profile files (D1900121_001.nc, BD..., SD...), whose data supersedes real-time R files."""
+    return os.path.basename(path).lstrip("BMS")[:1] == "D"
+
+
+def pending_files(conn, files):
+    """Files that are new or whose size / mtime changed since they were ingested."""
+    seen = {path: (size, mtime) for path, size, mtime in conn.execute("SELECT path, size, mtime FROM ingested_files")}
+    pending = []
+    for path in files:
+        stat = os.stat(path)
+        if seen.get(path) != (stat.st_size, stat.st_mtime):
+            pending.append(path)
+    return pending
+
+
+class Ingestor:
+    """Batches parsed profiles into large transactions and tracks what has been loaded."""
+
+    def __init__(self, conn, batch_rows=200000):
+        self.conn = conn
+        self.batch_rows = batch_rows
+        self.insert = (f"INSERT INTO argo_profiles ({', '.join(PROFILE_COLUMNS)}) "
+                       f"VALUES ({', '.join('?' for _ in PROFILE_COLUMNS)})")
+        self._results = []
+        self._pending_rows = 0
+        self.rows = 0
+        self.profiles = 0
+        self.replaced = 0
+        self.touched_floats = set()
+
+    def add(self, result):
+        self._results.append(result)
+        self._pending_rows += sum(len(p["rows"]) for p in result["profiles"])
+        if self._pending_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._results:
+            return
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            for result in self._results:
+                for profile in result["profiles"]:
+                    self._write_profile(profile, result["path"])
+                conn.execute(
+                    "INSERT OR REPLACE INTO ingested_files (path, size, mtime, profiles, ingested) VALUES (?, ?, ?, ?, ?)",
+                    (result["path"], result["size"], result["mtime"], len(result["profiles"]), time.time()),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"  committed {self.rows} rows / {self.profiles} profiles ({self.replaced} replaced)...")
+        self._results, self._pending_rows = [], 0
+
+    def _write_profile(self, profile, path):
+        conn = self.conn
+        key = (profile["float_id"], profile["cycle_number"])
+        previous = conn.execute(
+            "SELECT first_rowid, last_rowid, source_file FROM ingested_profiles WHERE float_id = ? AND cycle_number = ?",
+            key,
+        ).fetchone()
+        if previous:
+            # Files arrive in completion order, so a real-time file may come after the delayed-mode one.
+            if delayed_mode(previous[2]) and not delayed_mode(path):
+                return
+            # Rowid ranges make the replacement a primary-key range delete, even with indexes dropped.
+            conn.execute("DELETE FROM argo_profiles WHERE rowid BETWEEN ? AND ?", previous[:2])
+            self.replaced += 1
+        first = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM argo_profiles").fetchone()[0] + 1
+        conn.executemany(self.insert, profile["rows"])
+        last = first + len(profile["rows"]) - 1
+        conn.execute(
+            "INSERT OR REPLACE INTO ingested_profiles VALUES (?, ?, ?, ?, ?)", key + (first, last, path)
+        )
+        conn.execute(
+            "INSERT INTO argo_metadata (float_id, platform_type, country, deployment_date) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (float_id) DO UPDATE SET "
+            "platform_type = COALESCE(NULLIF(excluded.platform_type, ''), platform_type), "
+            "country = COALESCE(NULLIF(excluded.country, ''), country), "
+            "deployment_date = MIN(COALESCE(deployment_date, excluded.deployment_date), excluded.deployment_date)",
+            (profile["float_id"], profile["platform_type"], profile["country"], profile["date"][:10]),
+        )
+        self.rows += len(profile["rows"])
+        self.profiles += 1
+        self.touched_floats.add(profile["float_id"])
+
+
+# --------------------------
+# Float summaries, embeddings and the FAISS index
+# --------------------------
+def ocean_name(lat, lon):
+    if lat is None or lon is None:
+        return "the global ocean"
+    if lat < -50:
+        return "the Southern Ocean"
+    if 20 <= lon <= 147 and lat < 30:
+        return "the Indian Ocean"
+    if lon > 147 or lon < -70:
+        return "the Pacific Ocean"
+    return "the Atlantic Ocean"
+
+
+def float_summaries(conn, float_ids):
+    """{float_id: summary} in the same style as the original metadata_map summaries."""
+    summaries = {}
+    ids = sorted(float_ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        for float_id, first, last, lat, lon in conn.execute(
+            "SELECT float_id, MIN(date), MAX(date), AVG(latitude), AVG(longitude) FROM argo_profiles "
+            f"WHERE float_id IN ({', '.join('?' for _ in chunk)}) GROUP BY float_id", chunk
+        ):
+            where = f"Mean location: {lat:.2f}N, {lon:.2f}E." if lat is not None and lon is not None else ""
+            summaries[float_id] = (
+                f"ARGO float {float_id} in {ocean_name(lat, lon)}. Data from {first} to {last}. {where} "
+                "Measures temperature, salinity, and pressure."
+            )
+    return summaries
+
+
+def update_vector_index(conn, float_ids, faiss_path, meta_path, model_name=EMBEDDING_MODEL_NAME, embed_all=False):
+    """Re-embeds the given floats (every float if the store is empty, uses another model or embed_all)
+    and applies them to the vector index incrementally. Returns the number of floats embedded."""
+    try:
+        from sentence_transformers import SentenceTransformer
+        from vector_index import VectorStore
+    except Exception as e:
+        print(f"Skipping embeddings ({e}).")
+        return 0
+    store = VectorStore(faiss_path, meta_path)
+    try:
+        if embed_all or store.count() == 0 or store.model != model_name:
+            float_ids = {row[0] for row in conn.execute("SELECT float_id FROM argo_metadata")}
+        summaries = float_summaries(conn, float_ids)
+        if not summaries:
+            return 0
+        ids = list(summaries)
+        vectors = SentenceTransformer(model_name).encode(
+            [summaries[f] for f in ids], batch_size=64, convert_to_numpy=True
+        )
+        store.upsert(ids, [summaries[f] for f in ids], vectors, model_name)
+        return len(ids)
+    finally:
+        store.close()
+
+
+# --------------------------
+# Command line
+# --------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Ingest ARGO NetCDF profile files into SQLite.")
+    parser.add_argument("inputs", nargs="+", help="NetCDF files or directories (searched recursively).")
+    parser.add_argument("--db", default="argo_data.db")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-rows", type=int, default=200000, help="Rows per write transaction.")
+    parser.add_argument("--drop-indexes", choices=["auto", "always", "never"], default="auto")
+    parser.add_argument("--no-embeddings", action="store_true", help="Skip the vector index update.")
+    parser.add_argument("--embed-all", action="store_true", help="Re-embed every float, not only touched ones.")
+    parser.add_argument("--faiss", default="faiss_index.bin")
+    parser.add_argument("--meta", default="vector_meta.db", help="Vector metadata / embedding store.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    args = parser.parse_args()
+
+    if netCDF4 is None:
+        print("netCDF4 is not installed; run `pip install netCDF4`.")
+        return 1
+    started = time.time()
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=60.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    empty = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'argo_profiles'").fetchone() is None
+    if empty:
+        create_schema(conn, with_indexes=False)
+    elif detect_schema(conn) < SCHEMA_VERSION:
+        print(f"{args.db} uses the legacy schema; run migrate_db.py first.")
+        return 1
+    conn.executescript(TRACKING_DDL)
+
+    files = pending_files(conn, find_files(args.inputs))
+    print(f"{len(files)} new or changed NetCDF files.")
+    ingestor = Ingestor(conn, batch_rows=args.batch_rows)
+    if files:
+        empty = empty or conn.execute("SELECT 1 FROM argo_profiles LIMIT 1").fetchone() is None
+        if args.drop_indexes == "always" or (args.drop_indexes == "auto" and (empty or len(files) >= DROP_INDEX_MIN_FILES)):
+            print("Dropping indexes for the bulk load...")
+            drop_indexes(conn)
+        failed = 0
+        # imap_unordered() hands results over as workers finish them; feeding it a slice at a time keeps the
+        # parsed-but-unwritten results bounded when parsing outruns the writer.
+        step = max(1, args.workers) * FILES_IN_FLIGHT_PER_WORKER
+        with Pool(processes=args.workers) as pool:
+            for start in range(0, len(files), step):
+                for result in pool.imap_unordered(parse_profile_file, files[start:start + step], chunksize=8):
+                    if "error" in result:
+                        failed += 1
+                        print(f"  skipped {result['path']}: {result['error']}")
+                        continue
+                    ingestor.add(result)
+        ingestor.flush()
+        if failed:
+            print(f"{failed} files could not be parsed (they will be retried next run).")
+
+        if ingestor.replaced:
+            refresh_rollups(conn, rebuild=True)
+        print("Building indexes, spatial index and rollups...")
+        build_indexes(conn)
+
+    if not args.no_embeddings and (ingestor.touched_floats or args.embed_all):
+        embedded = update_vector_index(conn, ingestor.touched_floats, args.faiss, args.meta, args.model,
+                                       embed_all=args.embed_all)
+        print(f"Embedded {embedded} float summaries into {args.faiss} / {args.meta}.")
+    conn.close()
+    print(f"Ingested {ingestor.rows} rows from {ingestor.profiles} profiles ({ingestor.replaced} replaced) "
+          f"in {time.time() - started:.1f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import threading
+import time
+
+
+# --------------------------
+# Lazy, thread-safe component loading (heavy imports and files load on first use, not at import time)
+# --------------------------
+class LazyComponent:
+    """Runs `loader` once, on first get(), and remembers the result.
+
+    Concurrent callers block on the same load instead of loading twice. load_ms records how long it took.
+    If the loader raises, get() returns `default` and the load is retried once retry_seconds have passed.
+    Request handlers use get_if_ready(), which never blocks: it starts the load in the background instead.
+    """
+
+    def __init__(self, name, loader, default=None, required=False, retry_seconds=10.0):
+        self.name = name
+        self.required = required
+        self.retry_seconds = retry_seconds
+        self._loader = loader
+        self._default = default
+        self._value = default
+        self._loaded = False
+        self._loading = False
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()  # guards _loading, never held during a load
+        self.load_ms = None
+        self.error = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _retry_due(self):
+        return self._failed_at is None or time.monotonic() - self._failed_at >= self.retry_seconds
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded and self._retry_due():
+                start = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                    self._loaded, self._failed_at, self.error = True, None, None
+                except Exception as e:
+                    print(f"Warning: Could not load {self.name}: {e}")
+                    self._value = self._default
+                    self._failed_at, self.error = time.monotonic(), str(e)
+                self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+                if self._loaded:
+                    print(f"Loaded {self.name} in {self.load_ms} ms.")
+        return self._value
+
+    def get_if_ready(self, default=None):
+        """The value if loaded, else `default` (after starting a background load if none is running)."""
+        if self._loaded:
+            return self._value
+        with self._state_lock:
+            if self._loading or not self._retry_due():
+                return default
+            self._loading = True
+        threading.Thread(target=self._load_in_background, name=f"load-{self.name}", daemon=True).start()
+        return default
+
+    def _load_in_background(self):
+        try:
+            self.get()
+        finally:
+            with self._state_lock:
+                self._loading = False
+
+    def status(self):
+        return {"loaded": self._loaded, "load_ms": self.load_ms, "error": self.error, "required": self.required}
+
+
+class Components:
+    """Registry of lazy components with readiness reporting and optional background warm-up."""
+
+    def __init__(self):
+        self._components = {}
+        self.warm_up_thread = None
+
+    def add(self, name, loader, default=None, required=False, retry_seconds=10.0):
+        self._components[name] = LazyComponent(name, loader, default=default, required=required,
+                                               retry_seconds=retry_seconds)
+        return self._components[name]
+
+    def get(self, name):
+        """Blocking: loads the component if needed. For warm-up, loaders and /readyz, not request handlers."""
+        return self._components[name].get()
+
+    def get_if_ready(self, name, default=None):
+        return self._components[name].get_if_ready(default)
+
+    def loaded(self, name):
+        return self._components[name].loaded
+
+    def load(self, names=None):
+        """Loads the named components (all, in registration order, by default) and returns status()."""
+        for name in names or list(self._components):
+            self._components[name].get()
+        return self.status()
+
+    def warm_up(self, names=None):
+        """Starts loading components on a daemon thread so the first request does not pay for it."""
+        if self.warm_up_thread is None or not self.warm_up_thread.is_alive():
+            self.warm_up_thread = threading.Thread(target=self.load, args=(names,), name="warm-up", daemon=True)
+            self.warm_up_thread.start()
+        return self.warm_up_thread
+
+    def ready(self, load=False):
+        """True once every required component has loaded; optional ones are reported by status(), not awaited.
+
+        With `load`, loads the required components first (blocking, retrying a failed load when it is due).
+        """
+        required = [c for c in self._components.values() if c.required]
+        if load:
+            for c in required:
+                c.get()
+        return all(c.loaded for c in required)
+
+    def warming_up(self):
+        return self.warm_up_thread is not None and self.warm_up_thread.is_alive()
+
+    def status(self):
+        return {name: c.status() for name, c in self._components.items()}
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from types import SimpleNamespace
+
+
+def content_hash(value):
+    """Stable short digest for prompt inputs (results, context, ...)."""
+    if not isinstance(value, (str, bytes)):
+        value = repr(value)
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return hashlib.sha256(value).hexdigest()[:32]
+
+
+def cache_key(template, query, result_hash="", language_code=""):
+    """Content address for one LLM call: (prompt template, query, result hash, language)."""
+    normalized_query = " ".join((query or "").split())
+    raw = "\x00".join([template, normalized_query, result_hash or "", language_code or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# --------------------------
+# LLM response cache (TTL + LRU in memory, optional persistent SQLite tier)
+# --------------------------
+class LLMCache:
+    """Memoizes LLM responses by content address so repeat prompts never hit the API."""
+
+    def __init__(self, ttl_seconds=86400, max_entries=1024, disk_path=None, max_disk_entries=50000):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_path = disk_path
+        self._open_disk(disk_path)
+
+    def _open_disk(self, disk_path):
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute("PRAGMA journal_mode=WAL")
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._disk.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache(created)")
+                self._disk.commit()
+            except Exception as e:
+                print(f"Warning: Could not open LLM cache file {disk_path}: {e}")
+                self._disk = None
+
+    def after_fork(self):
+        """Reopens the disk tier in a forked worker (SQLite handles must not cross fork())."""
+        self._disk = None
+        self._open_disk(self.disk_path)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                text, created = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return text
+                del self._entries[key]
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT text, created FROM llm_cache WHERE key = ? AND created >= ?", (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        now = time.time()
+        with self._lock:
+            self._remember(key, text, now)
+            if self._disk is not None:
+                try:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, text, created) VALUES (?, ?, ?)", (key, text, now)
+                    )
+                    self._disk_writes += 1
+                    if self._disk_writes % 100 == 0:
+                        self._evict_disk(now)
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    print(f"Warning: Could not persist LLM response: {e}")
+
+    def _remember(self, key, text, created):
+        self._entries[key] = (text, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._disk.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        self._disk.execute(
+            "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# --------------------------
+# Model backends ("gemini" or a deterministic local "stub")
+# --------------------------
+class StubResponse:
+    def __init__(self, text, total_tokens=None):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(total_token_count=total_tokens)
+
+
+class StubModel:
+    """Offline stand-in for GenerativeModel: same generate_content() shape, deterministic output.
+
+    SQL prompts are answered with sql_fn(question, plot) (the heuristic generator; plot is True when the
+    prompt asks for plottable profile rows), everything else with a canned summary. latency_ms simulates
+    provider round-trip time for load tests.
+    """
+
+    _QUESTION_RE = re.compile(r'User question:\s*"""(.*?)"""', re.S)
+    _LANG_RE = re.compile(r"ISO code:\s*([\w-]+)")
+    _PLOT_RE = re.compile(r"downsamples every profile for plotting")
+
+    def __init__(self, sql_fn=None, latency_ms=0):
+        self.sql_fn = sql_fn
+        self.latency = latency_ms / 1000.0
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        question = self._QUESTION_RE.search(prompt)
+        if question:
+            plot = bool(self._PLOT_RE.search(prompt))
+            sql = self.sql_fn(question.group(1).strip(), plot) if self.sql_fn else "SELECT 1"
+            return StubResponse(sql)
+        lang = self._LANG_RE.search(prompt)
+        lang = lang.group(1) if lang else "en"
+        return StubResponse(f"[stub:{lang}] Summary of the returned rows (digest {content_hash(prompt)[:8]}).")
+
+
+class LLMHTTPError(Exception):
+    """Non-2xx reply from an HTTP model backend; code and Retry-After mirror the provider's errors."""
+
+    def __init__(self, code, message, retry_after=None):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.retry_after = retry_after
+
+
+class HttpModel:
+    """generate_content() against a JSON endpoint (POST {"prompt"} -> {"text", "total_tokens"}).
+
+    Used with fake_llm_server.py to load-test rate limiting, retries and the circuit breaker.
+    """
+
+    def __init__(self, url, timeout=30.0):
+        self.url = url
+        self.timeout = timeout
+
+    def generate_content(self, prompt):
+        body = json.dumps({"prompt": prompt}).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                payload = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After")
+            raise LLMHTTPError(e.code, e.read().decode("utf-8", "replace")[:200],
+                               float(retry_after) if retry_after else None) from None
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"LLM endpoint unreachable: {e.reason}") from None
+        return StubResponse(payload["text"], payload.get("total_tokens"))
+
+
+def load_model(backend, api_key=None, model_name="gemini-2.5-flash", sql_fn=None):
+    """Returns an object exposing generate_content(prompt), or None when no backend is usable."""
+    if backend == "stub":
+        print("Using local stub LLM backend.")
+        return StubModel(sql_fn=sql_fn, latency_ms=int(os.getenv("LLM_STUB_LATENCY_MS", 0)))
+    if backend == "http":
+        url = os.getenv("LLM_HTTP_URL", "http://127.0.0.1:8090/generate")
+        print(f"Using HTTP LLM backend at {url}.")
+        return HttpModel(url)
+    if not api_key:
+        print("Warning: GEMINI_API_KEY not set. LLM will be disabled.")
+        return None
+    try:
+        import google.generativeai as genai  # deferred: the SDK is slow to import
+    except Exception:
+        print("google.generativeai library not available; LLM disabled.")
+        return None
+    try:
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(model_name)
+        print(f"Gemini model {model_name} configured successfully.")
+        return model
+    except Exception as e:
+        print(f"Warning initializing Gemini model: {e}")
+        return None
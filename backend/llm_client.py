@@ -0,0 +1,255 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# --------------------------
+# Shared LLM client: every generate_content() call in the app goes through one of these per worker.
+#   - token buckets for requests/minute and tokens/minute (the provider's quota, 0 = unlimited)
+#   - an adaptive concurrency limit (AIMD: halved on a 429, +1/limit per success)
+#   - priority queueing: waiting SQL generations are admitted before waiting summaries
+#   - jittered exponential backoff on 429s and transient errors (honouring Retry-After)
+#   - a circuit breaker that fails calls immediately after repeated 429s, so callers fall back at once
+# --------------------------
+PRIORITY_SQL = 0
+PRIORITY_SUMMARY = 1
+
+
+class LLMUnavailable(Exception):
+    """The call was not sent: the provider is saturated or the circuit breaker is open."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMSaturated(LLMUnavailable):
+    """No request/token budget or concurrency slot frees up within the caller's max wait."""
+
+
+class LLMCircuitOpen(LLMUnavailable):
+    """Recent calls kept hitting rate limits or failing; calls are refused until the cooldown ends."""
+
+
+RATE_LIMITED_TYPES = ("ResourceExhausted", "TooManyRequests")
+TRANSIENT_TYPES = ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError")
+RATE_LIMITED_GRPC = ("RESOURCE_EXHAUSTED",)
+TRANSIENT_GRPC = ("UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL")
+
+
+def classify_error(e):
+    """'rate_limited', 'transient' (worth retrying) or 'fatal' for an exception from generate_content().
+
+    Decided by the HTTP status / gRPC code or the exception type only: message text (a prompt echoed back,
+    "429 rows") says nothing reliable about the provider's state.
+    """
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    code = code() if callable(code) else code
+    grpc_name = getattr(code, "name", None)  # grpc.StatusCode
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        code = None
+    name = type(e).__name__
+    if code == 429 or name in RATE_LIMITED_TYPES or grpc_name in RATE_LIMITED_GRPC:
+        return "rate_limited"
+    if (code is not None and code >= 500) or isinstance(e, (ConnectionError, TimeoutError)) or \
+            name in TRANSIENT_TYPES or grpc_name in TRANSIENT_GRPC:
+        return "transient"
+    return "fatal"
+
+
+def estimate_tokens(prompt, output_tokens=0):
+    """Rough token count (~4 characters per token) for budgeting before the provider reports usage."""
+    return len(prompt) // 4 + 1 + output_tokens
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second up to one minute's worth; 0 disables the limit."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` is available (amounts over the capacity wait for a full bucket)."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount, now):
+        if self.capacity:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Charges (or refunds, if negative) the difference once actual usage is known."""
+        if self.capacity:
+            self.level = min(self.capacity, self.level - amount)
+
+
+class LLMClient:
+    """Wraps a model exposing generate_content(prompt) with rate limits, retries and a circuit breaker.
+
+    on_trip(cooldown, failures) is called (outside the client's lock) each time the breaker opens.
+    """
+
+    def __init__(self, model, requests_per_minute=0, tokens_per_minute=0, max_concurrency=8, max_retries=3,
+                 backoff_base=0.5, backoff_max=20.0, breaker_threshold=5, breaker_cooldown=30.0, output_tokens=256,
+                 on_trip=None):
+        self.model = model
+        self.on_trip = on_trip
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.output_tokens = output_tokens
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._limit = float(max_concurrency)
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._waiters = []  # heap of (priority, seq): only the head may take a slot
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._failures = 0  # consecutive rate-limited/transient outcomes
+        self._open_until = 0.0
+        self._probing = False  # half-open: one call is testing the provider
+        self._stats = {"calls": 0, "ok": 0, "rate_limited": 0, "transient": 0, "fatal": 0, "retries": 0,
+                       "saturated": 0, "circuit_open": 0, "breaker_trips": 0}
+
+    # --- circuit breaker ---
+    def _check_breaker(self, now):
+        if self._open_until == 0.0:
+            return
+        if now < self._open_until or self._probing:
+            self._stats["circuit_open"] += 1
+            raise LLMCircuitOpen("LLM circuit breaker open after repeated rate limits/errors",
+                                 retry_after=max(0.0, self._open_until - now))
+        self._probing = True
+
+    def _trip(self, now):
+        """Opens (or re-opens) the breaker; True if it was closed or half-open, i.e. this is a new trip."""
+        tripped = self._open_until == 0.0 or self._probing
+        if tripped:
+            self._stats["breaker_trips"] += 1
+        self._open_until = now + self.breaker_cooldown
+        self._probing = False
+        return tripped
+
+    # --- admission ---
+    def _acquire(self, priority, tokens, deadline):
+        with self._cond:
+            now = time.monotonic()
+            self._check_breaker(now)
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._waiters[0] == entry and self._in_flight < max(1, int(self._limit)):
+                        wait = max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+                        if wait == 0:
+                            self._requests.take(1, now)
+                            self._tokens.take(tokens, now)
+                            self._in_flight += 1
+                            return
+                    remaining = deadline - now
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        self._stats["saturated"] += 1
+                        if self._probing and self._in_flight == 0:
+                            self._probing = False  # the probe never went out; let the next call try
+                        raise LLMSaturated(f"LLM budget exhausted (next slot in {wait or remaining:.1f}s)",
+                                           retry_after=wait)
+                    self._cond.wait(min(remaining, wait) if wait else remaining)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def _release(self, outcome, tokens_used=0):
+        tripped = False
+        with self._cond:
+            now = time.monotonic()
+            self._in_flight -= 1
+            self._stats[outcome] += 1
+            self._tokens.adjust(tokens_used)
+            if outcome == "ok":
+                self._failures = 0
+                self._open_until = 0.0
+                self._probing = False
+                self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+            elif outcome in ("rate_limited", "transient"):
+                self._failures += 1
+                if outcome == "rate_limited" and now - self._last_decrease > 1.0:
+                    # One burst of 429s halves the limit once, not once per failed call.
+                    self._limit = max(1.0, self._limit / 2)
+                    self._last_decrease = now
+                if self._probing or self._failures >= self.breaker_threshold:
+                    tripped = self._trip(now)
+                    failures = self._failures
+            elif self._probing:
+                self._probing = False
+            self._cond.notify_all()
+        if tripped and self.on_trip is not None:
+            self.on_trip(self.breaker_cooldown, failures)
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than the provider's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, float(retry_after or 0))
+
+    def generate(self, prompt, priority=PRIORITY_SUMMARY, max_wait=20.0):
+        """generate_content(prompt) within max_wait seconds of queueing and backoff.
+
+        Raises LLMUnavailable if the call cannot be sent in time (or the breaker is open), otherwise the
+        provider's last error once retries are exhausted.
+        """
+        deadline = time.monotonic() + max_wait
+        estimate = estimate_tokens(prompt, self.output_tokens)
+        attempt = 0
+        while True:
+            self._acquire(priority, estimate, deadline)
+            with self._cond:
+                self._stats["calls"] += 1
+            try:
+                resp = self.model.generate_content(prompt)
+            except Exception as e:
+                outcome = classify_error(e)
+                self._release(outcome)
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                if outcome == "fatal" or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                with self._cond:
+                    self._stats["retries"] += 1
+                time.sleep(delay)
+                continue
+            usage = getattr(getattr(resp, "usage_metadata", None), "total_token_count", None)
+            self._release("ok", (usage - estimate) if usage else 0)
+            return resp
+
+    def generate_content(self, prompt):
+        return self.generate(prompt)
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            if self._open_until == 0.0:
+                breaker = "closed"
+            else:
+                breaker = "half_open" if self._probing or now >= self._open_until else "open"
+            return dict(self._stats, concurrency_limit=round(self._limit, 2), in_flight=self._in_flight,
+                        queued=len(self._waiters), breaker=breaker)
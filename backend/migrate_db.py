@@ -0,0 +1,61 @@
+"""Rewrites a legacy argo_data.db (text float_id like b'1900121 ') into the normalized v2 schema.
+
+Usage:
+    python migrate_db.py [argo_data.db] [--out migrated.db] [--keep-backup]
+
+Without --out the database is replaced in place (the original is kept as <db>.legacy.bak
+when --keep-backup is given). Running it on an already migrated database only adds the
+R*Tree spatial index if it is missing and brings the rollup tables up to date.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from rollups import refresh_rollups
+from schema import migrate
+from spatial import ensure_spatial_index, is_sqlite_rtree_available
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate argo_data.db to the normalized schema.")
+    parser.add_argument("db", nargs="?", default="argo_data.db")
+    parser.add_argument("--out", help="Write the migrated database here instead of replacing the input.")
+    parser.add_argument("--keep-backup", action="store_true", help="Keep the legacy file as <db>.legacy.bak.")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Database not found: {args.db}")
+        return 1
+
+    target = args.out or args.db + ".migrating"
+    started = time.time()
+    try:
+        profiles, floats = migrate(args.db, target, batch_size=args.batch_size)
+    except ValueError as e:
+        print(e)
+        conn = sqlite3.connect(args.db)
+        if is_sqlite_rtree_available():
+            ensure_spatial_index(conn)
+            print("Spatial index (argo_positions) is in place.")
+        print(f"Rollups are up to date ({refresh_rollups(conn)} new profile rows folded in).")
+        conn.close()
+        return 0
+
+    if not args.out:
+        if args.keep_backup:
+            os.replace(args.db, args.db + ".legacy.bak")
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        os.replace(target, args.db)
+        target = args.db
+
+    print(f"Migrated {profiles} profile rows and {floats} floats into {target} in {time.time() - started:.1f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import re
+from functools import lru_cache
+
+from rollups import rollup_query, rollup_stats
+from schema import normalize_date
+from spatial import box_predicate
+
+# --------------------------
+# Heuristic NL -> SQL compiler
+#   1. plan_query(): precompiled patterns turn the question into a QueryPlan (no SQL yet)
+#   2. compile_plan(): the plan's *shape* selects a fixed, parameterized SQL template (memoized);
+#      the extracted numbers/dates travel separately as bound parameters.
+# Identical shapes produce identical SQL text, so sqlite3's per-connection statement cache
+# (ConnectionPool's cached_statements) reuses the prepared statement instead of re-planning.
+# Aggregates whose filters line up with a rollup table (rollups.py) are answered from it instead.
+# --------------------------
+PROFILE_COLUMNS = ("temperature", "salinity", "pressure", "date", "latitude", "longitude", "cycle_number",
+                   "profile_id", "float_id")
+LOCATION_COLUMNS = ("float_id", "date", "latitude", "longitude", "pressure", "temperature", "salinity")
+DEFAULT_COLUMNS = ("float_id", "date", "pressure", "temperature", "salinity", "latitude", "longitude")
+PLOT_COLUMNS = ("profile_id", "float_id", "pressure")  # always selected for plot (profile resampling) queries
+AGG_FUNCTIONS = {"avg": "AVG", "average": "AVG", "mean": "AVG", "max": "MAX", "min": "MIN", "count": "COUNT"}
+AGG_ALIASES = {"AVG": "avg", "MAX": "max", "MIN": "min", "COUNT": "count"}
+NEARBY_TOLERANCE = 0.5
+DEFAULT_LIMIT = 100
+
+_COLUMN_RES = [(col, re.compile(rf"\b{col}\b")) for col in PROFILE_COLUMNS]
+_LAT_RE = re.compile(r"(?:lat|latitude)\s*[:=]?\s*(-?\d+\.?\d*)")
+_LON_RE = re.compile(r"(?:lon|longitude)\s*[:=]?\s*(-?\d+\.?\d*)")
+_FLOAT_ID_RE = re.compile(r"(?:float\s*(?:id)?\s*[:#]?\s*|float\s*)\s*(\d{1,10})\b")
+_LAT_RANGE_RE = re.compile(r"latitude\s+between\s+(-?\d+\.?\d*)\s+and\s+(-?\d+\.?\d*)")
+_LON_RANGE_RE = re.compile(r"longitude\s+between\s+(-?\d+\.?\d*)\s+and\s+(-?\d+\.?\d*)")
+_DATE_RANGE_RE = re.compile(r"(\d{4}[-/]\d{1,2}[-/]\d{1,2}).(?:to|and|through).(\d{4}[-/]\d{1,2}[-/]\d{1,2})")
+_YEAR_RE = re.compile(r"\b(?:in|during|for)\s+((?:19|20)\d{2})\b")
+_AGG_RE = re.compile(r"\b(avg|average|mean|max|min|count)\b\s+of\s+(\w+)")
+_LIMIT_RE = re.compile(r"\blimit\s+(\d{1,4})\b")
+
+
+class QueryPlan:
+    """Structured form of a heuristic question: what to select, how to filter, order and limit."""
+
+    def __init__(self):
+        self.columns = ()
+        self.aggregate = None   # (SQL function, column)
+        self.filters = []       # [(filter kind, SQL predicate template, params)]
+        self.order = None       # ("distance", (lat, lon)) | ("latest", ())
+        self.limit = DEFAULT_LIMIT
+        self.joined = True      # legacy schema keeps the argo_metadata join
+        self.use_rollups = False
+
+    def shape(self):
+        """Everything that determines the SQL text (but none of the bound values)."""
+        return (self.columns, self.aggregate, tuple(f[1] for f in self.filters),
+                self.order[0] if self.order else None, self.joined)
+
+    def params(self):
+        values = [v for _, _, params in self.filters for v in params]
+        if self.order:
+            values.extend(self.order[1])
+        values.append(self.limit)
+        return tuple(values)
+
+
+def plan_query(query, legacy=False, has_spatial=False, has_rollups=False, for_plot=False, default_limit=DEFAULT_LIMIT):
+    q = query.lower()
+    plan = QueryPlan()
+    plan.joined = legacy
+    plan.use_rollups = has_rollups and not legacy
+    plan.limit = default_limit
+
+    is_location_query = "latitude" in q or "longitude" in q or "location" in q or "float id" in q
+    if is_location_query:
+        plan.columns = LOCATION_COLUMNS
+    else:
+        cols = [col for col, pattern in _COLUMN_RES if pattern.search(q)]
+        plan.columns = tuple(cols) if cols else DEFAULT_COLUMNS
+    if for_plot:
+        plan.columns += PLOT_COLUMNS
+    plan.columns = tuple(sorted(set(plan.columns)))
+
+    lat_m, lon_m = _LAT_RE.search(q), _LON_RE.search(q)
+    point = None
+    if lat_m and lon_m:
+        point = (float(lat_m.group(1)), float(lon_m.group(1)))
+        if has_spatial:
+            clauses, params = box_predicate(point[0], point[1], NEARBY_TOLERANCE)
+            plan.filters.append(("box", f"argo_profiles.rowid IN (SELECT id FROM argo_positions WHERE {clauses})",
+                                 tuple(params)))
+        else:
+            plan.filters.append(("lat", "latitude BETWEEN ? AND ?",
+                                 (point[0] - NEARBY_TOLERANCE, point[0] + NEARBY_TOLERANCE)))
+            plan.filters.append(("lon", "longitude BETWEEN ? AND ?",
+                                 (point[1] - NEARBY_TOLERANCE, point[1] + NEARBY_TOLERANCE)))
+
+    m_float_id = _FLOAT_ID_RE.search(q)
+    if m_float_id:
+        float_id = int(m_float_id.group(1))
+        plan.filters.append(("float_id", "float_id = ?", (f"b'{float_id} '" if legacy else float_id,)))
+
+    if "equator" in q:
+        plan.filters.append(("lat", "latitude BETWEEN ? AND ?", (-1.0, 1.0)))
+    m = _LAT_RANGE_RE.search(q)
+    if m:
+        plan.filters.append(("lat", "latitude BETWEEN ? AND ?", (float(m.group(1)), float(m.group(2)))))
+    m = _LON_RANGE_RE.search(q)
+    if m:
+        plan.filters.append(("lon", "longitude BETWEEN ? AND ?", (float(m.group(1)), float(m.group(2)))))
+    m = _DATE_RANGE_RE.search(q)
+    year = _YEAR_RE.search(q) if not m else None
+    if m or year:
+        start, end = (m.group(1), m.group(2)) if m else (f"{year.group(1)}-01-01", f"{year.group(1)}-12-31")
+        if not legacy:
+            # v2 stores 'YYYY-MM-DD HH:MM:SS'; make the end date inclusive of the whole day.
+            start = normalize_date(start)[0] or start
+            end = (normalize_date(end)[0] or end)[:10] + " 23:59:59"
+        plan.filters.append(("date", "date BETWEEN ? AND ?", (start, end)))
+
+    m = _AGG_RE.search(q)
+    if m and m.group(2) in PROFILE_COLUMNS:
+        plan.aggregate = (AGG_FUNCTIONS[m.group(1)], m.group(2))
+
+    m = _LIMIT_RE.search(q)
+    if m:
+        plan.limit = int(m.group(1))
+
+    if m_float_id and not plan.aggregate and is_location_query:
+        plan.order = ("latest", ())
+        plan.limit = 1
+    if point and not plan.aggregate:
+        plan.order = ("distance", point)
+    return plan
+
+
+@lru_cache(maxsize=256)
+def _render(shape):
+    columns, aggregate, predicates, order, joined = shape
+    base_from = "argo_profiles JOIN argo_metadata USING(float_id)" if joined else "argo_profiles"
+    if aggregate:
+        func, col = aggregate
+        select = f"{func}({col}) as {AGG_ALIASES[func]}_{col}"
+    else:
+        select = ", ".join(columns)
+    sql = f"SELECT {select} FROM {base_from}"
+    if predicates:
+        sql += " WHERE " + " AND ".join(predicates)
+    if order == "distance":
+        sql += " ORDER BY great_circle_km(latitude, longitude, ?, ?)"
+    elif order == "latest":
+        sql += " ORDER BY date DESC"
+    return sql + " LIMIT ?;"
+
+
+def compile_plan(plan):
+    """Returns (sql, params) for a plan; the SQL text depends only on the plan's shape."""
+    if plan.aggregate and plan.use_rollups:
+        compiled = rollup_query(plan.aggregate, plan.filters, plan.limit)
+        if compiled is not None:
+            return compiled
+    return _render(plan.shape()), plan.params()
+
+
+def compile_query(query, legacy=False, has_spatial=False, has_rollups=False, for_plot=False,
+                  default_limit=DEFAULT_LIMIT):
+    return compile_plan(plan_query(query, legacy=legacy, has_spatial=has_spatial, has_rollups=has_rollups,
+                                   for_plot=for_plot, default_limit=default_limit))
+
+
+def inline_params(sql, params):
+    """Substitutes bound values as SQL literals, for callers that need plain SQL text (e.g. the stub LLM)."""
+    parts = sql.split("?")
+    out = [parts[0]]
+    for value, part in zip(params, parts[1:]):
+        if isinstance(value, str):
+            out.append("'" + value.replace("'", "''") + "'")
+        else:
+            out.append(repr(value))
+        out.append(part)
+    return "".join(out)
+
+
+def compiler_stats():
+    info = _render.cache_info()
+    return {"templates": info.currsize, "hits": info.hits, "misses": info.misses, "rollups": rollup_stats()}
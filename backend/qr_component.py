@@ -1,30 +1,21 @@
-from flask import Flask, request, jsonify, send_file
-from qrcode import QRCode
-from io import BytesIO
-import uuid
-import json
-from datetime import datetime
+from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
+from history_store import HistoryStore
+from qr_render import QRRenderer, qr_response
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
-HISTORY_FILE = 'chat_history.json'  # JSON file for persistence
+HISTORY_FILE = 'chat_history.json'  # Legacy JSON file, imported once into HISTORY_DB_FILE
+HISTORY_DB_FILE = os.getenv('SHARE_HISTORY_DB_FILE', 'chat_history.db')  # SQLite store shared by all workers
+HISTORY_TTL_DAYS = int(os.getenv('HISTORY_TTL_DAYS', 30))
 
-# Load histories from JSON on startup
-def load_histories():
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+chat_histories = HistoryStore(HISTORY_DB_FILE, ttl_seconds=HISTORY_TTL_DAYS * 86400)
+chat_histories.import_json(HISTORY_FILE, unwrap_key='history')
 
-# Save histories to JSON
-def save_histories(histories):
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(histories, f, indent=2)
-
-chat_histories = load_histories()
+SHARE_QR_OPTIONS = {'version': 1, 'error_correction': 'M'}  # Matches the original QRCode(version=1) defaults
+qr_renderer = QRRenderer(cache_dir=os.getenv('QR_CACHE_DIR'))
 
 # POST /api/share: Generate QR for shared history
 @app.route('/api/share', methods=['POST'])
@@ -38,46 +29,37 @@ def share_endpoint():
         if not has_interaction:
             return jsonify({'error': 'No chat history to share. Please ask a question first.'}), 400
         
-        # Generate unique ID and save history
-        unique_id = str(uuid.uuid4())
-        chat_histories[unique_id] = {
-            'history': history,
-            'timestamp': datetime.now().isoformat()
-        }
-        save_histories(chat_histories)  # Persist to JSON
+        # Generate unique ID and save history (single-row insert)
+        unique_id = chat_histories.put(history)
         
         # Generate share link with correct port (5173 for Vite)
-        share_link = f"http://localhost:5173/share/{unique_id}"
-        
-        # Generate QR code
-        qr = QRCode(version=1, box_size=10, border=5)
-        qr.add_data(share_link)
-        qr.make(fit=True)
-        
-        # Create image and save to BytesIO
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
+        share_link = share_link_for(unique_id)
         
-        # Return binary image
-        return send_file(
-            buffer,
-            mimetype='image/png',
-            as_attachment=False,
-            download_name=f'share_qr_{unique_id}.png'
-        )
+        # Render (or reuse) the QR image; GET /api/qr/<id> serves the same bytes with an ETag
+        return qr_response(qr_renderer, share_link, fmt=data.get('format', 'png'),
+                           download_name=f'share_qr_{unique_id}', **SHARE_QR_OPTIONS)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def share_link_for(unique_id):
+    return f"http://localhost:5173/share/{unique_id}"
+
+# GET /api/qr/<id>: Cacheable QR for an existing share (?format=svg for vector output)
+@app.route('/api/qr/<unique_id>', methods=['GET'])
+def get_share_qr(unique_id):
+    if chat_histories.get(unique_id) is None:
+        return jsonify({'error': 'Shared chat not found.'}), 404
+    return qr_response(qr_renderer, share_link_for(unique_id), fmt=request.args.get('format', 'png'),
+                       download_name=f'share_qr_{unique_id}', **SHARE_QR_OPTIONS)
+
 # GET /share/<id>: Retrieve shared history
 @app.route('/share/<unique_id>', methods=['GET'])
 def get_shared_history(unique_id):
-    if unique_id not in chat_histories:
+    history = chat_histories.get(unique_id)
+    if history is None:
         return jsonify({'error': 'Shared chat not found.'}), 404
     
-    history = chat_histories[unique_id]['history']
     return jsonify({'history': history})
 
 if __name__ == '__main__':
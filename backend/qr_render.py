@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from flask import Response, request
+
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+# --------------------------
+# Content-addressed QR cache (same URL + options -> same bytes, rasterized once)
+# --------------------------
+class QRRenderer:
+    """Renders QR codes as PNG or SVG, caching by a hash of (data, options).
+
+    The hash doubles as the ETag. An optional cache_dir lets several workers share renders.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.hits = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(data, fmt="png", box_size=10, border=5, error_correction="L", version=None):
+        raw = f"{data}\x00{fmt}\x00{box_size}\x00{border}\x00{error_correction}\x00{version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def render(self, data, fmt="png", box_size=10, border=5, error_correction="L", version=None):
+        """Returns (image bytes, etag). Raises ValueError if the data does not fit in a QR code."""
+        fmt = fmt if fmt in MIMETYPES else "png"
+        etag = self.key(data, fmt, box_size, border, error_correction, version)
+        body = self._lookup(etag, fmt)
+        if body is not None:
+            self.hits += 1
+            return body, etag
+
+        qr = qrcode.QRCode(
+            version=version,
+            error_correction=ERROR_CORRECTION.get(error_correction, qrcode.constants.ERROR_CORRECT_L),
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(data)
+        try:
+            qr.make(fit=True)
+        except qrcode.exceptions.DataOverflowError:
+            raise ValueError("QR URL encoding failed (data too long for a version 40 code).")
+        if qr.version is None or qr.version > 40:
+            raise ValueError(f"QR URL encoding failed (required version {qr.version}).")
+
+        buf = BytesIO()
+        if fmt == "svg":
+            qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buf)
+        else:
+            qr.make_image(fill_color="black", back_color="white").save(buf)
+        body = buf.getvalue()
+        self.renders += 1
+        self._store(etag, fmt, body)
+        return body, etag
+
+    def _lookup(self, etag, fmt):
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+                return body
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{etag}.{fmt}")
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+                self._remember(etag, body)
+                return body
+            except OSError:
+                pass
+        return None
+
+    def _store(self, etag, fmt, body):
+        self._remember(etag, body)
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{etag}.{fmt}")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(body)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Warning: Could not write QR cache file {path}: {e}")
+
+    def _remember(self, etag, body):
+        with self._lock:
+            if etag in self._entries:
+                return
+            self._entries[etag] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self._bytes, "renders": self.renders, "hits": self.hits}
+
+
+def qr_response(renderer, data, fmt="png", max_age=86400, download_name=None, **options):
+    """Flask response for a cached QR image with ETag/If-None-Match (304) and Cache-Control."""
+    fmt = fmt if fmt in MIMETYPES else "png"
+    etag = renderer.key(data, fmt, **options)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+    body, etag = renderer.render(data, fmt=fmt, **options)
+    resp = Response(body, mimetype=MIMETYPES[fmt])
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = max_age
+    if download_name:
+        resp.headers["Content-Disposition"] = f"inline; filename={download_name}.{fmt}"
+    return resp.make_conditional(request)
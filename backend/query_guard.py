@@ -0,0 +1,269 @@
+import base64
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# --------------------------
+# Query cost guard for generated SQL
+#   deadline():   aborts a statement once it runs past its time budget (sqlite3 progress handler)
+#   check_plan(): EXPLAIN QUERY PLAN, rejecting full scans that also sort, and nested full scans
+#   paginate():   keyset pagination (WHERE keys sort after the last page's keys, NULLs included) with opaque cursors
+# --------------------------
+PROGRESS_STEPS = 10000  # VM instructions between deadline checks (~1 ms of work)
+SORT_STEPS = ("USE TEMP B-TREE FOR ORDER BY", "USE TEMP B-TREE FOR DISTINCT")
+MIN_PLAN_SQLITE = (3, 24, 0)  # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail) from 3.24 on
+
+# "SCAN argo_profiles" from SQLite 3.36, "SCAN TABLE argo_profiles" before that
+_LOOP_RE = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\w+)(.*)$")
+_PAGEABLE_RE = re.compile(
+    r"^\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+(?P<table>\w+)(?:\s+(?:AS\s+)?(?P<alias>(?!WHERE\b|ORDER\b|LIMIT\b)\w+))?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+ORDER\s+BY\s+(?P<order>.+?))?(?:\s+LIMIT\s+(?P<limit>\d+|\?))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_NOT_PAGEABLE_RE = re.compile(
+    r"\b(?:SELECT|GROUP|HAVING|UNION|INTERSECT|EXCEPT|DISTINCT|OFFSET|AVG|SUM|TOTAL|COUNT|MIN|MAX|GROUP_CONCAT)\b"
+    r"|\b(?:ROWID|OID|_ROWID_)\b|__key\d",
+    re.IGNORECASE,
+)
+_ORDER_TERM_RE = re.compile(r"^((?:\w+\.)?\w+)(?:\s+(ASC|DESC))?$", re.IGNORECASE)
+
+
+class QueryRejected(Exception):
+    """The query plan would scan and sort (or cross join) a large table."""
+
+
+class QueryTimeout(sqlite3.OperationalError):
+    """The statement ran past its deadline and was interrupted."""
+
+
+class CursorError(ValueError):
+    """The pagination cursor is malformed or belongs to a different query."""
+
+
+class QueryGuard:
+    """Per-statement deadlines and plan checks; tables over large_table_rows rows count as large.
+
+    Plans the guard cannot read (SQLite older than MIN_PLAN_SQLITE, or no loop it recognizes) are
+    rejected rather than assumed cheap.
+    """
+
+    def __init__(self, timeout_ms=5000, large_table_rows=500000, table_rows_ttl=300):
+        self.timeout = timeout_ms / 1000.0
+        self.large_table_rows = large_table_rows
+        self.table_rows_ttl = table_rows_ttl
+        self.plan_supported = sqlite3.sqlite_version_info >= MIN_PLAN_SQLITE
+        self._table_rows = None
+        self._table_rows_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"checked": 0, "rejected": 0, "unparsed": 0, "timeouts": 0}
+        if not self.plan_supported:
+            print(f"Warning: SQLite {sqlite3.sqlite_version} query plans cannot be checked (needs "
+                  f"{'.'.join(map(str, MIN_PLAN_SQLITE))}+); generated SQL will be rejected.")
+
+    @contextmanager
+    def deadline(self, conn, timeout=None):
+        """Interrupts statements on `conn` that are still running `timeout` seconds from now."""
+        timeout = self.timeout if timeout is None else timeout
+        if timeout <= 0:
+            yield conn
+            return
+        expires = time.monotonic() + timeout
+        conn.set_progress_handler(lambda: time.monotonic() > expires, PROGRESS_STEPS)
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            if str(e) != "interrupted" or time.monotonic() <= expires:
+                raise
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise QueryTimeout(f"query exceeded {timeout * 1000:.0f} ms") from e
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def table_rows(self, conn):
+        """Row count per table (sqlite_stat1 from ANALYZE, else MAX(rowid)), re-measured every table_rows_ttl
+        seconds so tables that grow under ingest.py start being guarded."""
+        now = time.monotonic()
+        if self._table_rows is None or now - self._table_rows_at >= self.table_rows_ttl:
+            rows = {}
+            try:
+                for table, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+                    rows[table] = max(rows.get(table, 0), int(str(stat).split()[0]))
+            except sqlite3.Error:
+                pass
+            for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE '%VIRTUAL%'"):
+                if table not in rows:
+                    try:
+                        rows[table] = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table}"').fetchone()[0]
+                    except sqlite3.Error:
+                        rows[table] = 0
+            self._table_rows, self._table_rows_at = rows, now
+        return self._table_rows
+
+    def _large(self, name, sql, tables):
+        if name not in tables:  # the plan names loops by alias when the query gives one
+            m = re.search(rf"\b({'|'.join(map(re.escape, tables))})\s+(?:AS\s+)?{re.escape(name)}\b", sql, re.IGNORECASE)
+            name = m.group(1) if m else name
+        return tables.get(name, 0) >= self.large_table_rows
+
+    def _unparsed(self, reason, log=True):
+        with self._lock:
+            self._stats["unparsed"] += 1
+            self._stats["rejected"] += 1
+        if log:
+            print(f"Warning: {reason}; rejecting the query.")
+        raise QueryRejected(reason)
+
+    def check_plan(self, conn, sql, params=()):
+        """Raises QueryRejected if the plan sorts a full scan of a large table or nests one inside a loop,
+        or if the plan cannot be read."""
+        if not self.plan_supported:
+            self._unparsed(f"query plan format of SQLite {sqlite3.sqlite_version} is not supported", log=False)
+        tables = self.table_rows(conn)
+        loops, sorts = {}, {}
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        for _, parent, _, detail in plan:
+            m = _LOOP_RE.match(detail)
+            if m:
+                kind, name, rest = m.groups()
+                full_scan = (kind == "SCAN" or "AUTOMATIC" in rest) and self._large(name, sql, tables)
+                loops.setdefault(parent, []).append((name, full_scan))
+            elif detail in SORT_STEPS:
+                sorts[parent] = detail
+        with self._lock:
+            self._stats["checked"] += 1
+        if not loops:
+            self._unparsed(f"no table access recognized in the query plan (first step: {plan[0][3] if plan else None!r})")
+        reason = None
+        for parent, group in loops.items():
+            if any(full for _, full in group[1:]):
+                reason = f"nested full scan of {next(n for n, full in group[1:] if full)} (unindexed join)"
+            elif group[0][1] and parent in sorts:
+                reason = f"full scan of {group[0][0]} followed by a sort ({sorts[parent][20:].lower()})"
+            if reason:
+                with self._lock:
+                    self._stats["rejected"] += 1
+                raise QueryRejected(reason)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, timeout_ms=int(self.timeout * 1000))
+
+
+# --------------------------
+# Keyset pagination
+# --------------------------
+def _query_hash(sql, params):
+    return hashlib.sha1(f"{sql}\x00{params!r}".encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(sql, params, keys, seen):
+    payload = json.dumps({"q": _query_hash(sql, params), "k": keys, "n": seen}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sql, params):
+    """(keys, rows already returned) from a cursor issued for this same sql + params."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        keys, seen, query = payload["k"], int(payload["n"]), payload["q"]
+    except (ValueError, TypeError, KeyError):
+        raise CursorError("malformed cursor")
+    if query != _query_hash(sql, params) or not isinstance(keys, list):
+        raise CursorError("cursor does not belong to this query")
+    return keys, seen
+
+
+def _after_predicate(keys, after, direction):
+    """(SQL, params) matching the rows that sort after `after` in ORDER BY keys `direction`.
+
+    SQLite sorts NULLs first ascending and last descending, and a row-value comparison with a NULL is
+    never true. Ascending pages after non-NULL keys use the (index-friendly) row-value form; otherwise the
+    comparison is spelled out key by key, with IS for equality and explicit NULL ordering.
+    """
+    if direction == "ASC" and None not in after:
+        return f"({', '.join(keys)}) > ({', '.join('?' for _ in keys)})", list(after)
+    terms, params = [], []
+    for i, (key, value) in enumerate(zip(keys, after)):
+        if value is None:
+            later = f"{key} IS NOT NULL" if direction == "ASC" else None  # nothing sorts after NULL descending
+        else:
+            later = f"{key} > ?" if direction == "ASC" else f"({key} < ? OR {key} IS NULL)"
+        if later is not None:
+            terms.append(" AND ".join([f"{k} IS ?" for k in keys[:i]] + [later]))
+            params += list(after[:i]) + ([value] if value is not None else [])
+    return "(" + " OR ".join(f"({t})" for t in terms) + ")", params
+
+
+def paginate(sql, params, page_size, cursor=None):
+    """Rewrites a single-table, non-aggregate SELECT into one keyset page.
+
+    Returns (page_sql, page_params, key_count, page_limit, seen), or None when the query cannot be paged
+    (joins, aggregates, subqueries, expression or mixed-direction ORDER BY, or an explicit LIMIT no
+    larger than one page). The page SQL selects key_count hidden key columns after the requested ones
+    and fetches one row past page_limit (unless the LIMIT ends on this page) to tell whether another
+    page follows.
+    """
+    m = _PAGEABLE_RE.match(sql)
+    if not m or _NOT_PAGEABLE_RE.search(m.group("columns") + " " + (m.group("where") or "")):
+        return None
+    params = tuple(params)
+    limit = m.group("limit")
+    if limit == "?":
+        limit, where_params = params[-1], params[:-1]
+    else:
+        where_params = params
+    limit = int(limit) if limit is not None else None
+    if limit is not None and limit <= page_size and cursor is None:
+        return None
+    if (m.group("where") or "").count("?") != len(where_params):
+        return None
+
+    order, direction = [], None
+    for term in (m.group("order") or "").split(",") if m.group("order") else []:
+        t = _ORDER_TERM_RE.match(term.strip())
+        if not t:
+            return None
+        term_dir = (t.group(2) or "ASC").upper()
+        if direction not in (None, term_dir):
+            return None
+        direction = term_dir
+        order.append(t.group(1))
+    direction = direction or "ASC"
+    keys = order + [f"{m.group('alias') or m.group('table')}.rowid"]
+
+    seen, after = 0, None
+    if cursor is not None:
+        after, seen = decode_cursor(cursor, sql, params)
+        if len(after) != len(keys):
+            raise CursorError("cursor does not belong to this query")
+    page_limit = page_size if limit is None else min(page_size, limit - seen)
+    if page_limit <= 0:
+        return None
+    fetch = page_limit + 1 if limit is None or seen + page_limit < limit else page_limit
+
+    source = m.group("table") + (f" {m.group('alias')}" if m.group("alias") else "")
+    predicates = [f"({m.group('where')})"] if m.group("where") else []
+    page_params = list(where_params)
+    if after is not None:
+        predicate, after_params = _after_predicate(keys, after, direction)
+        predicates.append(predicate)
+        page_params += after_params
+    page_sql = (f"SELECT {m.group('columns')}, {', '.join(f'{k} AS __key{i}' for i, k in enumerate(keys))} "
+                f"FROM {source}{' WHERE ' + ' AND '.join(predicates) if predicates else ''} "
+                f"ORDER BY {', '.join(f'{k} {direction}' for k in keys)} LIMIT ?;")
+    return page_sql, tuple(page_params) + (fetch,), len(keys), page_limit, seen
+
+
+def split_page(sql, params, col_names, rows, key_count, page_limit, seen):
+    """Strips the key columns from a fetched page; returns (col_names, rows, next_cursor or None)."""
+    more = len(rows) > page_limit
+    rows = rows[:page_limit]
+    next_cursor = None
+    if more and rows:
+        next_cursor = encode_cursor(sql, params, list(rows[-1][-key_count:]), seen + len(rows))
+    return col_names[:-key_count], [row[:-key_count] for row in rows], next_cursor
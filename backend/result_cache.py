@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_PUNCT_RE = re.compile(r"\s*([(),;=<>])\s*")
+
+
+def canonicalize_sql(sql):
+    """Lowercases and collapses whitespace outside string literals so equivalent SQL shares a key."""
+    parts = []
+    pos = 0
+    for m in _LITERAL_RE.finditer(sql):
+        parts.append(_squash(sql[pos:m.start()]))
+        parts.append(m.group(0))
+        pos = m.end()
+    parts.append(_squash(sql[pos:]).rstrip(";"))
+    return " ".join(p for p in parts if p)
+
+
+def _squash(fragment):
+    fragment = " ".join(fragment.lower().split())
+    return _PUNCT_RE.sub(r"\1", fragment).strip()
+
+
+def estimate_size(rows):
+    """Cheap byte estimate for a list of row tuples (strings by length, everything else 8 bytes)."""
+    size = 0
+    for row in rows:
+        size += 56
+        for v in row:
+            size += len(v) if isinstance(v, (str, bytes)) else 8
+    return size
+
+
+# --------------------------
+# Result cache (byte-bounded LRU, dropped whenever the database changes)
+# --------------------------
+class ResultCache:
+    """Caches (column names, rows) per canonical SQL + bound params, invalidated by the DB file's version."""
+
+    def __init__(self, db_path, max_bytes=64 * 1024 * 1024, max_entry_bytes=None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 8
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def db_version(self):
+        """mtime/size of the database and its WAL file; any change means cached results are stale."""
+        version = ()
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+                version += (st.st_mtime_ns, st.st_size)
+            except OSError:
+                version += (None, None)
+        return version
+
+    def _check_version(self):
+        version = self.db_version()
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    @staticmethod
+    def key(sql, params=()):
+        return canonicalize_sql(sql) + ("\x00" + repr(tuple(params)) if params else "")
+
+    def get(self, sql, params=()):
+        key = self.key(sql, params)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, sql, col_names, rows, version=None, params=()):
+        """Stores a result; pass the db_version() taken before executing to avoid caching stale reads."""
+        size = estimate_size(rows)
+        if size > self.max_entry_bytes:
+            return
+        key = self.key(sql, params)
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (tuple(col_names), rows, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
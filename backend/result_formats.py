@@ -0,0 +1,134 @@
+import json
+import struct
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except Exception:
+    pa = None
+
+# Result formats for the /api/query "data" payload:
+#   rows     - list of per-row dicts (default, what the frontends already read)
+#   columnar - {"columns": [...], "dtypes": [...], "values": [[col0...], [col1...]]}
+#   packed   - binary: magic + JSON header + little-endian float32/int64 column buffers
+#   arrow    - Arrow IPC stream (only when pyarrow is installed; otherwise packed)
+JSON_FORMATS = ("rows", "columnar")
+BINARY_FORMATS = ("packed", "arrow")
+MIMETYPES = {
+    "packed": "application/x-argo-packed",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+PACKED_MAGIC = b"ARGP"
+
+
+def negotiate_format(accept_header, requested=None):
+    """Picks a result format from an explicit request flag, then the Accept header."""
+    fmt = (requested or "").lower()
+    if not fmt:
+        accept = accept_header or ""
+        if MIMETYPES["arrow"] in accept:
+            fmt = "arrow"
+        elif MIMETYPES["packed"] in accept:
+            fmt = "packed"
+        elif "format=columnar" in accept:
+            fmt = "columnar"
+        else:
+            fmt = "rows"
+    if fmt == "arrow" and pa is None:
+        fmt = "packed"
+    return fmt if fmt in JSON_FORMATS + BINARY_FORMATS else "rows"
+
+
+def _column_kind(values):
+    """'int64', 'float64' or 'json' depending on what a column holds (None counts as missing)."""
+    kind = "int64"
+    for v in values:
+        if v is None:
+            kind = "float64" if kind == "int64" else kind
+        elif isinstance(v, bool) or not isinstance(v, (int, float)):
+            return "json"
+        elif isinstance(v, float):
+            kind = "float64"
+    return kind
+
+
+def to_columns(col_names, rows):
+    """Transposes row tuples into (name, kind, values) where numeric values are NumPy arrays."""
+    transposed = list(zip(*rows)) if rows else [() for _ in col_names]
+    columns = []
+    for name, values in zip(col_names, transposed):
+        kind = _column_kind(values)
+        if kind == "int64":
+            columns.append((name, kind, np.asarray(values, dtype=np.int64)))
+        elif kind == "float64":
+            columns.append((name, kind, np.asarray(values, dtype=np.float64)))
+        else:
+            columns.append((name, kind, list(values)))
+    return columns
+
+
+def _json_values(kind, values):
+    if kind == "json":
+        return [v.decode("utf-8", "replace") if isinstance(v, bytes) else v for v in values]
+    out = values.tolist()
+    if kind == "float64":
+        missing = np.flatnonzero(np.isnan(values))
+        for i in missing:
+            out[i] = None
+    return out
+
+
+def encode_result(col_names, rows, fmt, summary=""):
+    """Encodes a result set as a JSON-ready object (rows/columnar) or bytes (packed/arrow)."""
+    if fmt == "columnar":
+        columns = to_columns(col_names, rows)
+        return {
+            "columns": list(col_names),
+            "dtypes": [kind for _, kind, _ in columns],
+            "values": [_json_values(kind, values) for _, kind, values in columns],
+            "row_count": len(rows),
+        }
+    if fmt == "packed":
+        return encode_packed(col_names, rows, summary)
+    if fmt == "arrow":
+        return encode_arrow(col_names, rows, summary)
+    return [dict(zip(col_names, row)) for row in rows]
+
+
+def encode_packed(col_names, rows, summary=""):
+    """ARGP | uint32 header length | JSON header | column buffers (float32/int64 LE, or UTF-8 JSON).
+
+    Float columns are narrowed to float32 on the wire (NaN marks missing values); the header says so.
+    """
+    buffers = []
+    header_cols = []
+    offset = 0
+    for name, kind, values in to_columns(col_names, rows):
+        if kind == "float64":
+            kind, buf = "float32", values.astype("<f4").tobytes()
+        elif kind == "int64":
+            buf = values.astype("<i8").tobytes()
+        else:
+            buf = json.dumps(_json_values(kind, values), default=str).encode("utf-8")
+        header_cols.append({"name": name, "dtype": kind, "offset": offset, "length": len(buf)})
+        buffers.append(buf)
+        offset += len(buf)
+    header = json.dumps({"summary": summary, "row_count": len(rows), "columns": header_cols}).encode("utf-8")
+    return PACKED_MAGIC + struct.pack("<I", len(header)) + header + b"".join(buffers)
+
+
+def encode_arrow(col_names, rows, summary=""):
+    arrays = []
+    for _, kind, values in to_columns(col_names, rows):
+        if kind == "float64":
+            arrays.append(pa.array(values.astype(np.float32), mask=np.isnan(values)))
+        elif kind == "int64":
+            arrays.append(pa.array(values))
+        else:
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+    table = pa.Table.from_arrays(arrays, names=list(col_names)).replace_schema_metadata({"summary": summary})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,170 @@
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+
+def _cache_key(text, model_name):
+    """Normalizes a query so trivially different spellings share one embedding."""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha1(f"{model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+# --------------------------
+# Embedding cache (in-memory LRU with an optional SQLite disk tier)
+# --------------------------
+class EmbeddingCache:
+    """Bounded LRU of query embeddings, optionally backed by a SQLite file."""
+
+    def __init__(self, model_name, max_entries=2048, disk_path=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self.hits = 0
+        self.misses = 0
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)"
+                )
+                self._disk.commit()
+            except Exception as e:
+                print(f"Warning: Could not open embedding disk cache {disk_path}: {e}")
+                self._disk = None
+
+    def key(self, text):
+        return _cache_key(text, self.model_name)
+
+    def get(self, key):
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vec
+            if self._disk is not None:
+                row = self._disk.execute("SELECT vec FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vec = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vec)
+                    self.hits += 1
+                    return vec
+            self.misses += 1
+            return None
+
+    def put(self, key, vec):
+        vec = np.ascontiguousarray(vec, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._remember(key, vec)
+            if self._disk is not None:
+                try:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", (key, vec.tobytes())
+                    )
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    print(f"Warning: Could not persist embedding: {e}")
+
+    def _remember(self, key, vec):
+        self._entries[key] = vec
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# --------------------------
+# Micro-batching encoder (queries arriving together share one encode() call)
+# --------------------------
+class EmbeddingBatcher:
+    """Collects concurrent encode requests and runs them through the model in one batch."""
+
+    def __init__(self, model, max_batch=32, window_ms=5):
+        self.model = model
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            texts = [text for text, _ in batch]
+            try:
+                vectors = np.asarray(
+                    self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True), dtype=np.float32
+                )
+                for (_, future), vec in zip(batch, vectors):
+                    future.set_result(vec)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+# --------------------------
+# FAISS top-k retrieval with a latency budget
+# --------------------------
+class FloatRetriever:
+    """Embeds a query (cached, batched) and returns metadata for the k nearest floats.
+
+    `index` is a vector_index.VectorIndex (FAISS search + metadata lookup by vector id).
+    """
+
+    def __init__(self, index, model, model_name, budget_ms=250,
+                 cache_size=2048, cache_path=None, max_batch=32, batch_window_ms=5):
+        self.index = index
+        self.cache = EmbeddingCache(model_name, max_entries=cache_size, disk_path=cache_path)
+        self.batcher = EmbeddingBatcher(model, max_batch=max_batch, window_ms=batch_window_ms)
+        self.budget = budget_ms / 1000.0
+        self.skipped = 0
+
+    def embed(self, text, timeout):
+        """Returns the query embedding, or None if it could not be produced within timeout."""
+        key = self.cache.key(text)
+        vec = self.cache.get(key)
+        if vec is not None:
+            return vec
+        future = self.batcher.submit(text)
+        # Cache the vector even if this caller gives up, so the next identical query is instant.
+        future.add_done_callback(lambda f: f.exception() is None and self.cache.put(key, f.result()))
+        try:
+            return future.result(timeout=max(timeout, 0))
+        except FutureTimeout:
+            return None
+
+    def search(self, vectors, k):
+        """Runs one FAISS search for a (n, d) block of vectors; returns a list of metadata lists."""
+        return self.index.search(vectors, k)
+
+    def retrieve(self, query_text, k=3, started=None):
+        """Top-k metadata, or [] if the embedding is not ready within the budget counted from `started`
+        (time.monotonic(); defaults to now)."""
+        elapsed = time.monotonic() - started if started is not None else 0.0
+        vec = self.embed(query_text, self.budget - elapsed)
+        if vec is None:
+            self.skipped += 1
+            print(f"RAG retrieval skipped: embedding exceeded {self.budget * 1000:.0f} ms budget.")
+            return []
+        return self.search(vec.reshape(1, -1), k)[0]
@@ -0,0 +1,182 @@
+import calendar
+import re
+import sqlite3
+from functools import lru_cache
+
+# --------------------------
+# Pre-aggregated rollups (v2 schema only)
+#   Each rollup table keeps count / sum / sum of squares / min / max of every measured variable per
+#   group of dimensions. Rollups are maintained incrementally: refresh_rollups() folds in only the
+#   argo_profiles rows appended since the last refresh (rowid watermark in schema_info).
+#   Grid cells are CELL_DEG wide and half-open [edge, edge + CELL_DEG); rows lying exactly on a cell's
+#   lower edge are kept apart (lat_edge / lon_edge = 1) so inclusive BETWEEN filters stay exact.
+# --------------------------
+CELL_DEG = 1.0
+DEPTH_BIN_DBAR = 100.0
+VARIABLES = ("temperature", "salinity", "pressure")
+MEASURES = ("n", "sum", "sumsq", "min", "max")
+
+DIMENSIONS = {
+    "float_id": "float_id",
+    "month": "COALESCE(substr(date, 1, 7), '')",
+    "lat_cell": f"COALESCE(CAST((latitude + 90.0) / {CELL_DEG} AS INTEGER), -1)",
+    "lat_edge": f"COALESCE((latitude + 90.0) / {CELL_DEG} = CAST((latitude + 90.0) / {CELL_DEG} AS INTEGER), 0)",
+    "lon_cell": f"COALESCE(CAST((longitude + 180.0) / {CELL_DEG} AS INTEGER), -1)",
+    "lon_edge": f"COALESCE((longitude + 180.0) / {CELL_DEG} = CAST((longitude + 180.0) / {CELL_DEG} AS INTEGER), 0)",
+    "depth_bin": f"COALESCE(CAST(pressure / {DEPTH_BIN_DBAR} AS INTEGER), -1)",
+}
+# Usually smallest first: the query layer picks the first rollup whose dimensions cover the filters.
+ROLLUPS = {
+    "rollup_float_month": ("float_id", "month"),
+    "rollup_depth_month": ("depth_bin", "month"),
+    "rollup_cell_month": ("lat_cell", "lat_edge", "lon_cell", "lon_edge", "month"),
+}
+# Plan filter kind -> rollup dimension it needs
+FILTER_DIMENSIONS = {"float_id": "float_id", "date": "month", "lat": "lat_cell", "lon": "lon_cell"}
+WATERMARK_KEY = "rollup_rowid"
+
+_MONTH_START_RE = re.compile(r"^(\d{4})-(\d{2})-01 00:00:00$")
+_MONTH_END_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2}) 23:59:59$")
+
+
+def _measure_columns():
+    return [f"{m}_{v}" for v in VARIABLES for m in MEASURES]
+
+
+def create_rollups(conn):
+    for table, dims in ROLLUPS.items():
+        columns = [f"{d} {'TEXT' if d == 'month' else 'INTEGER'} NOT NULL" for d in dims]
+        columns += [f"{c} {'INTEGER' if c.startswith('n_') else 'REAL'}" for c in _measure_columns()]
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)}, PRIMARY KEY ({', '.join(dims)}))")
+
+
+def _refresh_sql(table, dims):
+    aggregates = []
+    for v in VARIABLES:
+        aggregates += [f"COUNT({v})", f"TOTAL({v})", f"TOTAL({v} * {v})", f"MIN({v})", f"MAX({v})"]
+    merges = []
+    for v in VARIABLES:
+        merges += [f"{m}_{v} = {m}_{v} + excluded.{m}_{v}" for m in ("n", "sum", "sumsq")]
+        merges += [f"{m}_{v} = COALESCE({m.upper()}({m}_{v}, excluded.{m}_{v}), {m}_{v}, excluded.{m}_{v})"
+                   for m in ("min", "max")]
+    return (
+        f"INSERT INTO {table} ({', '.join(dims + tuple(_measure_columns()))}) "
+        f"SELECT {', '.join(DIMENSIONS[d] for d in dims)}, {', '.join(aggregates)} FROM argo_profiles "
+        f"WHERE rowid > ? AND rowid <= ? GROUP BY {', '.join(str(i + 1) for i in range(len(dims)))} "
+        f"ON CONFLICT ({', '.join(dims)}) DO UPDATE SET {', '.join(merges)}"
+    )
+
+
+def refresh_rollups(conn, rebuild=False, batch_rows=1000000):
+    """Folds argo_profiles rows added since the last refresh into every rollup. Returns rows folded in.
+
+    Rollups assume append-only ingestion; pass rebuild=True after deleting or updating profile rows.
+    """
+    create_rollups(conn)
+    if rebuild:
+        for table in ROLLUPS:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM schema_info WHERE key = ?", (WATERMARK_KEY,))
+    row = conn.execute("SELECT value FROM schema_info WHERE key = ?", (WATERMARK_KEY,)).fetchone()
+    start = int(row[0]) if row else 0
+    end = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM argo_profiles").fetchone()[0]
+    statements = [_refresh_sql(table, dims) for table, dims in ROLLUPS.items()]
+    for lo in range(start, end, batch_rows):
+        hi = min(lo + batch_rows, end)
+        for sql in statements:
+            conn.execute(sql, (lo, hi))
+        conn.execute("INSERT OR REPLACE INTO schema_info (key, value) VALUES (?, ?)", (WATERMARK_KEY, str(hi)))
+        conn.commit()
+    conn.commit()
+    return max(end - start, 0)
+
+
+def has_rollups(conn):
+    """True if the rollups exist and cover every argo_profiles row (so answers match the raw table)."""
+    try:
+        row = conn.execute("SELECT value FROM schema_info WHERE key = ?", (WATERMARK_KEY,)).fetchone()
+        end = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM argo_profiles").fetchone()[0]
+    except sqlite3.Error:
+        return False
+    return row is not None and int(row[0]) >= end
+
+
+# --------------------------
+# Query side: answer AVG/MIN/MAX/COUNT of a variable from a rollup when the filters line up with it
+# --------------------------
+def _month_range(start, end):
+    """('YYYY-MM-01 00:00:00', 'YYYY-MM-<last> 23:59:59') -> ('YYYY-MM', 'YYYY-MM'), else None."""
+    m_start, m_end = _MONTH_START_RE.match(str(start)), _MONTH_END_RE.match(str(end))
+    if not (m_start and m_end):
+        return None
+    year, month, day = (int(g) for g in m_end.groups())
+    if not 1 <= month <= 12 or day != calendar.monthrange(year, month)[1]:
+        return None
+    return start[:7], end[:7]
+
+
+def _cell_range(lo, hi, offset):
+    """Cells for an inclusive [lo, hi] range whose ends sit on cell edges, else None."""
+    lo_cell, hi_cell = (lo + offset) / CELL_DEG, (hi + offset) / CELL_DEG
+    if lo_cell != int(lo_cell) or hi_cell != int(hi_cell) or lo_cell > hi_cell:
+        return None
+    return int(lo_cell), int(hi_cell) - 1, int(hi_cell)
+
+
+def _filter_params(kind, params):
+    if kind == "float_id":
+        return params if isinstance(params[0], int) else None
+    if kind == "date":
+        return _month_range(*params)
+    return _cell_range(params[0], params[1], 90.0 if kind == "lat" else 180.0)
+
+
+@lru_cache(maxsize=128)
+def _render(table, func, column, kinds):
+    select = {
+        "AVG": f"SUM(sum_{column}) / NULLIF(SUM(n_{column}), 0)",
+        "MIN": f"MIN(min_{column})",
+        "MAX": f"MAX(max_{column})",
+        "COUNT": f"COALESCE(SUM(n_{column}), 0)",
+    }[func]
+    predicates = []
+    for kind in kinds:
+        if kind == "float_id":
+            predicates.append("float_id = ?")
+        elif kind == "date":
+            predicates.append("month BETWEEN ? AND ?")
+        else:
+            predicates.append(f"({kind}_cell BETWEEN ? AND ? OR ({kind}_cell = ? AND {kind}_edge = 1))")
+    sql = f"SELECT {select} as {func.lower()}_{column} FROM {table}"
+    if predicates:
+        sql += " WHERE " + " AND ".join(predicates)
+    return sql + " LIMIT ?;"
+
+
+def rollup_stats():
+    info = _render.cache_info()
+    return {"templates": info.currsize, "answers": info.hits + info.misses}
+
+
+def rollup_query(aggregate, filters, limit):
+    """(sql, params) answering `aggregate` over `filters` from a rollup table, or None if none lines up.
+
+    aggregate is (SQL function, column); filters are the query plan's (kind, predicate, params).
+    """
+    func, column = aggregate
+    if column not in VARIABLES or func not in ("AVG", "MIN", "MAX", "COUNT"):
+        return None
+    needed = set()
+    params = []
+    for kind, _, values in filters:
+        if kind not in FILTER_DIMENSIONS:
+            return None
+        converted = _filter_params(kind, values)
+        if converted is None:
+            return None
+        needed.add(FILTER_DIMENSIONS[kind])
+        params.extend(converted)
+    table = next((t for t, dims in ROLLUPS.items() if needed <= set(dims)), None)
+    if table is None:
+        return None
+    return _render(table, func, column, tuple(f[0] for f in filters)), tuple(params) + (limit,)
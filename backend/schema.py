@@ -0,0 +1,161 @@
+import calendar
+import os
+import re
+import sqlite3
+import time
+
+from rollups import refresh_rollups
+from spatial import drop_spatial_index, ensure_spatial_index, is_sqlite_rtree_available
+
+SCHEMA_VERSION = 2
+
+# --------------------------
+# Normalized schema (v2): integer float_id, ISO + epoch dates, composite indexes
+# --------------------------
+SCHEMA_DDL = """
+CREATE TABLE IF NOT EXISTS schema_info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS argo_metadata (
+    float_id INTEGER PRIMARY KEY,
+    platform_type TEXT,
+    country TEXT,
+    deployment_date TEXT
+);
+CREATE TABLE IF NOT EXISTS argo_profiles (
+    profile_id INTEGER,
+    float_id INTEGER NOT NULL,
+    cycle_number INTEGER,
+    latitude REAL,
+    longitude REAL,
+    date TEXT,
+    date_epoch INTEGER,
+    pressure REAL,
+    temperature REAL,
+    salinity REAL
+);
+"""
+
+INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS idx_profiles_float_date ON argo_profiles(float_id, date);
+CREATE INDEX IF NOT EXISTS idx_profiles_date ON argo_profiles(date);
+CREATE INDEX IF NOT EXISTS idx_profiles_lat_lon ON argo_profiles(latitude, longitude);
+"""
+
+PROFILE_COLUMNS = ["profile_id", "float_id", "cycle_number", "latitude", "longitude", "date", "date_epoch",
+                   "pressure", "temperature", "salinity"]
+METADATA_COLUMNS = ["float_id", "platform_type", "country", "deployment_date"]
+
+_FLOAT_ID_RE = re.compile(r"(\d+)")
+_DATE_RE = re.compile(r"(\d{4})[-/](\d{1,2})[-/](\d{1,2})(?:[T ](\d{1,2}):(\d{2})(?::(\d{2}))?)?")
+
+
+def detect_schema(conn):
+    """Returns SCHEMA_VERSION for a migrated database, 1 for the legacy text-float_id layout."""
+    try:
+        row = conn.execute("SELECT value FROM schema_info WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 1
+    except sqlite3.Error:
+        return 1
+
+
+def create_schema(conn, with_indexes=True):
+    conn.executescript(SCHEMA_DDL)
+    if with_indexes:
+        conn.executescript(INDEX_DDL)
+    conn.execute("INSERT OR REPLACE INTO schema_info (key, value) VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+
+
+def normalize_float_id(value):
+    """b'1900121 ' / '1900121' / 1900121 -> 1900121 (None if no digits)."""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "ignore")
+    m = _FLOAT_ID_RE.search(str(value))
+    return int(m.group(1)) if m else None
+
+
+def normalize_date(value):
+    """Parses the assorted legacy date strings into ('YYYY-MM-DD HH:MM:SS', epoch seconds)."""
+    if value is None:
+        return None, None
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "ignore")
+    m = _DATE_RE.search(str(value))
+    if not m:
+        return None, None
+    y, mo, d, h, mi, s = (int(g) if g else 0 for g in m.groups())
+    iso = f"{y:04d}-{mo:02d}-{d:02d} {h:02d}:{mi:02d}:{s:02d}"
+    return iso, calendar.timegm((y, mo, d, h, mi, s, 0, 0, 0))
+
+
+def drop_indexes(conn):
+    """Drops the v2 indexes and the R*Tree so a bulk load appends without index maintenance."""
+    for name in re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", INDEX_DDL):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    drop_spatial_index(conn)
+    conn.commit()
+
+
+def build_indexes(conn):
+    """Adds the v2 indexes, the R*Tree and the rollups after a bulk load (faster than maintaining them per insert)."""
+    conn.executescript(INDEX_DDL)
+    conn.commit()
+    if is_sqlite_rtree_available():
+        ensure_spatial_index(conn)
+    else:
+        print("  SQLite was built without R*Tree support; skipping the spatial index.")
+    refresh_rollups(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+# --------------------------
+# Legacy -> v2 migration
+# --------------------------
+def migrate(src_path, dst_path, batch_size=50000):
+    """Copies a legacy database into a fresh v2 database at dst_path. Returns (profiles, floats) copied."""
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    if detect_schema(src) >= SCHEMA_VERSION:
+        src.close()
+        raise ValueError(f"{src_path} is already at schema version {SCHEMA_VERSION}.")
+    if os.path.exists(dst_path):
+        os.remove(dst_path)
+    dst = sqlite3.connect(dst_path)
+    dst.execute("PRAGMA journal_mode=OFF")
+    dst.execute("PRAGMA synchronous=OFF")
+    create_schema(dst, with_indexes=False)
+
+    floats = {}
+    for float_id, platform_type, country, deployment_date in src.execute(
+        "SELECT float_id, platform_type, country, deployment_date FROM argo_metadata"
+    ):
+        fid = normalize_float_id(float_id)
+        if fid is not None:
+            floats[fid] = (fid, platform_type, country, normalize_date(deployment_date)[0] or deployment_date)
+    dst.executemany("INSERT OR REPLACE INTO argo_metadata VALUES (?, ?, ?, ?)", floats.values())
+
+    copied = 0
+    cursor = src.execute(
+        "SELECT profile_id, float_id, cycle_number, latitude, longitude, date, pressure, temperature, salinity "
+        "FROM argo_profiles"
+    )
+    placeholders = ", ".join("?" for _ in PROFILE_COLUMNS)
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        converted = []
+        for profile_id, float_id, cycle, lat, lon, date, pres, temp, sal in batch:
+            iso, epoch = normalize_date(date)
+            converted.append((profile_id, normalize_float_id(float_id), cycle, lat, lon, iso, epoch, pres, temp, sal))
+        dst.executemany(f"INSERT INTO argo_profiles ({', '.join(PROFILE_COLUMNS)}) VALUES ({placeholders})", converted)
+        copied += len(converted)
+        print(f"  migrated {copied} profile rows...")
+
+    dst.execute("INSERT OR REPLACE INTO schema_info (key, value) VALUES ('migrated_at', ?)", (str(int(time.time())),))
+    build_indexes(dst)
+    dst.close()
+    src.close()
+    return copied, len(floats)
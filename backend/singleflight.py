@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: coalesce within the process only
+    fcntl = None
+
+
+class CoalesceTimeout(TimeoutError):
+    """Gave up waiting for the in-flight call for the same key."""
+
+
+def coalesce_key(*parts):
+    """Stable key for the request parts; text is lower-cased and whitespace-collapsed."""
+    normalized = [" ".join(p.lower().split()) if isinstance(p, str) else p for p in parts]
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# --------------------------
+# Single-flight request coalescing
+#   Within a process, concurrent do(key, fn) calls run fn once; the others wait for it and get the same
+#   result (or exception). With shared_dir, the leader of each process also takes a byte-range lock for the
+#   key in <shared_dir>/coalesce.lock, so one process computes while the others wait. Waiting processes hold
+#   a shared lock on a second byte of the key's range; only if someone holds it does the computing process
+#   publish its result (<key>.json, written atomically), and the last waiter to read it deletes it. Only
+#   results are shared between processes: if that call fails, the next process holding the lock runs fn.
+# --------------------------
+class SingleFlight:
+    def __init__(self, timeout=60.0, shared_dir=None, dumps=json.dumps, loads=json.loads, sweep_seconds=3600):
+        self.timeout = timeout
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self.dumps = dumps
+        self.loads = loads
+        self.sweep_seconds = sweep_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "followers": 0, "published": 0, "shared": 0, "timeouts": 0,
+                       "errors": 0}
+        self._last_sweep = time.time()
+        self._lock_fd = None
+        self._lock_pid = None
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def do(self, key, fn, share=True):
+        """Returns fn()'s result, computed once for all concurrent callers with the same key.
+
+        share=False keeps the call within this process (for results that only make sense here).
+        Raises CoalesceTimeout if the in-flight call does not finish within the timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["followers"] += 1
+        if not leader:
+            if not call.done.wait(self.timeout):
+                self._count("timeouts")
+                raise CoalesceTimeout(f"identical request still running after {self.timeout:.0f}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if share and self.shared_dir:
+                call.result = self._do_shared(key, fn)
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            self._count("errors")
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lock_file(self):
+        """This process's descriptor for coalesce.lock. POSIX record locks belong to the process and are all
+        released when any descriptor for the file is closed, so it is opened once (per pid) and kept."""
+        with self._lock:
+            if self._lock_pid != os.getpid():
+                self._lock_fd = os.open(os.path.join(self.shared_dir, "coalesce.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+                self._lock_pid = os.getpid()
+            return self._lock_fd
+
+    @staticmethod
+    def _try_lock(fd, kind, offset):
+        try:
+            fcntl.lockf(fd, kind | fcntl.LOCK_NB, 1, offset)
+            return True
+        except OSError:
+            return False
+
+    def _has_waiters(self, fd, wait_offset):
+        """True if another process is waiting on this key (holds the shared lock on its wait byte)."""
+        if not self._try_lock(fd, fcntl.LOCK_EX, wait_offset):
+            return True
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, wait_offset)
+        return False
+
+    def _do_shared(self, key, fn):
+        started = time.time()
+        fd = self._lock_file()
+        run_offset = int(key[:12], 16) * 2
+        wait_offset = run_offset + 1
+        result_path = os.path.join(self.shared_dir, f"{key}.json")
+        fcntl.lockf(fd, fcntl.LOCK_SH, 1, wait_offset)
+        waited = False
+        try:
+            while not self._try_lock(fd, fcntl.LOCK_EX, run_offset):
+                waited = True
+                if time.time() - started > self.timeout:
+                    self._count("timeouts")
+                    raise CoalesceTimeout(f"identical request still running after {self.timeout:.0f}s")
+                time.sleep(0.01)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, wait_offset)
+        try:
+            if waited:
+                shared = self._read_result(result_path, started)
+                if shared is not None:
+                    if not self._has_waiters(fd, wait_offset):
+                        self._remove(result_path)
+                    try:
+                        result = self.loads(shared)
+                    except ValueError:
+                        pass
+                    else:
+                        self._count("shared")
+                        return result
+            result = fn()
+            if self._has_waiters(fd, wait_offset):
+                self._write_result(result_path, result)
+                self._count("published")
+            return result
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, run_offset)
+            self._sweep()
+
+    def _read_result(self, path, since):
+        """The result another process finished after `since` (i.e. while we waited), else None."""
+        try:
+            if os.stat(path).st_mtime < since:
+                return None
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_result(self, path, result):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            data = self.dumps(result)
+            with open(tmp, "w") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not share coalesced result: {e}")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _sweep(self):
+        """Removes result files orphaned by a process that died before its waiters read them."""
+        now = time.time()
+        if now - self._last_sweep < self.sweep_seconds:
+            return
+        self._last_sweep = now
+        for name in os.listdir(self.shared_dir):
+            if name.endswith((".json", ".tmp")):
+                path = os.path.join(self.shared_dir, name)
+                try:
+                    if now - os.stat(path).st_mtime > self.sweep_seconds:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls), shared_dir=self.shared_dir)
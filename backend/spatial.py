@@ -0,0 +1,164 @@
+import math
+import sqlite3
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+# --------------------------
+# R*Tree over profile positions, kept in sync with argo_profiles by triggers
+# --------------------------
+RTREE_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS argo_positions USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+CREATE TRIGGER IF NOT EXISTS argo_positions_insert AFTER INSERT ON argo_profiles
+WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL BEGIN
+    INSERT INTO argo_positions VALUES (NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+END;
+CREATE TRIGGER IF NOT EXISTS argo_positions_delete AFTER DELETE ON argo_profiles BEGIN
+    DELETE FROM argo_positions WHERE id = OLD.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS argo_positions_update AFTER UPDATE OF latitude, longitude ON argo_profiles BEGIN
+    DELETE FROM argo_positions WHERE id = OLD.rowid;
+    INSERT INTO argo_positions SELECT NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+    WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+END;
+"""
+
+
+def great_circle_km(lat1, lon1, lat2, lon2):
+    """Haversine distance in km (also registered as a SQL function on pool connections)."""
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def register_functions(conn):
+    conn.create_function("great_circle_km", 4, great_circle_km, deterministic=True)
+
+
+def has_spatial_index(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'argo_positions'").fetchone()
+    return row is not None
+
+
+def ensure_spatial_index(conn):
+    """Creates (and back-fills) the R*Tree and its sync triggers. Needs a writable connection."""
+    existed = has_spatial_index(conn)
+    conn.executescript(RTREE_DDL)
+    if not existed:
+        conn.execute(
+            "INSERT INTO argo_positions SELECT rowid, latitude, latitude, longitude, longitude "
+            "FROM argo_profiles WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        )
+    conn.commit()
+
+
+def drop_spatial_index(conn):
+    """Drops the R*Tree and its triggers (before a bulk load; ensure_spatial_index() rebuilds it)."""
+    conn.executescript("""
+        DROP TRIGGER IF EXISTS argo_positions_insert;
+        DROP TRIGGER IF EXISTS argo_positions_delete;
+        DROP TRIGGER IF EXISTS argo_positions_update;
+        DROP TABLE IF EXISTS argo_positions;
+    """)
+
+
+def box_predicate(lat, lon, radius_deg):
+    """R*Tree constraint for a box around (lat, lon) that contains every point within radius_deg of arc.
+
+    Longitude is widened by 1/cos(latitude) at the box's poleward edge and split across the dateline.
+    """
+    lat_lo, lat_hi = max(-90.0, lat - radius_deg), min(90.0, lat + radius_deg)
+    edge = max(abs(lat_lo), abs(lat_hi))
+    lon_half = 180.0 if edge >= 89.9 else min(180.0, radius_deg / math.cos(math.radians(edge)))
+    clauses = "min_lat >= ? AND max_lat <= ?"
+    params = [lat_lo, lat_hi]
+    lon_lo, lon_hi = lon - lon_half, lon + lon_half
+    if lon_half >= 180.0:
+        return clauses, params
+    if lon_lo < -180.0:
+        clauses += " AND (min_lon >= ? OR max_lon <= ?)"
+        params += [lon_lo + 360.0, lon_hi]
+    elif lon_hi > 180.0:
+        clauses += " AND (min_lon >= ? OR max_lon <= ?)"
+        params += [lon_lo, lon_hi - 360.0]
+    else:
+        clauses += " AND min_lon >= ? AND max_lon <= ?"
+        params += [lon_lo, lon_hi]
+    return clauses, params
+
+
+def box_rowid_filter(lat, lon, radius_deg):
+    """Inline SQL (no bound params) restricting argo_profiles rows to the R*Tree box."""
+    clauses, params = box_predicate(lat, lon, radius_deg)
+    for value in params:
+        clauses = clauses.replace("?", repr(float(value)), 1)
+    return f"argo_profiles.rowid IN (SELECT id FROM argo_positions WHERE {clauses})"
+
+
+# --------------------------
+# k-nearest-neighbour search (widen the box until k hits, then rank by great-circle distance)
+# --------------------------
+NEAREST_GROUPS = ("float_id", "profile_id")
+
+
+def nearest_profiles(conn, lat, lon, k=10, group_by="float_id", columns=None, start_radius=0.5, max_radius=180.0):
+    """Returns (col_names, rows) for the k floats (group_by="float_id"), profiles ("profile_id") or
+    measurement rows (None) closest to (lat, lon), nearest first.
+
+    Grouped results keep each float's/profile's closest row, so "nearest 5 floats" is 5 distinct floats
+    rather than 5 depth levels of one profile. Each step doubles the box until it holds at least k
+    groups; the final box is then grown to cover the k-th candidate's distance so points just outside
+    the box corners are not missed.
+    """
+    if group_by is not None and group_by not in NEAREST_GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(NEAREST_GROUPS)} or None")
+    columns = columns or ["float_id", "date", "latitude", "longitude", "pressure", "temperature", "salinity"]
+    if group_by and group_by not in columns:
+        columns = [group_by] + list(columns)
+    in_box = "FROM argo_profiles WHERE rowid IN (SELECT id FROM argo_positions WHERE {})"
+    radius = start_radius
+    while True:
+        clauses, params = box_predicate(lat, lon, radius)
+        if group_by:
+            count_sql = f"SELECT COUNT(*) FROM (SELECT DISTINCT {group_by} {in_box.format(clauses)} LIMIT ?)"
+        else:
+            count_sql = f"SELECT COUNT(*) FROM (SELECT id FROM argo_positions WHERE {clauses} LIMIT ?)"
+        count = conn.execute(count_sql, params + [k]).fetchone()[0]
+        if count >= k or radius >= max_radius:
+            break
+        radius = min(max_radius, radius * 2)
+
+    def ranked(radius_deg):
+        clauses, params = box_predicate(lat, lon, radius_deg)
+        if group_by:
+            # With a single MIN() aggregate, SQLite takes the bare columns from the row holding the minimum.
+            distance, grouping = "MIN(great_circle_km(latitude, longitude, ?, ?))", f" GROUP BY {group_by}"
+        else:
+            distance, grouping = "great_circle_km(latitude, longitude, ?, ?)", ""
+        cursor = conn.execute(
+            f"SELECT {', '.join(columns)}, {distance} AS distance_km {in_box.format(clauses)}{grouping} "
+            f"ORDER BY distance_km LIMIT ?",
+            [lat, lon] + params + [k],
+        )
+        return [d[0] for d in cursor.description], cursor.fetchall()
+
+    col_names, rows = ranked(radius)
+    if rows and len(rows) == k and radius < max_radius:
+        kth_km = rows[-1][-1]
+        if kth_km > radius * KM_PER_DEGREE:
+            col_names, rows = ranked(min(max_radius, kth_km / KM_PER_DEGREE * 1.001))
+    return col_names, rows
+
+
+def is_sqlite_rtree_available():
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING rtree(id, a, b)")
+        conn.close()
+        return True
+    except sqlite3.Error:
+        return False
@@ -0,0 +1,68 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+# --------------------------
+# Deferred summarization jobs (bounded worker pool + long-poll lookup)
+# --------------------------
+class SummaryJobs:
+    """Runs summary functions on a small thread pool so /api/query can return rows immediately.
+
+    max_workers caps how many LLM summary calls are in flight; max_pending bounds the backlog
+    (submit() returns None when it is full, and the caller summarizes inline instead). Finished
+    jobs are kept for ttl_seconds. Jobs live in this worker's memory only.
+    """
+
+    def __init__(self, max_workers=4, max_pending=64, ttl_seconds=600):
+        self.max_pending = max_pending
+        self.ttl = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary")
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            self._evict(time.time())
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+            job_id = uuid.uuid4().hex
+            job = {"status": "pending", "summary": None, "created": time.time(), "done": threading.Event()}
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job, fn, args)
+        return job_id
+
+    def _run(self, job, fn, args):
+        try:
+            job["summary"] = fn(*args)
+            job["status"] = "done"
+        except Exception as e:
+            print(f"Deferred summary failed: {e}")
+            job["summary"] = f"Summary failed: {e}"
+            job["status"] = "error"
+        finally:
+            job["finished"] = time.time()
+            with self._lock:
+                self._pending -= 1
+            job["done"].set()
+
+    def get(self, job_id, wait=0):
+        """Returns {"status", "summary"} for a job, waiting up to `wait` seconds for it to finish."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if wait > 0:
+            job["done"].wait(wait)
+        return {"status": job["status"], "summary": job["summary"]}
+
+    def _evict(self, now):
+        expired = [jid for jid, job in self._jobs.items() if job.get("finished") and now - job["finished"] > self.ttl]
+        for jid in expired:
+            del self._jobs[jid]
+
+    def stats(self):
+        with self._lock:
+            return {"jobs": len(self._jobs), "pending": self._pending}
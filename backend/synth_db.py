@@ -0,0 +1,163 @@
+"""Builds a synthetic argo_data.db with realistic float / cycle / depth structure, for benchmarks and local runs.
+
+Usage:
+    python synth_db.py [--rows 1000000] [--out argo_data.db] [--seed 42] [--legacy]
+
+Each float is deployed somewhere in the Indian Ocean, drifts as a random walk and reports one profile
+every 10 days; each profile samples --levels pressure levels from the surface to 2000 dbar, with a
+latitude- and season-dependent thermocline and a shallow salinity maximum. The same seed always
+produces the same database. --legacy writes the original text float_id layout (b'1900121 ')
+instead of the normalized v2 schema, so migrate_db.py can be exercised too.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from schema import PROFILE_COLUMNS, SCHEMA_VERSION, build_indexes, create_schema
+
+LEGACY_DDL = """
+CREATE TABLE argo_metadata (float_id TEXT, platform_type TEXT, country TEXT, deployment_date TEXT);
+CREATE TABLE argo_profiles (
+    profile_id INTEGER, float_id TEXT, cycle_number INTEGER, latitude REAL, longitude REAL,
+    date TEXT, pressure REAL, temperature REAL, salinity REAL
+);
+"""
+PLATFORM_TYPES = ["APEX", "ARVOR", "NAVIS_A", "PROVOR", "SOLO_II"]
+COUNTRIES = ["India", "USA", "Australia", "France", "Japan", "China", "UK"]
+WMO_PREFIXES = [19, 29, 39, 59, 69]
+EPOCH_START = 946684800  # 2000-01-01
+EPOCH_END = 1735689600   # 2025-01-01
+CYCLE_SECONDS = 10 * 86400
+
+
+def pressure_levels(levels):
+    """Denser sampling near the surface, like real CTD profiles (about 5 to 2000 dbar)."""
+    return np.round(5.0 + 1995.0 * np.linspace(0.0, 1.0, levels) ** 2, 1)
+
+
+def float_ids(rng, count):
+    ids = set()
+    while len(ids) < count:
+        prefix = rng.choice(WMO_PREFIXES)
+        ids.add(int(prefix) * 100000 + int(rng.integers(0, 100000)))
+    return sorted(ids)
+
+
+def generate_float(rng, float_id, cycles, pressures, first_profile_id):
+    """Column arrays for one float's profiles: cycles x levels rows."""
+    levels = len(pressures)
+    deployed = int(rng.integers(EPOCH_START, EPOCH_END - cycles * CYCLE_SECONDS))
+    epochs = deployed + np.arange(cycles) * CYCLE_SECONDS + rng.integers(0, 6 * 3600, cycles)
+
+    lat = np.clip(rng.uniform(-40.0, 20.0) + np.cumsum(rng.normal(0.0, 0.12, cycles)), -60.0, 25.0)
+    lon = rng.uniform(45.0, 110.0) + np.cumsum(rng.normal(0.0, 0.15, cycles))
+    lon = (lon + 180.0) % 360.0 - 180.0
+
+    # Surface temperature falls off away from the tropics and follows the seasons (opposite by hemisphere).
+    day_of_year = (epochs % (365.25 * 86400)) / 86400.0
+    season = np.cos(2 * np.pi * (day_of_year - 30) / 365.25) * np.sign(lat)
+    sst = 29.0 - 0.32 * np.maximum(np.abs(lat) - 8.0, 0.0) + 1.5 * season
+    p = pressures[None, :]
+    temperature = 2.0 + (sst[:, None] - 2.0) * np.exp(-p / (220.0 + 6.0 * np.abs(lat)[:, None]))
+    temperature += rng.normal(0.0, 0.08, (cycles, levels))
+    salinity = 34.7 + 0.9 * np.exp(-((p - 120.0) / 180.0) ** 2) - 0.02 * np.abs(lat)[:, None]
+    salinity += rng.normal(0.0, 0.02, (cycles, levels))
+
+    return {
+        "profile_id": np.repeat(first_profile_id + np.arange(cycles), levels),
+        "float_id": np.full(cycles * levels, float_id),
+        "cycle_number": np.repeat(np.arange(1, cycles + 1), levels),
+        "latitude": np.repeat(np.round(lat, 4), levels),
+        "longitude": np.repeat(np.round(lon, 4), levels),
+        "date_epoch": np.repeat(epochs, levels),
+        "pressure": np.tile(pressures, cycles),
+        "temperature": np.round(temperature, 3).ravel(),
+        "salinity": np.round(salinity, 3).ravel(),
+    }
+
+
+def format_dates(epochs):
+    """Epoch seconds -> 'YYYY-MM-DD HH:MM:SS' (the v2 storage format)."""
+    return np.char.replace(np.datetime_as_string(epochs.astype("datetime64[s]"), unit="s"), "T", " ")
+
+
+def build(out_path, rows, seed=42, levels=40, cycles=120, legacy=False, batch_floats=20):
+    """Writes a synthetic database with (about) `rows` profile rows. Returns (rows, floats) written."""
+    rng = np.random.default_rng(seed)
+    pressures = pressure_levels(levels)
+    per_float = np.maximum(rng.integers(cycles // 2, cycles * 3 // 2 + 1, size=rows // levels + 1), 1)
+    n_floats = int(np.searchsorted(np.cumsum(per_float) * levels, rows)) + 1
+    ids = float_ids(rng, n_floats)
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(out_path + suffix):
+            os.remove(out_path + suffix)
+    conn = sqlite3.connect(out_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    if legacy:
+        conn.executescript(LEGACY_DDL)
+        columns = [c for c in PROFILE_COLUMNS if c != "date_epoch"]
+    else:
+        create_schema(conn, with_indexes=False)
+        columns = PROFILE_COLUMNS
+    insert = f"INSERT INTO argo_profiles ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+
+    written, profile_id, metadata, batch = 0, 1, [], []
+    for i, float_id in enumerate(ids):
+        n_cycles = int(min(per_float[i], -(-(rows - written) // levels)))
+        data = generate_float(rng, float_id, n_cycles, pressures, profile_id)
+        profile_id += n_cycles
+        keep = min(rows - written, n_cycles * levels)
+        data = {name: values[:keep] for name, values in data.items()}
+        data["date"] = format_dates(data["date_epoch"])
+        data["float_id"] = [f"b'{float_id} '"] * keep if legacy else data["float_id"]
+        batch.append([data[c].tolist() if hasattr(data[c], "tolist") else data[c] for c in columns])
+        metadata.append((
+            f"b'{float_id} '" if legacy else float_id,
+            PLATFORM_TYPES[int(rng.integers(len(PLATFORM_TYPES)))],
+            COUNTRIES[int(rng.integers(len(COUNTRIES)))],
+            str(data["date"][0])[:10],
+        ))
+        written += keep
+        if len(batch) >= batch_floats or written >= rows:
+            for cols in batch:
+                conn.executemany(insert, zip(*cols))
+            conn.commit()
+            batch = []
+            print(f"  wrote {written} / {rows} rows ({i + 1} floats)...")
+        if written >= rows:
+            break
+
+    conn.executemany("INSERT INTO argo_metadata VALUES (?, ?, ?, ?)", metadata)
+    conn.commit()
+    if not legacy:
+        build_indexes(conn)
+    conn.close()
+    return written, len(metadata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic ARGO database.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Profile rows to generate (10k to 100M).")
+    parser.add_argument("--out", default="argo_data.db")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--levels", type=int, default=40, help="Pressure levels per profile.")
+    parser.add_argument("--cycles", type=int, default=120, help="Mean profiles (10-day cycles) per float.")
+    parser.add_argument("--legacy", action="store_true", help="Write the legacy text float_id schema.")
+    args = parser.parse_args()
+
+    started = time.time()
+    rows, floats = build(args.out, args.rows, seed=args.seed, levels=args.levels, cycles=args.cycles,
+                         legacy=args.legacy)
+    layout = "legacy" if args.legacy else f"v{SCHEMA_VERSION}"
+    print(f"Wrote {rows} rows from {floats} floats ({layout} schema) to {args.out} in {time.time() - started:.1f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
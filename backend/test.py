@@ -1,230 +1,372 @@
+import gc
 import os
 import re
 import sqlite3
-import faiss
+import threading
+import time
 import numpy as np
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import json
-import qrcode
-from io import BytesIO
 import base64
-from urllib.parse import quote_plus
 import uuid 
 import math 
-import geopy.distance
-
-# Optional imports that may fail in some environments
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None
-
-try:
-    from sentence_transformers import SentenceTransformer
-except Exception:
-    SentenceTransformer = None
+import sys
+from geo import compass_direction, distance_matrix_km, haversine_km, initial_bearing_deg
+from retrieval import FloatRetriever
+from result_cache import ResultCache
+from db import ConnectionPool
+from schema import SCHEMA_VERSION, detect_schema
+from result_formats import MIMETYPES, encode_result, negotiate_format
+from history_store import HistoryStore
+from summaries import SummaryJobs
+from qr_render import QRRenderer, qr_response
+from nl_sql import DEFAULT_LIMIT, compile_query, compiler_stats, inline_params
+from spatial import has_spatial_index, nearest_profiles, register_functions
+from rollups import has_rollups
+from downsample import PLOT_MODES, downsample_profiles, missing_plot_columns
+from llm import LLMCache, cache_key, content_hash, load_model
+from llm_client import PRIORITY_SQL, PRIORITY_SUMMARY, LLMClient, LLMUnavailable, classify_error
+from lazy import Components
+from metrics import Registry, server_timing
+from query_guard import CursorError, QueryGuard, QueryRejected, QueryTimeout, paginate, split_page
+from singleflight import CoalesceTimeout, SingleFlight, coalesce_key
 
 # --- CONFIGURATION ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 FAISS_INDEX_FILE = "faiss_index.bin"
-METADATA_MAP_FILE = "metadata_map.npy"
-DB_FILE = "argo_data.db"
+METADATA_MAP_FILE = "metadata_map.npy" # Legacy pickled metadata (used only until vector_meta.db exists)
+VECTOR_META_FILE = "vector_meta.db" # Float metadata + embeddings keyed by vector id (see vector_index.py)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16)) # IVF lists probed per query
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64)) # HNSW candidate list size per query
+DB_FILE = os.getenv("DB_FILE", "argo_data.db")
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-HISTORY_STORE_FILE = "history_store.json" # File for storing long chat histories
+HISTORY_STORE_FILE = "history_store.json" # Legacy JSON history file (imported into HISTORY_DB_FILE)
+HISTORY_DB_FILE = os.getenv("HISTORY_DB_FILE", "history_store.db") # SQLite store for long chat histories
+HISTORY_TTL_DAYS = int(os.getenv("HISTORY_TTL_DAYS", 30))
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", 100000))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 3))
+RAG_BUDGET_MS = int(os.getenv("RAG_BUDGET_MS", 250)) # Skip retrieval if embedding takes longer than this
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 2048))
+EMBED_CACHE_FILE = os.getenv("EMBED_CACHE_FILE") # Optional SQLite file for the on-disk embedding tier
+EMBED_SERVER_SOCKET = os.getenv("EMBED_SERVER_SOCKET") # Use embed_server.py over this Unix socket instead of a local model
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", 0)) # torch intra-op threads per process (0 = torch default)
+RESULT_CACHE_MB = int(os.getenv("RESULT_CACHE_MB", 64)) # 0 disables the SQL result cache
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500)) # Rows per fetchmany() / streamed event
+STREAM_ROW_LIMIT = int(os.getenv("STREAM_ROW_LIMIT", 100000)) # Implicit LIMIT for streamed queries
+PLOT_ROW_LIMIT = int(os.getenv("PLOT_ROW_LIMIT", 200000)) # Raw rows read for a plot query before downsampling
+PLOT_DEFAULT_POINTS = int(os.getenv("PLOT_DEFAULT_POINTS", 100)) # Points per profile after downsampling
+PLOT_MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", 2000)) # Also caps the number of pressure bins per profile
+PLOT_MIN_BIN_DBAR = float(os.getenv("PLOT_MIN_BIN_DBAR", 1.0)) # Narrowest pressure bin a client may request
+PLOT_MAX_PROFILES = int(os.getenv("PLOT_MAX_PROFILES", 200))
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", 5000)) # Per-statement deadline (0 disables)
+QUERY_LARGE_TABLE_ROWS = int(os.getenv("QUERY_LARGE_TABLE_ROWS", 500000)) # Tables the plan check protects
+QUERY_TABLE_ROWS_TTL = float(os.getenv("QUERY_TABLE_ROWS_TTL", 300)) # Re-measure table sizes for the plan check this often
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", 500)) # Rows per page (next_cursor) for /api/query
+COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", 60)) # Max wait for an identical in-flight question
+COALESCE_DIR = os.getenv("COALESCE_DIR") # Optional directory so identical questions are coalesced across workers
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 4)) # Max deferred LLM summaries in flight per worker
+SUMMARY_MAX_WAIT = float(os.getenv("SUMMARY_MAX_WAIT", 25)) # Long-poll cap for /api/summary/<id>
+ASYNC_SUMMARY_DEFAULT = os.getenv("ASYNC_SUMMARY_DEFAULT", "0") == "1"
+ROUTE_BATCH_MAX_POINTS = int(os.getenv("ROUTE_BATCH_MAX_POINTS", 100000))
+ROUTE_MATRIX_MAX_CELLS = int(os.getenv("ROUTE_MATRIX_MAX_CELLS", 1000000))
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR") # Optional directory so rendered QR images are shared by all workers
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8)) # Max concurrent SQLite checkouts per worker
+DB_RECHECK_SECONDS = float(os.getenv("DB_RECHECK_SECONDS", 10)) # Re-read the R*Tree/rollup availability this often (ingest.py drops and rebuilds them); 0 = never
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini") # "gemini", "stub" (deterministic, offline) or "http" (LLM_HTTP_URL, e.g. fake_llm_server.py)
+LLM_RPM = int(os.getenv("LLM_RPM", 0)) # Requests per minute this worker may send (0 = unlimited; split the quota across workers)
+LLM_TPM = int(os.getenv("LLM_TPM", 0)) # Tokens per minute this worker may send (0 = unlimited)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8)) # Upper bound of the adaptive in-flight limit
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3)) # Retries on 429s and transient errors (jittered backoff)
+LLM_SQL_MAX_WAIT = float(os.getenv("LLM_SQL_MAX_WAIT", 3)) # Queue + backoff budget before heuristic SQL is used instead
+LLM_SUMMARY_MAX_WAIT = float(os.getenv("LLM_SUMMARY_MAX_WAIT", 20))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5)) # Consecutive 429s/errors that open the circuit
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30)) # Seconds the circuit stays open before a probe
+LLM_CACHE_FILE = os.getenv("LLM_CACHE_FILE", "llm_cache.db") # Empty string keeps the LLM cache in memory only
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 86400))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1" # Add a per-request Server-Timing header with stage durations
+WARM_UP = os.getenv("WARM_UP", "background") # "background" (load components after startup), "eager" or "off" (background load on first use)
 
 # --- FLASK APP ---
 app = Flask(__name__)
 CORS(app)
 
-# --- GLOBALS TO LOAD ON STARTUP ---
-faiss_index = None
-metadata_map = {}
-embedding_model = None
-model = None
-history_store = {} # In-memory cache for chat histories
-
-# --- Helper to load and save history store (for persistent ID lookup) ---
-def load_history_store():
-    global history_store
-    if os.path.exists(HISTORY_STORE_FILE):
-        try:
-            with open(HISTORY_STORE_FILE, 'r') as f:
-                history_store = json.load(f)
-            print(f"Loaded {len(history_store)} histories from {HISTORY_STORE_FILE}.")
-        except json.JSONDecodeError as e:
-            # FIX: If the file is corrupted (JSONDecodeError), delete it and start fresh.
-            print(f"ERROR: Corrupt history store detected at {HISTORY_STORE_FILE}. Deleting file.")
-            os.remove(HISTORY_STORE_FILE)
-            history_store = {}
-        except Exception as e:
-            print(f"Warning: Could not load history store: {e}")
-            history_store = {}
-    else:
-         print(f"History store file not found. Starting new store.")
+# --------------------------
+# Metrics (per worker; scraped from /metrics in the Prometheus text format)
+# --------------------------
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram("argo_http_request_duration_seconds", "HTTP request latency.",
+                                    ("endpoint", "method", "status"))
+LLM_CALLS = metrics.counter("argo_llm_calls_total", "LLM API calls (cache misses) by purpose and outcome.",
+                            ("purpose", "outcome"))
+SQL_FALLBACKS = metrics.counter("argo_sql_fallback_total", "Questions answered with heuristic SQL, by reason.",
+                                ("reason",))
+ROWS_RETURNED = metrics.counter("argo_rows_returned_total", "Result rows returned to clients.", ("path",))
 
-def save_history_store():
-    global history_store
-    try:
-        with open(HISTORY_STORE_FILE, 'w') as f:
-            json.dump(history_store, f, ensure_ascii=False)
-    except Exception as e:
-        print(f"Error saving history store: {e}")
+# --- GLOBALS TO LOAD ON STARTUP (cheap ones only; heavy components load lazily below) ---
+qr_renderer = QRRenderer(cache_dir=QR_CACHE_DIR)
+summary_jobs = SummaryJobs(max_workers=SUMMARY_WORKERS)
+result_cache = ResultCache(DB_FILE, max_bytes=RESULT_CACHE_MB * 1024 * 1024) if RESULT_CACHE_MB > 0 else None
+query_guard = QueryGuard(timeout_ms=QUERY_TIMEOUT_MS, large_table_rows=QUERY_LARGE_TABLE_ROWS,
+                         table_rows_ttl=QUERY_TABLE_ROWS_TTL)
 
-# Load store on startup
-load_history_store()
-# --------------------------
+# --- Single-flight coalescing of identical /api/query requests (see process_query) ---
+def encode_shared_response(resp):
+    data = resp.get("data")
+    if isinstance(data, bytes):
+        resp = dict(resp, data={"__base64__": base64.b64encode(data).decode("ascii")})
+    return json.dumps(resp)
+
+def decode_shared_response(text):
+    resp = json.loads(text)
+    if isinstance(resp.get("data"), dict) and "__base64__" in resp["data"]:
+        resp["data"] = base64.b64decode(resp["data"]["__base64__"])
+    return resp
 
-# --- Try to load FAISS + metadata map (optional) ---
+coalescer = SingleFlight(timeout=COALESCE_TIMEOUT, shared_dir=COALESCE_DIR,
+                         dumps=encode_shared_response, loads=decode_shared_response)
+
+# --- History store (SQLite; the legacy JSON file is imported once on first start) ---
 try:
-    if os.path.exists(FAISS_INDEX_FILE) and os.path.exists(METADATA_MAP_FILE):
-        faiss_index = faiss.read_index(FAISS_INDEX_FILE)
-        metadata_map = np.load(METADATA_MAP_FILE, allow_pickle=True).item()
-        print("FAISS index and metadata map loaded successfully.")
-    else:
-        print("FAISS index or metadata map files not found. RAG will be disabled.")
+    history_store = HistoryStore(HISTORY_DB_FILE, ttl_seconds=HISTORY_TTL_DAYS * 86400, max_entries=HISTORY_MAX_ENTRIES)
+    history_store.import_json(HISTORY_STORE_FILE)
 except Exception as e:
-    print(f"Warning: Could not load FAISS index or metadata map: {e}")
-    faiss_index = None
-    metadata_map = {}
+    print(f"Warning: Could not open history store: {e}")
+    history_store = None
+# --------------------------
 
-# --- Try to load SentenceTransformer (optional) ---
-if SentenceTransformer:
+# --------------------------
+# Lazily loaded components: FAISS, the embedding model (torch), the LLM and the DB pool are loaded
+# by the warm-up thread (or preload), so routes that need none of them serve immediately. Request
+# handlers never wait for the heavy ones: until the LLM or retriever is loaded, queries use the
+# heuristic SQL and skip retrieval. Only the (cheap, required) database is loaded on first use.
+# --------------------------
+def load_faiss():
+    """Memory-mapped vector index with its metadata, or None when the files are missing (RAG disabled)."""
+    if not (os.path.exists(FAISS_INDEX_FILE)
+            and (os.path.exists(VECTOR_META_FILE) or os.path.exists(METADATA_MAP_FILE))):
+        print("FAISS index or metadata files not found. RAG will be disabled.")
+        return None
+    from vector_index import VectorIndex
+    index = VectorIndex.open(FAISS_INDEX_FILE, VECTOR_META_FILE, METADATA_MAP_FILE,
+                             nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH)
+    mode = {True: "memory-mapped", False: "in memory", None: "memory-map requested"}[index.mmapped]
+    print(f"FAISS index loaded ({index.ntotal} vectors, {mode}).")
+    return index
+
+def load_embedding_model():
+    """The local SentenceTransformer (frozen for inference), or a client of the shared embedding server."""
+    if EMBED_SERVER_SOCKET:
+        from embed_server import RemoteEncoder
+        print(f"Using the embedding server at {EMBED_SERVER_SOCKET}.")
+        return RemoteEncoder(EMBED_SERVER_SOCKET)
     try:
-        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        print("SentenceTransformer loaded.")
-    except Exception as e:
-        print(f"Warning: Could not load embedding model: {e}")
-        embedding_model = None
-else:
-    print("sentence-transformers library not available; RAG disabled.")
+        import torch
+        from sentence_transformers import SentenceTransformer
+    except Exception:
+        print("sentence-transformers library not available; RAG disabled.")
+        return None
+    from embed_server import freeze_model
+    if TORCH_THREADS:
+        torch.set_num_threads(TORCH_THREADS)
+    return freeze_model(SentenceTransformer(EMBEDDING_MODEL_NAME))
 
-# --- Database connection (single connection, check_same_thread=False for Flask dev) ---
-try:
-    db_connection = sqlite3.connect(DB_FILE, check_same_thread=False)
-    print("Connected to SQLite database.")
-except Exception as e:
-    db_connection = None
-    print(f"Warning: Could not connect to SQLite DB: {e}")
+def load_retriever():
+    index = components.get("faiss")
+    embedder = components.get("embedding_model") if index is not None else None
+    if index is None or embedder is None:
+        return None
+    return FloatRetriever(
+        index, embedder, EMBEDDING_MODEL_NAME,
+        budget_ms=RAG_BUDGET_MS, cache_size=EMBED_CACHE_SIZE, cache_path=EMBED_CACHE_FILE,
+    )
+
+def load_database():
+    """Database connection pool (per-thread read-only connections, WAL, tuned cache/mmap) and its schema."""
+    pool = ConnectionPool(DB_FILE, max_connections=DB_POOL_SIZE, on_connect=register_functions)
+    with pool.connection() as conn:
+        schema, spatial = detect_schema(conn), has_spatial_index(conn)
+        rollups = schema >= SCHEMA_VERSION and has_rollups(conn)
+    print(f"Connected to SQLite database (pool of {DB_POOL_SIZE}, schema v{schema}).")
+    if schema < SCHEMA_VERSION:
+        print("Legacy text float_id schema detected; run migrate_db.py for indexed lookups.")
+    if schema >= SCHEMA_VERSION and not rollups:
+        print("Rollup tables missing or stale; run migrate_db.py to answer aggregates from them.")
+    return pool, schema, spatial, rollups
+
+def llm_breaker_tripped(cooldown, failures):
+    """Logs each trip; the count is exported as argo_llm_client_total{outcome="breaker_trips"}."""
+    print(f"Warning: LLM circuit breaker open for {cooldown:.0f}s after {failures} failures.")
+
+def load_llm():
+    """The LLM backend (Gemini 2.5 Flash, or the local stub for offline/load testing) behind the rate-limited client."""
+    model = load_model(LLM_BACKEND, GEMINI_API_KEY, "gemini-2.5-flash", sql_fn=lambda q, plot=False: inline_params(*fallback_nl_to_sql(q, plot)))
+    if model is None:
+        return None
+    return LLMClient(model, requests_per_minute=LLM_RPM, tokens_per_minute=LLM_TPM, max_concurrency=LLM_MAX_CONCURRENCY,
+                     max_retries=LLM_MAX_RETRIES, breaker_threshold=LLM_BREAKER_THRESHOLD,
+                     breaker_cooldown=LLM_BREAKER_COOLDOWN, on_trip=llm_breaker_tripped)
 
-# --- Configure Gemini LLM if available and key present (USING GEMINI 2.5 FLASH) ---
-if genai and GEMINI_API_KEY:
+components = Components()
+components.add("database", load_database, default=(None, SCHEMA_VERSION, False, False), required=True)
+components.add("llm", load_llm)
+components.add("faiss", load_faiss)
+components.add("embedding_model", load_embedding_model)
+components.add("retriever", load_retriever)
+
+def get_db_pool():
+    return components.get("database")[0]
+
+def db_schema_version():
+    return components.get("database")[1]
+
+_db_flags = {"checked": None}
+_db_flags_lock = threading.Lock()
+
+def database_flags():
+    """(spatial, rollups): the values found at load time, re-read every DB_RECHECK_SECONDS.
+
+    A bulk ingest into the live database drops the R*Tree and appends past the rollup watermark, then rebuilds
+    both; answering from the load-time flags would query a missing table or return stale aggregates.
+    """
+    pool, schema, spatial, rollups = components.get("database")
+    if pool is None:
+        return spatial, rollups
+    now = time.monotonic()
+    with _db_flags_lock:
+        if _db_flags["checked"] is None:
+            _db_flags.update(checked=now, spatial=spatial, rollups=rollups)
+        recheck = DB_RECHECK_SECONDS > 0 and now - _db_flags["checked"] >= DB_RECHECK_SECONDS
+        if recheck:
+            _db_flags["checked"] = now  # one thread re-reads; the others keep the current flags meanwhile
+        current = (_db_flags["spatial"], _db_flags["rollups"])
+    if not recheck:
+        return current
+    try:
+        with pool.connection() as conn:
+            fresh = (has_spatial_index(conn), schema >= SCHEMA_VERSION and has_rollups(conn))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not re-check the spatial index/rollups: {e}")
+        return current
+    if fresh != current:
+        print(f"Database changed: spatial index {'on' if fresh[0] else 'off'}, rollups {'on' if fresh[1] else 'off'}.")
+    with _db_flags_lock:
+        _db_flags.update(spatial=fresh[0], rollups=fresh[1])
+    return fresh
+
+def has_spatial():
+    return database_flags()[0]
+
+def use_rollups():
+    return database_flags()[1]
+
+def get_model():
+    """The LLM client, or None if it is not configured or still loading (never blocks)."""
+    return components.get_if_ready("llm")
+
+def get_retriever():
+    return components.get_if_ready("retriever")
+
+llm_cache = LLMCache(ttl_seconds=LLM_CACHE_TTL, disk_path=LLM_CACHE_FILE or None)
+
+def generate_text(template, prompt, query, result_hash="", language_code=""):
+    """Calls the model through the content-addressed LLM cache and the shared client (SQL generation is
+    queued ahead of summaries and gives up sooner, since it has a heuristic fallback). API errors and
+    LLMUnavailable propagate to the caller."""
+    key = cache_key(template, query, result_hash, language_code)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    purpose = template.split("/")[0]
+    priority, max_wait = (PRIORITY_SQL, LLM_SQL_MAX_WAIT) if purpose == "sql" else (PRIORITY_SUMMARY, LLM_SUMMARY_MAX_WAIT)
     try:
-        if GEMINI_API_KEY:
-            genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-2.5-flash") # Gemini 2.5 Flash
-        print("Gemini 2.5 Flash model configured successfully.")
+        with metrics.span(f"llm_{purpose}"):
+            resp = get_model().generate(prompt, priority=priority, max_wait=max_wait)
+    except LLMUnavailable:
+        LLM_CALLS.inc(purpose=purpose, outcome="unavailable")
+        raise
     except Exception as e:
-        print(f"Warning initializing Gemini model: {e}")
-        model = None
-else:
-    if not genai:
-        print("google.generativeai library not available; LLM disabled.")
-    if not GEMINI_API_KEY:
-        print("Warning: GEMINI_API_KEY not set. LLM will be disabled.")
-    model = None
+        rate_limited = classify_error(e) == "rate_limited"
+        LLM_CALLS.inc(purpose=purpose, outcome="rate_limited" if rate_limited else "error")
+        raise
+    LLM_CALLS.inc(purpose=purpose, outcome="ok")
+    text = resp.text.strip()
+    if text:
+        llm_cache.put(key, text)
+    return text
 
 # --------------------------
 # Helper: fallback NL->SQL generator 
 # --------------------------
-def fallback_nl_to_sql(query: str):
-    q = query.lower()
-    cols = []
-    
-    is_location_query = "latitude" in q or "longitude" in q or "location" in q or "float id" in q
-    
-    if is_location_query:
-        cols = ["float_id", "date", "latitude", "longitude", "pressure", "temperature", "salinity"]
-    else:
-        for col in ["temperature", "salinity", "pressure", "date", "latitude", "longitude", "cycle_number", "profile_id", "float_id"]:
-            if re.search(rf"\b{col}\b", q):
-                cols.append(col)
-        if not cols:
-            cols = ["float_id", "date", "pressure", "temperature", "salinity", "latitude", "longitude"]
-            
-    select_clause = ", ".join(sorted(list(set(cols))))
-
-    where_clauses = []
-    
-    lat_m = re.search(r"(?:lat|latitude)\s*[:=]?\s*(-?\d+\.?\d*)", q)
-    lon_m = re.search(r"(?:lon|longitude)\s*[:=]?\s*(-?\d+\.?\d*)", q)
-
-    if lat_m and lon_m:
-        lat = float(lat_m.group(1))
-        lon = float(lon_m.group(1))
-        tolerance = 0.5
-        where_clauses.append(f"latitude BETWEEN {lat - tolerance} AND {lat + tolerance}")
-        where_clauses.append(f"longitude BETWEEN {lon - tolerance} AND {lon + tolerance}")
-
-    m_float_id = re.search(r"(?:float\s*(?:id)?\s*[:#]?\s*|float\s*)\s*(\d{1,10})\b", q)
-    if m_float_id:
-        where_clauses.append(f"float_id = {m_float_id.group(1)}")
-    
-    if "equator" in q:
-        where_clauses.append("latitude BETWEEN -1 AND 1")
-    m = re.search(r"latitude\s+between\s+(-?\d+\.?\d*)\s+and\s+(-?\d+\.?\d*)", q)
-    if m:
-        where_clauses.append(f"latitude BETWEEN {m.group(1)} AND {m.group(2)}")
-    m = re.search(r"longitude\s+between\s+(-?\d+\.?\d*)\s+and\s+(-?\d+\.?\d*)", q)
-    if m:
-        where_clauses.append(f"longitude BETWEEN {m.group(1)} AND {m.group(2)}")
-    m = re.search(r"(\d{4}[-/]\d{1,2}[-/]\d{1,2}).(?:to|and|through).(\d{4}[-/]\d{1,2}[-/]\d{1,2})", q)
-    if m:
-        where_clauses.append(f"date BETWEEN '{m.group(1)}' AND '{m.group(2)}'")
-    
-    agg = None
-    m = re.search(r"\b(avg|average|mean|max|min|count)\b\s+of\s+(\w+)", q)
-    if m:
-        op = m.group(1)
-        col = m.group(2)
-        if op in ("avg", "average", "mean"):
-            agg = f"AVG({col}) as avg_{col}"
-        elif op == "max":
-            agg = f"MAX({col}) as max_{col}"
-        elif op == "min":
-            agg = f"MIN({col}) as min_{col}"
-        elif op == "count":
-            agg = f"COUNT({col}) as count_{col}"
-            
-    m = re.search(r"\blimit\s+(\d{1,4})\b", q)
-    limit_clause = f" LIMIT {m.group(1)}" if m else " LIMIT 100"
-    base_from = "argo_profiles JOIN argo_metadata USING(float_id)"
-    
-    order_clause = ""
-    
-    if m_float_id and not agg and is_location_query:
-        order_clause = " ORDER BY date DESC"
-        limit_clause = " LIMIT 1" 
-    
-    if agg:
-        sql = f"SELECT {agg} FROM {base_from}"
-    else:
-        sql = f"SELECT {select_clause} FROM {base_from}"
-        
-    if where_clauses:
-        sql += " WHERE " + " AND ".join(where_clauses)
-    
-    if lat_m and lon_m:
-         sql += f" ORDER BY (latitude - {lat})(latitude - {lat}) + (longitude - {lon})(longitude - {lon})"
-         
-    sql += order_clause + limit_clause + ";"
-    return sql
+def fallback_nl_to_sql(query: str, plot=False):
+    """Heuristic SQL as (sql, params): a fixed parameterized template plus the extracted values."""
+    return compile_query(query, legacy=db_schema_version() < SCHEMA_VERSION, has_spatial=has_spatial(),
+                         has_rollups=use_rollups(), for_plot=plot,
+                         default_limit=PLOT_ROW_LIMIT if plot else DEFAULT_LIMIT)
 # --------------------------
 
 # --------------------------
-# RAG retrieval (DISABLED for performance and stability)
+# RAG retrieval (cached + batched embeddings, skipped when over RAG_BUDGET_MS)
 # --------------------------
-def retrieve_relevant_floats(query_text, k=3):
-    return [] 
-    
+def retrieve_relevant_floats(query_text, k=RAG_TOP_K):
+    started = time.monotonic()  # the budget covers getting the retriever too
+    retriever = get_retriever()
+    if retriever is None:
+        if not components.loaded("retriever"):
+            print("RAG retrieval skipped: retriever still loading.")
+        return []
+    try:
+        with metrics.span("retrieval"):
+            return retriever.retrieve(query_text, k, started=started)
+    except Exception as e:
+        print(f"RAG retrieval error: {e}")
+        return []
+
+def build_context(hits):
+    """Formats retrieved float metadata as prompt context for the SQL generator."""
+    return "\n".join(f"- float_id {hit.get('float_id')}: {hit.get('summary', '')}" for hit in hits)
+
 # --------------------------
 # Natural language to SQL (LLM first, fallback to heuristics)
 # --------------------------
-def natural_language_to_sql(query, context):
-    db_schema = """
+LEGACY_SQL_SCHEMA = """
     Table: argo_profiles (profile_id, float_id, cycle_number, latitude, longitude, date, pressure, temperature, salinity)
     Table: argo_metadata (float_id, platform_type, country, deployment_date)
     """
+LEGACY_SQL_RULES = """IMPORTANT:
+- The column float_id is stored as text in the format b'123456 ' (with b'' prefix and a trailing space).
+- Always generate WHERE float_id = "b'<number> '"
+- Example: SELECT * FROM argo_profiles WHERE float_id = "b'1900121 '";
+"""
+SQL_SCHEMA = """
+    Table: argo_profiles (profile_id, float_id INTEGER, cycle_number, latitude, longitude, date TEXT 'YYYY-MM-DD HH:MM:SS', date_epoch INTEGER, pressure, temperature, salinity)
+    Table: argo_metadata (float_id INTEGER PRIMARY KEY, platform_type, country, deployment_date)
+    Indexes: argo_profiles(float_id, date), argo_profiles(date), argo_profiles(latitude, longitude)
+    """
+SQL_RULES = """IMPORTANT:
+- float_id is an INTEGER. Example: SELECT * FROM argo_profiles WHERE float_id = 1900121;
+- Only join argo_metadata when platform_type, country or deployment_date are needed.
+- Filter dates with ISO strings, e.g. date BETWEEN '2019-01-01' AND '2019-12-31 23:59:59'.
+- Only add a LIMIT when the user asks for a number of rows; the server pages large results.
+"""
+
+def normalize_float_id_literals(sql, legacy):
+    """Rewrites float_id comparisons to the storage format: b'number ' text (legacy) or a bare integer."""
+    if legacy:
+        return re.sub(r"""float_id\s*=\s*(?:'(\d+)'|"(\d+)"|(\d+)\b)""",
+                      lambda m: f'float_id = "b\'{next(g for g in m.groups() if g)} \'"', sql)
+    return re.sub(r"""float_id\s*=\s*(?:"b'(\d+)\s*'"|'b'(\d+)\s*''|'(\d+)'|"(\d+)")""",
+                  lambda m: f"float_id = {next(g for g in m.groups() if g)}", sql)
+
+PLOT_SQL_RULES = """- Select profile_id, float_id and pressure along with the measured variables, and do not add a LIMIT
+  (the server downsamples every profile for plotting).
+"""
+
+def natural_language_to_sql(query, context, plot=False):
+    """Returns (sql, params): LLM SQL has no params; the heuristic fallback is fully parameterized."""
+    schema = db_schema_version()
+    legacy = schema < SCHEMA_VERSION
+    db_schema = LEGACY_SQL_SCHEMA if legacy else SQL_SCHEMA
     prompt = f"""
 You are a professional SQL generator for SQLite. Use the schema below and the context to create a single SELECT statement.
 Schema:
@@ -234,82 +376,224 @@ Context:
 User question:
 \"\"\"{query}\"\"\" 
 Only output a single SELECT statement (no explanation).
-IMPORTANT:
-- The column float_id is stored as text in the format b'123456 ' (with b'' prefix and a trailing space).
-- Always generate WHERE float_id = "b'<number> '"
-- Example: SELECT * FROM argo_profiles WHERE float_id = "b'1900121 '";
-"""
+{LEGACY_SQL_RULES if legacy else SQL_RULES}{PLOT_SQL_RULES if plot else ""}"""
 
     generated = None
-    if model:
+    fallback_reason = "no_llm" if components.loaded("llm") else "llm_loading"
+    if get_model():
         try:
-            resp = model.generate_content(prompt)
-            generated = resp.text.strip()
+            generated = generate_text(f"sql/schema{schema}{'/plot' if plot else ''}", prompt, query, content_hash(context))
             print("LLM raw response:", generated)
             for t in ["sql", "", "`"]:
                 generated = generated.replace(t, "")
             generated = generated.strip().rstrip(";")
+        except LLMUnavailable as e:
+            print(f"LLM unavailable for SQL generation ({e}). Falling back to heuristic.")
+            fallback_reason = "llm_unavailable"
         except Exception as e:
             print(f"LLM API error during SQL generation: {e}. Falling back to heuristic.")
+            fallback_reason = "llm_error"
+        else:
+            fallback_reason = "not_select"
 
     if not generated or not generated.lower().startswith("select"):
-        generated = fallback_nl_to_sql(query)
-        print("Using fallback SQL:", generated)
+        SQL_FALLBACKS.inc(reason=fallback_reason)
+        with metrics.span("fallback_sql"):
+            sql, params = fallback_nl_to_sql(query, plot)
+        print("Using fallback SQL:", sql, params)
+        return sql, params
 
-    # --- FIX: Rewrite float_id matches into b'number ' format ---
-    def fix_float_id(match):
-        num = match.group(1)
-        return f'float_id = "b\'{num} \'"'
+    generated = normalize_float_id_literals(generated, legacy)
+    rejected = plan_rejection(generated)
+    if rejected:
+        # Rewrite rather than refuse: the heuristic compiler only emits index-backed shapes.
+        print(f"Rejected LLM SQL ({rejected}); using heuristic SQL instead.")
+        SQL_FALLBACKS.inc(reason="plan_rejected")
+        with metrics.span("fallback_sql"):
+            return fallback_nl_to_sql(query, plot)
+    if plot:
+        missing = missing_plot_columns(result_columns(generated) or ())
+        if missing:
+            # Rows without profile keys cannot be downsampled; the heuristic plot SQL always selects them.
+            print(f"LLM plot SQL does not select {', '.join(missing)}; using heuristic plot SQL instead.")
+            SQL_FALLBACKS.inc(reason="plot_columns")
+            with metrics.span("fallback_sql"):
+                return fallback_nl_to_sql(query, plot)
 
-    generated = re.sub(r"float_id\s*=\s*'(\d+)'", fix_float_id, generated)
-    generated = re.sub(r'float_id\s*=\s*"(\d+)"', fix_float_id, generated)
+    return generated.strip().rstrip(";") + ";", ()
 
-    return generated.strip() + ";"
 
+def result_columns(sql_query, params=()):
+    """Column names the SELECT would return (prepared with LIMIT 0, nothing is read), or None if it fails."""
+    db_pool = get_db_pool()
+    if db_pool is None:
+        return None
+    try:
+        with db_pool.connection() as conn:
+            cursor = conn.execute(f"SELECT * FROM ({sql_query.strip().rstrip(';')}) LIMIT 0", params)
+            return [desc[0] for desc in cursor.description]
+    except sqlite3.Error:
+        return None  # invalid SQL is reported when it runs
 
-def execute_and_synthesize_response(sql_query, user_query, language_code):
-    if not db_connection:
-        return {"summary": "Server DB not available.", "data": []}
-    if not sql_query:
-        return {"summary": "Sorry, could not create a valid SQL query.", "data": []}
-    if not sql_query.strip().lower().startswith("select"):
-        return {"summary": "Only SELECT queries are allowed.", "data": []}
+
+def plan_rejection(sql_query, params=()):
+    """Why the query's plan is too expensive to run (full scan + sort, nested full scan), or None."""
+    db_pool = get_db_pool()
+    if db_pool is None:
+        return None
     try:
-        if "limit" not in sql_query.lower():
-            sql_query = sql_query.rstrip(";") + " LIMIT 500;"
-        cursor = db_connection.cursor()
-        cursor.execute(sql_query)
+        with db_pool.connection() as conn:
+            query_guard.check_plan(conn, sql_query, params)
+    except QueryRejected as e:
+        return str(e)
+    except sqlite3.Error:
+        return None  # invalid SQL is reported when it runs
+    return None
+
+
+def run_select(sql_query, params=()):
+    """Executes a SELECT and returns (column names, rows), served from the result cache when possible."""
+    if result_cache is not None:
+        cached = result_cache.get(sql_query, params)
+        if cached is not None:
+            return cached
+        version = result_cache.db_version()
+    with metrics.span("sql_execute"), get_db_pool().connection() as conn, query_guard.deadline(conn):
+        cursor = conn.execute(sql_query, params)
         rows = cursor.fetchall()
         col_names = [desc[0] for desc in cursor.description] if cursor.description else []
-        rows_as_dicts = [dict(zip(col_names, row)) for row in rows]
-        results_str = str(rows_as_dicts)
-        if len(results_str) > 2000:
-            results_str = results_str[:2000] + "..."
-        
-        summary_text = f"Returned {len(rows_as_dicts)} rows."
-        
-        if model:
-            try:
-                prompt = f"""
+    if result_cache is not None:
+        result_cache.put(sql_query, col_names, rows, version=version, params=params)
+    return col_names, rows
+
+
+def summarize_rows(results_str, row_count, user_query, language_code):
+    """Asks the LLM to summarize a (truncated) result preview; falls back to a row count message."""
+    summary_text = f"Returned {row_count} rows."
+    
+    if get_model():
+        try:
+            prompt = f"""
 The user asked: "{user_query}"
 The SQL query returned the following rows:\n{results_str}\nPlease summarize briefly and respond only in the language with ISO code: {language_code}.
 """
-                resp = model.generate_content(prompt)
-                summary_text = resp.text.strip()
-                
-                if not summary_text:
-                    summary_text = f"Returned {len(rows_as_dicts)} rows (LLM returned empty response)."
-            except Exception as e:
-                print(f"LLM summarization error: {e}")
-                
-                if "quota" in str(e).lower() or "429" in str(e):
-                     summary_text = f"Returned {len(rows_as_dicts)} rows. LLM Quota Exceeded (429). Please check your API usage limits."
-                else:
-                    summary_text = f"Returned {len(rows_as_dicts)} rows (LLM summary failed: {e})."
-        else:
-            summary_text += " (No LLM configured.)"
+            summary_text = generate_text("summary/v1", prompt, user_query, content_hash(results_str), language_code)
+            
+            if not summary_text:
+                summary_text = f"Returned {row_count} rows (LLM returned empty response)."
+        except LLMUnavailable as e:
+            print(f"LLM unavailable for summarization: {e}")
+            summary_text = f"Returned {row_count} rows. The summarizer is busy right now; please try again shortly."
+        except Exception as e:
+            print(f"LLM summarization error: {e}")
             
-        return {"summary": summary_text, "data": rows_as_dicts}
+            if classify_error(e) == "rate_limited":
+                 summary_text = f"Returned {row_count} rows. LLM Quota Exceeded (429). Please check your API usage limits."
+            else:
+                summary_text = f"Returned {row_count} rows (LLM summary failed: {e})."
+    else:
+        summary_text += " (No LLM configured.)" if components.loaded("llm") else " (LLM still loading.)"
+    return summary_text
+
+
+def results_preview(col_names, rows, max_chars=2000):
+    """str() of the leading rows as dicts, truncated for the summary prompt (no full dict conversion)."""
+    preview, length = [], 0
+    for row in rows:
+        if length > max_chars:
+            break
+        row_dict = dict(zip(col_names, row))
+        preview.append(row_dict)
+        length += len(str(row_dict)) + 2
+    results_str = str(preview)
+    if len(results_str) > max_chars:
+        results_str = results_str[:max_chars] + "..."
+    return results_str
+
+
+def downsample_for_plot(col_names, rows, plot):
+    """The "plot" payload for rows under the given plot options, or None if they cannot be plotted."""
+    if not plot:
+        return None
+    with metrics.span("downsample"):
+        return downsample_profiles(col_names, rows, max_profiles=PLOT_MAX_PROFILES, max_bins=PLOT_MAX_POINTS, **plot)
+
+
+def synthesize_response(col_names, rows, user_query, language_code, result_format="rows", async_summary=False,
+                        plot_payload=None):
+    """Builds the {"summary", "data"} payload for a result set, asking the LLM for the summary.
+
+    With async_summary the LLM call is queued on summary_jobs and the payload carries a summary_id
+    to poll at /api/summary/<id>; if the queue is full the summary is produced inline as before.
+    A plot_payload (see downsample_for_plot) is returned under "plot" instead of the rows under "data".
+    """
+    ROWS_RETURNED.inc(len(rows), path="query")
+    results_str = results_preview(col_names, rows)
+    summary_id = None
+    if async_summary and get_model():
+        summary_id = summary_jobs.submit(summarize_rows, results_str, len(rows), user_query, language_code)
+    if summary_id:
+        summary_text = f"Returned {len(rows)} rows. Summary pending."
+    else:
+        with metrics.span("summarize"):
+            summary_text = summarize_rows(results_str, len(rows), user_query, language_code)
+    if plot_payload is not None:
+        resp = {"summary": summary_text, "plot": plot_payload}
+    else:
+        with metrics.span("encode"):
+            resp = {"summary": summary_text, "data": encode_result(col_names, rows, result_format, summary_text)}
+    if summary_id:
+        resp["summary_id"] = summary_id
+        resp["summary_status"] = "pending"
+    return resp
+
+
+def execute_and_synthesize_response(sql_query, user_query, language_code, result_format="rows", async_summary=False,
+                                    params=(), plot=None, cursor=None):
+    """Runs the SELECT and builds the response. Plain single-table row queries are served in keyset pages
+    of QUERY_PAGE_SIZE rows: the response carries "next_cursor" (None on the last page), which the client
+    sends back as "cursor" with the same question. Raises CursorError for a cursor of another query.
+    Plot queries read up to PLOT_ROW_LIMIT rows to downsample; if those rows cannot be plotted, the query
+    is answered like any other (paged, or capped at QUERY_PAGE_SIZE rows) rather than with raw rows."""
+    if not get_db_pool():
+        return {"summary": "Server DB not available.", "data": []}
+    if not sql_query:
+        return {"summary": "Sorry, could not create a valid SQL query.", "data": []}
+    if not sql_query.strip().lower().startswith("select"):
+        return {"summary": "Only SELECT queries are allowed.", "data": []}
+    try:
+        if plot and not cursor:
+            plot_sql = sql_query if "limit" in sql_query.lower() else sql_query.rstrip(";") + f" LIMIT {PLOT_ROW_LIMIT};"
+            col_names, rows = run_select(plot_sql, params)
+            plot_payload = downsample_for_plot(col_names, rows, plot)
+            if plot_payload is not None:
+                return synthesize_response(col_names, rows, user_query, language_code, result_format, async_summary,
+                                           plot_payload)
+            print("Plot query rows cannot be downsampled; returning paged rows instead.")
+        page = paginate(sql_query, params, QUERY_PAGE_SIZE, cursor)
+        if page is None and cursor:
+            raise CursorError("this query has no further pages")
+        if page is not None:
+            page_sql, page_params, key_count, page_limit, seen = page
+            col_names, rows = run_select(page_sql, page_params)
+            col_names, rows, next_cursor = split_page(sql_query, params, col_names, rows, key_count, page_limit, seen)
+        elif plot:
+            # Not pageable (and possibly carrying the plot-sized LIMIT): cap it at one page.
+            col_names, rows = run_select(f"SELECT * FROM ({sql_query.strip().rstrip(';')}) LIMIT {QUERY_PAGE_SIZE};", params)
+        else:
+            if "limit" not in sql_query.lower():
+                sql_query = sql_query.rstrip(";") + f" LIMIT {QUERY_PAGE_SIZE};"
+            col_names, rows = run_select(sql_query, params)
+        resp = synthesize_response(col_names, rows, user_query, language_code, result_format, async_summary)
+        if page is not None:
+            resp["next_cursor"] = next_cursor
+        return resp
+    except CursorError:
+        raise
+    except QueryTimeout as e:
+        print(f"Query interrupted: {e}")
+        return {"summary": f"The query took too long ({e}). Try narrowing it to a float, date range or region.",
+                "data": []}
     except sqlite3.OperationalError as e:
         print(f"SQLite OperationalError: {e}")
         return {"summary": "Database error (invalid SQL or schema mismatch).", "data": []}
@@ -320,12 +604,162 @@ The SQL query returned the following rows:\n{results_str}\nPlease summarize brie
 # --------------------------
 # High-level handler and routes
 # --------------------------
-def handle_query(user_query, language_code):
-    context = "" 
-    sql_query = natural_language_to_sql(user_query, context)
+NEAREST_RE = re.compile(r"\b(?:near|nearest|closest|around|close to)\b")
+
+def parse_nearest_request(user_query):
+    """Returns (lat, lon, k, group_by) for "floats near lat X lon Y" style questions, else None.
+
+    group_by is "profile_id" when the question asks for profiles, None for measurements/rows, and
+    "float_id" otherwise (k distinct floats).
+    """
+    q = user_query.lower()
+    if not NEAREST_RE.search(q):
+        return None
+    lat_m = re.search(r"(?:lat|latitude)\s*[:=]?\s*(-?\d+\.?\d*)", q)
+    lon_m = re.search(r"(?:lon|longitude)\s*[:=]?\s*(-?\d+\.?\d*)", q)
+    if not (lat_m and lon_m):
+        return None
+    m = re.search(r"\b(?:limit|top|nearest)\s+(\d{1,4})\b", q)
+    if re.search(r"\bprofiles?\b", q):
+        group_by = "profile_id"
+    elif re.search(r"\b(?:measurements?|rows?|readings?|observations?)\b", q):
+        group_by = None
+    else:
+        group_by = "float_id"
+    return float(lat_m.group(1)), float(lon_m.group(1)), int(m.group(1)) if m else 10, group_by
+
+def handle_nearest_query(user_query, language_code, lat, lon, k, group_by="float_id", result_format="rows",
+                         async_summary=False, plot=None):
+    """k-nearest floats/profiles via the R*Tree, skipping SQL generation entirely."""
+    try:
+        with metrics.span("nearest"), get_db_pool().connection() as conn:
+            col_names, rows = nearest_profiles(conn, lat, lon, k, group_by=group_by)
+        return synthesize_response(col_names, rows, user_query, language_code, result_format, async_summary,
+                                   downsample_for_plot(col_names, rows, plot))
+    except sqlite3.Error as e:
+        print(f"Nearest-neighbour query error: {e}")
+        return None
+
+def handle_query(user_query, language_code, result_format="rows", async_summary=False, plot=None, cursor=None):
+    nearest = parse_nearest_request(user_query) if has_spatial() and not cursor else None
+    if nearest:
+        resp = handle_nearest_query(user_query, language_code, *nearest, result_format=result_format,
+                                    async_summary=async_summary, plot=plot)
+        if resp is not None:
+            return resp
+    context = build_context(retrieve_relevant_floats(user_query))
+    sql_query, params = natural_language_to_sql(user_query, context, plot=bool(plot))
     if not sql_query:
         return {"summary": "I couldn't generate a valid SQL query from your question. Try rephrasing.", "data": []}
-    return execute_and_synthesize_response(sql_query, user_query, language_code)
+    return execute_and_synthesize_response(sql_query, user_query, language_code, result_format, async_summary, params,
+                                           plot, cursor)
+
+def parse_plot_options(raw):
+    """{"plot": true} or {"plot": {"mode": "bins"|"lttb", "points": N, "bin_dbar": W}} -> kwargs (ValueError if bad)."""
+    if not raw:
+        return None
+    options = raw if isinstance(raw, dict) else {}
+    mode = options.get("mode", "bins")
+    if mode not in PLOT_MODES:
+        raise ValueError(f"plot mode must be one of {', '.join(PLOT_MODES)}")
+    points = int(options.get("points", PLOT_DEFAULT_POINTS))
+    if not 3 <= points <= PLOT_MAX_POINTS:
+        raise ValueError(f"plot points must be between 3 and {PLOT_MAX_POINTS}")
+    bin_dbar = options.get("bin_dbar")
+    if bin_dbar is not None:
+        bin_dbar = float(bin_dbar)
+        if not PLOT_MIN_BIN_DBAR <= bin_dbar < float("inf"):
+            raise ValueError(f"plot bin_dbar must be a number of at least {PLOT_MIN_BIN_DBAR}")
+    return {"mode": mode, "points": points, "bin_dbar": bin_dbar}
+
+# --------------------------
+# Streaming /api/query (opt in with "Accept: application/x-ndjson" or "Accept: text/event-stream")
+# --------------------------
+def stream_rows(sql_query, params=()):
+    """Yields column names, then row batches straight from the cursor (or the result cache)."""
+    if result_cache is not None:
+        cached = result_cache.get(sql_query, params)
+        if cached is not None:
+            col_names, rows = cached
+            yield col_names
+            for i in range(0, len(rows), STREAM_BATCH_SIZE):
+                yield rows[i:i + STREAM_BATCH_SIZE]
+            return
+    with get_db_pool().connection() as conn:
+        with query_guard.deadline(conn):
+            cursor = conn.execute(sql_query, params)
+        yield [desc[0] for desc in cursor.description] if cursor.description else []
+        while True:
+            with query_guard.deadline(conn):  # per batch: time spent waiting on the client is not counted
+                batch = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not batch:
+                break
+            yield batch
+
+def query_events(user_query, language_code):
+    """Generator of (event, payload) pairs: columns, rows (one per batch), then summary or error."""
+    nearest = parse_nearest_request(user_query) if has_spatial() else None
+    db_pool = get_db_pool()
+    if not db_pool:
+        yield "error", {"summary": "Server DB not available."}
+        return
+    try:
+        if nearest:
+            with db_pool.connection() as conn:
+                col_names, rows = nearest_profiles(conn, *nearest)
+            batches = iter([col_names, rows])
+        else:
+            sql_query, params = natural_language_to_sql(user_query, build_context(retrieve_relevant_floats(user_query)))
+            if not sql_query or not sql_query.strip().lower().startswith("select"):
+                yield "error", {"summary": "Sorry, could not create a valid SQL query."}
+                return
+            if "limit" not in sql_query.lower():
+                sql_query = sql_query.rstrip(";") + f" LIMIT {STREAM_ROW_LIMIT};"
+            batches = stream_rows(sql_query, params)
+
+        col_names = next(batches)
+        yield "columns", {"columns": col_names}
+        # Keep only enough rows to build the 2000-char summary preview; everything else is streamed out.
+        preview, preview_len, row_count = [], 0, 0
+        for batch in batches:
+            rows_as_dicts = [dict(zip(col_names, row)) for row in batch]
+            row_count += len(rows_as_dicts)
+            for row in rows_as_dicts:
+                if preview_len > 2000:
+                    break
+                preview.append(row)
+                preview_len += len(str(row)) + 2
+            yield "rows", {"rows": rows_as_dicts}
+    except QueryTimeout as e:
+        print(f"Query interrupted: {e}")
+        yield "error", {"summary": f"The query took too long ({e})."}
+        return
+    except sqlite3.OperationalError as e:
+        print(f"SQLite OperationalError: {e}")
+        yield "error", {"summary": "Database error (invalid SQL or schema mismatch)."}
+        return
+
+    ROWS_RETURNED.inc(row_count, path="stream")
+    results_str = str(preview)
+    if len(results_str) > 2000:
+        results_str = results_str[:2000] + "..."
+    yield "summary", {"summary": summarize_rows(results_str, row_count, user_query, language_code), "row_count": row_count}
+
+def format_ndjson(events):
+    for event, payload in events:
+        yield json.dumps({"event": event, **payload}, default=str) + "\n"
+
+def format_sse(events):
+    for event, payload in events:
+        yield f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+def requested_stream_format():
+    accept = request.headers.get("Accept", "")
+    if "text/event-stream" in accept:
+        return "text/event-stream"
+    if "application/x-ndjson" in accept:
+        return "application/x-ndjson"
+    return None
 
 @app.route("/api/query", methods=["POST"])
 def process_query():
@@ -339,9 +773,57 @@ def process_query():
     if not user_query or not isinstance(user_query, str):
         return jsonify({"summary": "No query provided or query not a string.", "data": []}), 400
     
-    resp = handle_query(user_query, language_code)
+    stream_format = requested_stream_format()
+    if stream_format:
+        events = query_events(user_query, language_code)
+        body = format_sse(events) if stream_format == "text/event-stream" else format_ndjson(events)
+        return Response(body, mimetype=stream_format, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    
+    # "data" encoding: per-row dicts (default), columnar JSON, or packed/Arrow binary.
+    result_format = negotiate_format(request.headers.get("Accept"), payload.get("format"))
+    # Deferred summary: opt in with {"async_summary": true} or "Prefer: respond-async".
+    async_summary = bool(payload.get("async_summary", ASYNC_SUMMARY_DEFAULT)) or \
+        "respond-async" in request.headers.get("Prefer", "")
+    # Plot mode: profiles downsampled server-side to about "points" points each (see parse_plot_options).
+    try:
+        plot = parse_plot_options(payload.get("plot"))
+    except (TypeError, ValueError) as e:
+        return jsonify({"summary": f"Invalid plot options: {e}", "data": []}), 400
+    # Next page of a paged result: {"cursor": <next_cursor from the previous response>} with the same query.
+    cursor = payload.get("cursor")
+    if cursor is not None and not isinstance(cursor, str):
+        return jsonify({"summary": "cursor must be a string.", "data": []}), 400
+    # Identical concurrent questions (e.g. a popular shared link) run once and share the response. Deferred
+    # summaries live in this worker's job table, so those responses are only shared within the worker.
+    key = coalesce_key(user_query, language_code, result_format, async_summary, plot, cursor)
+    try:
+        resp = coalescer.do(key, lambda: handle_query(user_query, language_code, result_format, async_summary,
+                                                      plot, cursor), share=not async_summary)
+    except CursorError as e:
+        return jsonify({"summary": f"Invalid cursor: {e}", "data": []}), 400
+    except CoalesceTimeout:
+        return jsonify({"summary": "This question is already being answered; please try again shortly.",
+                        "data": []}), 503
+    if isinstance(resp.get("data"), bytes):
+        headers = {"X-Summary-Id": resp["summary_id"]} if resp.get("summary_id") else {}
+        if resp.get("next_cursor"):
+            headers["X-Next-Cursor"] = resp["next_cursor"]
+        return Response(resp["data"], mimetype=MIMETYPES[result_format], headers=headers or None)
     return jsonify(resp)
 
+@app.route("/api/summary/<summary_id>", methods=["GET"])
+def fetch_summary(summary_id):
+    """Deferred summary lookup; ?wait=N long-polls up to N seconds (capped at SUMMARY_MAX_WAIT)."""
+    try:
+        wait = min(float(request.args.get("wait", 0)), SUMMARY_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    job = summary_jobs.get(summary_id, wait=wait)
+    if job is None:
+        return jsonify({"error": "Summary ID not found or expired."}), 404
+    status_code = 202 if job["status"] == "pending" else 200
+    return jsonify({"summary_id": summary_id, **job}), status_code
+
 @app.route("/api/test", methods=["GET"])
 def api_test():
     sample = [
@@ -351,15 +833,109 @@ def api_test():
     ]
     return jsonify({"summary": "This is a test response with sample float data.", "data": sample})
 
+# --------------------------
+# Request timing, Server-Timing and /metrics
+# --------------------------
+def cache_counts(field):
+    caches = (("result", result_cache), ("llm", llm_cache), ("qr", qr_renderer))
+    stats = {name: cache.stats() for name, cache in caches if cache is not None}
+    return {name: s[field] for name, s in stats.items() if field in s}
+
+def component_load_seconds():
+    return {name: s["load_ms"] / 1000 for name, s in components.status().items() if s["load_ms"] is not None}
+
+metrics.collector("argo_cache_hits_total", "Cache hits by cache.", lambda: cache_counts("hits"), "cache")
+metrics.collector("argo_cache_misses_total", "Cache misses by cache.", lambda: cache_counts("misses"), "cache")
+metrics.collector("argo_query_guard_total", "Generated queries plan-checked, rejected and interrupted.",
+                  lambda: {k: v for k, v in query_guard.stats().items() if k != "timeout_ms"}, "outcome")
+def llm_client_counts():
+    # Read the client only once something else has loaded it: a scrape must never trigger the LLM load.
+    client = components.get("llm") if components.loaded("llm") else None
+    if client is None:
+        return {}
+    return {k: v for k, v in client.stats().items() if isinstance(v, int) and k not in ("in_flight", "queued")}
+
+metrics.collector("argo_llm_client_total", "LLM client calls, retries and refusals by outcome.",
+                  llm_client_counts, "outcome")
+metrics.collector("argo_coalesced_requests_total", "Query requests by single-flight role and outcome.",
+                  lambda: {k: v for k, v in coalescer.stats().items() if k not in ("in_flight", "shared_dir")}, "role")
+metrics.collector("argo_component_load_seconds", "Time taken to load each lazy component.",
+                  component_load_seconds, "component", metric_type="gauge")
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def record_request_timing(response):
+    spans = metrics.finish_request()
+    start = g.get("request_start")
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    if SERVER_TIMING:
+        timing = server_timing(spans)
+        response.headers["Server-Timing"] = (timing + ", " if timing else "") + f"total;dur={elapsed * 1000:.1f}"
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# --------------------------
+# Health, readiness and warm-up
+#   /healthz: process is up (never loads anything)
+#   /readyz:  the database is usable; optional components (LLM, FAISS, embeddings) are reported, not awaited
+#   /api/warmup: loads every component now and reports per-component load times
+# --------------------------
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    ready = components.ready(load=True)  # blocks on the required database only
+    status = components.status()
+    if not all(c["loaded"] for c in status.values()):
+        components.warm_up()
+    body = {"status": "ready" if ready else "unavailable", "warming_up": components.warming_up(),
+            "components": status}
+    return jsonify(body), 200 if ready else 503
+
+@app.route("/api/warmup", methods=["POST"])
+def warmup():
+    return jsonify({"components": components.load()})
+
+@app.route("/api/stats", methods=["GET"])
+def api_stats():
+    """Connection pool, cache and component load statistics for this worker."""
+    db_pool = components.get_if_ready("database", (None,))[0]
+    vector_index = components.get_if_ready("faiss")
+    llm_client = get_model()
+    return jsonify({
+        "components": components.status(),
+        "db_pool": db_pool.stats() if db_pool else None,
+        "result_cache": result_cache.stats() if result_cache else None,
+        "llm_cache": llm_cache.stats(),
+        "summary_jobs": summary_jobs.stats(),
+        "qr": qr_renderer.stats(),
+        "sql_compiler": compiler_stats(),
+        "vector_index": vector_index.stats() if vector_index else None,
+        "query_guard": query_guard.stats(),
+        "coalescing": coalescer.stats(),
+        "llm_client": llm_client.stats() if llm_client else None,
+    })
+
 # --------------------------
 # History Fetch Endpoint (For fetching chat history by ID)
 # --------------------------
 @app.route("/api/history/<history_id>", methods=["GET"])
 def fetch_history(history_id):
     """Fetches chat history using a unique ID."""
-    global history_store
-    
-    history = history_store.get(history_id)
+    history = history_store.get(history_id) if history_store is not None else None
     if history:
         return jsonify({"history": history}), 200
     else:
@@ -378,7 +954,7 @@ def resummarize_message():
     data_list = payload.get("data", [])
     language_code = payload.get("language", "en")
 
-    if not model or not user_query or not data_list:
+    if not get_model() or not user_query or not data_list:
         return jsonify({"summary": "Translation skipped: LLM not available or missing data.", "data": data_list}), 200
 
     results_str = str(data_list)
@@ -392,13 +968,16 @@ The SQL query returned the following rows:
 {results_str}
 Please summarize briefly, translating the context of the data and response to the language with ISO code: {language_code}. Do not include the data itself in the response.
 """
-        resp = model.generate_content(prompt)
-        summary_text = resp.text.strip()
+        summary_text = generate_text("resummarize/v1", prompt, user_query, content_hash(results_str), language_code)
         
         if not summary_text:
             summary_text = f"Translation to {language_code} failed (LLM returned empty response)."
             
         return jsonify({"summary": summary_text, "data": data_list})
+    except LLMUnavailable as e:
+        retry_after = str(math.ceil(e.retry_after)) if e.retry_after else "5"
+        return jsonify({"summary": "Translation skipped: the LLM is busy right now; please retry shortly.",
+                        "data": data_list}), 503, {"Retry-After": retry_after}
     except Exception as e:
         print(f"LLM resummarization error: {e}")
         return jsonify({"summary": f"Translation failed due to LLM error: {e}", "data": data_list}), 500
@@ -409,8 +988,6 @@ Please summarize briefly, translating the context of the data and response to th
 # --------------------------
 @app.route("/api/qr_code", methods=["POST"])
 def generate_qr():
-    global history_store
-    
     try:
         payload = request.get_json(silent=True)
         chat_history = payload.get("history", [])
@@ -421,80 +998,33 @@ def generate_qr():
         # 1. Generate a unique ID for this chat session
         history_id = str(uuid.uuid4())
 
-        # 2. Store the full history in the in-memory store and file
-        history_store[history_id] = chat_history
-        save_history_store() # Persist the store
-        
-        # 3. Construct the minimal URL using only the history_id
-        frontend_url = request.host_url.replace(":5000", ":8501")
-        qr_url = f"{frontend_url}?history_id={history_id}" # Pass ID instead of data!
-
-        # 4. Generate the QR code for the short ID URL
-        qr = qrcode.QRCode(
-            version=None,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10, 
-            border=5
-        )
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        
-        if qr.version is None or qr.version > 40:
-             return jsonify({"error": f"Internal Error: QR URL encoding failed (required version {qr.version})."}), 500
-
-
-        img = qr.make_image(fill_color="black", back_color="white")
+        # 2. Store the full history (single-row insert, shared across workers)
+        if history_store is None:
+            return jsonify({"error": "History store not available."}), 500
+        history_store.put(chat_history, history_id)
         
-        buf = BytesIO()
-        img.save(buf)
-        buf.seek(0)
-        
-        return send_file(buf, mimetype="image/png")
+        # 3. Render (and cache) the QR for the short ID URL; GET /api/qr/<history_id> serves it again
+        return qr_response(qr_renderer, history_qr_url(history_id), fmt=payload.get("format", "png"))
+    except ValueError as e:
+        return jsonify({"error": f"Internal Error: {e}"}), 500
     except Exception as e:
         print(f"QR Code generation error: {e}")
         return jsonify({"error": str(e)}), 500
 
-# --------------------------
-# ROUTE INFORMATION HELPERS
-# --------------------------
+def history_qr_url(history_id):
+    """Minimal share URL carrying only the history_id (the frontend fetches the rest)."""
+    frontend_url = request.host_url.replace(":5000", ":8501")
+    return f"{frontend_url}?history_id={history_id}" # Pass ID instead of data!
 
-def calculate_haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculates the Great-Circle distance between two points in kilometers."""
-    R = 6371.0 
-    
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-    
-    a = math.sin(dlat / 2)*2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)*2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    distance = R * c
-    return round(distance, 2)
-
-def calculate_initial_bearing(lat1, lon1, lat2, lon2):
-    """Calculates the initial bearing (compass direction) from point 1 to point 2."""
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    y = math.sin(lon2_rad - lon1_rad) * math.cos(lat2_rad)
-    x = math.cos(lat1_rad) * math.sin(lat2_rad) - math.sin(lat1_rad) * math.cos(lat2_rad) * math.cos(lon2_rad - lon1_rad)
-    
-    bearing_rad = math.atan2(y, x)
-    
-    bearing_deg = math.degrees(bearing_rad)
-    bearing_deg = (bearing_deg + 360) % 360
-    
-    directions = ["North", "North-East", "East", "South-East", "South", "South-West", "West", "North-West"]
-    index = round(bearing_deg / 45) % 8
-    
-    return directions[index]
+@app.route("/api/qr/<history_id>", methods=["GET"])
+def get_history_qr(history_id):
+    """Stable, cacheable QR for a stored history (?format=svg for the cheaper vector form)."""
+    if history_store is None or history_store.get(history_id) is None:
+        return jsonify({"error": "History ID not found or expired."}), 404
+    try:
+        return qr_response(qr_renderer, history_qr_url(history_id), fmt=request.args.get("format", "png"))
+    except ValueError as e:
+        return jsonify({"error": f"Internal Error: {e}"}), 500
 
 # --------------------------
 # ROUTE INFORMATION ENDPOINT
@@ -534,8 +1064,9 @@ def get_route_info():
         if not (-180 <= start_lon <= 180) or not (-180 <= end_lon <= 180):
             return jsonify({"error": "Longitude must be between -180 and 180"}), 400
 
-        distance = calculate_haversine_distance(start_lat, start_lon, end_lat, end_lon)
-        direction = calculate_initial_bearing(start_lat, start_lon, end_lat, end_lon)
+        # Same geo.py math as the batch endpoint below, so single and batch answers always agree.
+        distance = round(float(haversine_km(start_lat, start_lon, end_lat, end_lon)), 2)
+        direction = str(compass_direction(initial_bearing_deg(start_lat, start_lon, end_lat, end_lon)))
 
         response = {
             "distance_km": distance,
@@ -551,6 +1082,108 @@ def get_route_info():
         return jsonify({"error": f"Internal calculation error: {e}"}), 500
 
 
+# --------------------------
+# BATCH ROUTE INFORMATION ENDPOINT (vectorized)
+# --------------------------
+
+def parse_points(raw, name):
+    """[[lat, lon], ...] or [{"lat", "lon"}, ...] -> (lats, lons) float arrays, range-checked."""
+    if not isinstance(raw, list) or not raw:
+        raise ValueError(f"'{name}' must be a non-empty list of [lat, lon] points.")
+    raw = [[p.get("lat"), p.get("lon")] if isinstance(p, dict) else p for p in raw]
+    points = np.asarray(raw, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 2 or np.isnan(points).any():
+        raise ValueError(f"'{name}' must be a list of [lat, lon] points.")
+    lats, lons = points[:, 0], points[:, 1]
+    if (np.abs(lats) > 90).any():
+        raise ValueError(f"Latitude must be between -90 and 90 in '{name}'.")
+    if (np.abs(lons) > 180).any():
+        raise ValueError(f"Longitude must be between -180 and 180 in '{name}'.")
+    return lats, lons
+
+@app.route("/api/route_info/batch", methods=["POST"])
+def get_route_info_batch():
+    """Distances and bearings for many points in one vectorized pass.
+
+    Payload (points are [lat, lon] or {"lat", "lon"}):
+      {"starts": [...], "ends": [...]}                      pairwise, equal lengths
+      {"origin": [lat, lon], "targets": [...]}              one origin against N targets
+      {"sources": [...], "targets": [...], "matrix": true}  full N x M distance matrix
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "No JSON payload received."}), 400
+    try:
+        if payload.get("matrix"):
+            src_lats, src_lons = parse_points(payload.get("sources"), "sources")
+            dst_lats, dst_lons = parse_points(payload.get("targets"), "targets")
+            if len(src_lats) * len(dst_lats) > ROUTE_MATRIX_MAX_CELLS:
+                return jsonify({"error": f"Matrix too large (max {ROUTE_MATRIX_MAX_CELLS} cells)."}), 400
+            matrix = distance_matrix_km(src_lats, src_lons, dst_lats, dst_lons)
+            return jsonify({
+                "distance_km": np.round(matrix, 2).tolist(),
+                "nearest_target": matrix.argmin(axis=1).tolist(),
+            })
+
+        if "origin" in payload:
+            start_lats, start_lons = parse_points([payload.get("origin")], "origin")
+            end_lats, end_lons = parse_points(payload.get("targets"), "targets")
+        else:
+            start_lats, start_lons = parse_points(payload.get("starts"), "starts")
+            end_lats, end_lons = parse_points(payload.get("ends"), "ends")
+            if len(start_lats) != len(end_lats):
+                return jsonify({"error": "'starts' and 'ends' must have the same length."}), 400
+        if len(end_lats) > ROUTE_BATCH_MAX_POINTS:
+            return jsonify({"error": f"Too many points (max {ROUTE_BATCH_MAX_POINTS})."}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid coordinate format: {e}"}), 400
+
+    distances = haversine_km(start_lats, start_lons, end_lats, end_lons)
+    bearings = initial_bearing_deg(start_lats, start_lons, end_lats, end_lons)
+    response = {
+        "distance_km": np.round(distances, 2).tolist(),
+        "bearing_deg": np.round(bearings, 1).tolist(),
+        "direction": compass_direction(bearings).tolist(),
+    }
+    if "origin" in payload:
+        response["nearest_index"] = int(distances.argmin())
+    return jsonify(response)
+
+
+# --------------------------
+# Startup. Under gunicorn.conf.py (preload_app) this module is imported once by the master: it loads
+# only the fork-safe, read-only components (FAISS index, embedding model) and freezes them, so forked
+# workers share those pages copy-on-write. Each worker then calls after_fork() to reopen its SQLite
+# handles and warm up the rest (DB pool, LLM client, retriever threads) itself.
+# --------------------------
+SHARED_COMPONENTS = ("faiss",) if EMBED_SERVER_SOCKET else ("faiss", "embedding_model")
+
+def start_warm_up():
+    if WARM_UP == "eager":
+        components.load()
+    elif WARM_UP == "background":
+        components.warm_up()
+
+def preload_shared():
+    components.load(SHARED_COMPONENTS)
+    # Move everything allocated so far out of the cyclic GC's reach: collections would otherwise write
+    # to every object header and un-share the pages in each worker.
+    gc.collect()
+    gc.freeze()
+
+def after_fork():
+    for resource in (llm_cache, history_store):
+        if resource is not None:
+            resource.after_fork()
+    if TORCH_THREADS and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(TORCH_THREADS)
+    start_warm_up()
+
+if os.getenv("APP_PRELOAD") == "1":
+    preload_shared()
+else:
+    start_warm_up()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
     app.run(host="0.0.0.0", port=port)
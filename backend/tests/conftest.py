@@ -0,0 +1,46 @@
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synth_db  # noqa: E402
+
+SYNTH_ROWS = 20000  # 40 levels x ~10 cycles per float: about 50 floats
+
+
+@pytest.fixture(scope="session")
+def synth_db_path(tmp_path_factory):
+    """A small synthetic v2 argo_data.db (synth_db.py), built once per session; tests must not modify it."""
+    path = str(tmp_path_factory.mktemp("synth") / "argo_data.db")
+    synth_db.build(path, SYNTH_ROWS, seed=7, cycles=10)
+    return path
+
+
+@pytest.fixture(scope="session")
+def app_module(synth_db_path, tmp_path_factory):
+    """test.py imported against a copy of the synthetic database with the offline stub LLM.
+
+    The module reads its configuration at import time; the environment is restored afterwards.
+    """
+    tmp = tmp_path_factory.mktemp("app")
+    shutil.copy(synth_db_path, tmp / "argo_data.db")
+    env = {"LLM_BACKEND": "stub", "LLM_CACHE_FILE": "", "WARM_UP": "off", "DB_RECHECK_SECONDS": "0",
+           "DB_FILE": str(tmp / "argo_data.db"), "HISTORY_DB_FILE": str(tmp / "history.db")}
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in env.items():
+            mp.setenv(name, value)
+        for name in ("APP_PRELOAD", "COALESCE_DIR", "QR_CACHE_DIR", "EMBED_CACHE_FILE", "EMBED_SERVER_SOCKET",
+                     "GEMINI_API_KEY"):
+            mp.delenv(name, raising=False)
+        sys.modules.pop("test", None)
+        module = importlib.import_module("test")
+    return module
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,63 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db import ConnectionPool
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "argo_data.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE argo_profiles (float_id INTEGER, temperature REAL)")
+    conn.execute("INSERT INTO argo_profiles VALUES (1900100, 28.5)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.mark.parametrize("statement", [
+    "INSERT INTO argo_profiles VALUES (1900101, 27.0)",
+    "UPDATE argo_profiles SET temperature = 0",
+    "DELETE FROM argo_profiles",
+    "DROP TABLE argo_profiles",
+    "CREATE TABLE scratch (x)",
+])
+def test_pooled_connections_cannot_write(db_path, statement):
+    pool = ConnectionPool(db_path)
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute(statement)
+        assert conn.execute("SELECT COUNT(*) FROM argo_profiles").fetchone()[0] == 1
+
+
+def test_the_database_is_switched_to_wal(db_path):
+    ConnectionPool(db_path)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_missing_database_is_not_created(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ConnectionPool(str(tmp_path / "missing.db"))
+    assert not (tmp_path / "missing.db").exists()
+
+
+def test_each_thread_reuses_its_own_connection(db_path):
+    pool = ConnectionPool(db_path, max_connections=4)
+    seen = []
+
+    def work():
+        with pool.connection() as first, pool.connection() as second:
+            seen.append((first, first is second))
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(same for _, same in seen)
+    assert len({id(conn) for conn, _ in seen}) == 3
+    assert pool.stats()["connections"] == 3 and pool.stats()["in_use"] == 0
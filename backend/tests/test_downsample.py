@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from downsample import bin_means, downsample_profiles, lttb_indices
+
+
+def test_lttb_keeps_the_endpoints_and_the_extremes():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50.0)
+    y[437] = 25.0  # a spike any shape-preserving sample must keep
+    keep = lttb_indices(x, y, 50)
+    assert len(keep) == 50 and keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 437 in keep
+
+
+def test_lttb_returns_everything_below_the_threshold():
+    x = np.arange(10, dtype=np.float64)
+    assert lttb_indices(x, x, 10).tolist() == list(range(10))
+    assert lttb_indices(x, x, 2).tolist() == list(range(10))
+
+
+def test_bin_means_average_each_bin_and_drop_empty_ones():
+    pressure = np.array([1.0, 2.0, 3.0, 11.0, 13.0, 35.0, 99.0])
+    temperature = np.array([10.0, 20.0, np.nan, 5.0, 7.0, 1.0, 0.0])
+    mean_p, means = bin_means(pressure, {"temperature": temperature}, np.array([0.0, 10.0, 20.0, 30.0, 40.0]))
+    assert mean_p.tolist() == [2.0, 12.0, 35.0]  # 20-30 is empty, 99 is outside the edges
+    assert means["temperature"].tolist() == [15.0, 6.0, 1.0]  # NaN is skipped, not averaged in
+
+
+def test_bin_means_of_an_all_missing_variable_are_nan():
+    _, means = bin_means(np.array([1.0, 2.0]), {"salinity": np.array([np.nan, np.nan])}, np.array([0.0, 10.0]))
+    assert np.isnan(means["salinity"]).all()
+
+
+COLUMNS = ["profile_id", "float_id", "pressure", "temperature"]
+
+
+def profile_rows(profile_id, depth=2000, step=1.0):
+    return [(profile_id, 1900100, float(p), 30.0 - p / 100.0) for p in np.arange(0.0, depth, step)]
+
+
+def test_bins_are_widened_to_respect_max_bins():
+    rows = profile_rows(1)
+    result = downsample_profiles(COLUMNS, rows, bin_dbar=1e-6, max_bins=100)
+    assert result["bin_dbar"] >= 19.99
+    assert len(result["profiles"][0]["pressure"]) <= 101
+
+
+def test_profiles_share_bins_and_lttb_caps_points():
+    rows = profile_rows(1) + profile_rows(2, depth=1000)
+    bins = downsample_profiles(COLUMNS, rows, points=50)
+    assert [p["profile_id"] for p in bins["profiles"]] == [1, 2]
+    assert bins["profiles"][1]["pressure"] == bins["profiles"][0]["pressure"][:len(bins["profiles"][1]["pressure"])]
+    lttb = downsample_profiles(COLUMNS, rows, mode="lttb", points=30, max_profiles=1)
+    assert len(lttb["profiles"]) == 1 and len(lttb["profiles"][0]["pressure"]) == 30
+    assert lttb["truncated_profiles"] == 1 and lttb["raw_rows"] == len(rows)
+
+
+@pytest.mark.parametrize("bin_dbar", [1e-9, 0, -5, "nan", "inf"])
+def test_plot_bin_width_below_the_minimum_is_rejected(client, bin_dbar):
+    resp = client.post("/api/query", json={"query": "temperature profiles", "plot": {"bin_dbar": bin_dbar}})
+    assert resp.status_code == 400
+    assert "bin_dbar" in resp.get_json()["summary"]
+
+
+def test_plot_with_a_valid_bin_width(client):
+    resp = client.post("/api/query", json={"query": "temperature profiles", "plot": {"bin_dbar": 25}})
+    assert resp.status_code == 200
+    plot = resp.get_json()["plot"]
+    assert plot["mode"] == "bins" and plot["bin_dbar"] == 25.0 and plot["profiles"]
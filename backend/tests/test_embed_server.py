@@ -0,0 +1,146 @@
+import gc
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+from embed_server import ERROR, MAX_REQUEST_BYTES, EmbeddingServer, RemoteEncoder, freeze_model
+
+
+class FakeEncoder:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        if self.fail:
+            raise RuntimeError("CUDA out of memory")
+        self.batches.append(list(texts))
+        return np.array([[len(t), sum(map(ord, t)) % 97, 0.5] for t in texts], dtype=np.float32)
+
+
+def serve(socket_path, model):
+    server = EmbeddingServer(socket_path, model, window_ms=20)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def socket_path():
+    directory = tempfile.mkdtemp(prefix="embed")  # Unix socket paths are limited to ~100 bytes
+    yield os.path.join(directory, "embed.sock")
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def server(socket_path):
+    server = serve(socket_path, FakeEncoder())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_vectors_match_the_local_model(server, socket_path):
+    encoder = RemoteEncoder(socket_path)
+    texts = ["salinity near Chennai", "temperature", ""]
+    assert np.array_equal(encoder.encode(texts), FakeEncoder().encode(texts))
+    single = encoder.encode("temperature")
+    assert single.shape == (3,) and single.tolist() == [11.0, FakeEncoder().encode(["temperature"])[0][1], 0.5]
+    assert encoder.encode([]).shape == (0, 0)
+
+
+def test_concurrent_workers_share_batches(server, socket_path):
+    encoder = RemoteEncoder(socket_path)
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def worker(i):
+        barrier.wait()
+        results[i] = encoder.encode([f"question {i}"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(results[i].tolist() == FakeEncoder().encode([f"question {i}"]).tolist() for i in range(8))
+    assert len(server.batcher.model.batches) < 8
+
+
+def test_model_errors_reach_the_client(socket_path):
+    server = serve(socket_path, FakeEncoder(fail=True))
+    try:
+        with pytest.raises(RuntimeError, match="CUDA out of memory"):
+            RemoteEncoder(socket_path).encode(["x"])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_oversized_requests_are_refused_and_the_connection_closed(server, socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(socket_path)
+        sock.sendall(struct.pack("!I", MAX_REQUEST_BYTES + 1))
+        n, length = struct.unpack("!II", sock.recv(8))
+        assert n == ERROR and sock.recv(length) == b"request too large"
+        assert sock.recv(1) == b""
+
+
+def test_client_reconnects_after_a_server_restart(socket_path):
+    encoder = RemoteEncoder(socket_path)
+    first = serve(socket_path, FakeEncoder())
+    encoder.encode(["before"])
+    first.shutdown()
+    first.server_close()
+    second = serve(socket_path, FakeEncoder())
+    try:
+        assert encoder.encode(["after"]).shape == (1, 3)
+    finally:
+        second.shutdown()
+        second.server_close()
+
+
+def test_freeze_model_disables_gradients():
+    class Param:
+        requires_grad = True
+
+        def requires_grad_(self, flag):
+            self.requires_grad = flag
+
+    class Model:
+        training = True
+
+        def __init__(self):
+            self.params = [Param(), Param()]
+
+        def eval(self):
+            self.training = False
+
+        def parameters(self):
+            return iter(self.params)
+
+    model = freeze_model(Model())
+    assert not model.training and not any(p.requires_grad for p in model.params)
+
+
+def test_preload_loads_shared_components_and_freezes_the_gc(app_module):
+    assert set(app_module.SHARED_COMPONENTS) <= {"faiss", "embedding_model"}
+    try:
+        status = app_module.preload_shared()
+        assert all(app_module.components.loaded(name) for name in app_module.SHARED_COMPONENTS)
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    assert status is None or isinstance(status, dict)
+
+
+def test_after_fork_reopens_sqlite_handles(app_module):
+    history_id = app_module.history_store.put([{"role": "user", "content": "hi"}])
+    app_module.after_fork()
+    assert app_module.history_store.get(history_id) == [{"role": "user", "content": "hi"}]
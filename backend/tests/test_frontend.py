@@ -0,0 +1,102 @@
+import importlib
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("plotly")
+pytest.importorskip("pandas")
+requests = pytest.importorskip("requests")
+
+PLOT = {"profiles": [
+    {"profile_id": 11, "float_id": 1900100, "date": "2020-01-01", "pressure": [5.0, 10.0], "temperature": [28.0, 27.5],
+     "salinity": [35.0, None]},
+    {"profile_id": 12, "float_id": 1900100, "date": "2020-01-11", "pressure": [5.0], "temperature": [27.9]},
+]}
+
+
+@pytest.fixture(scope="module")
+def frontend():
+    # app.py is a Streamlit script; outside `streamlit run` its UI calls are no-ops.
+    return importlib.import_module("app")
+
+
+class FakeResponse:
+    def __init__(self, body, status=200):
+        self.body = body
+        self.status_code = status
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    def __init__(self, result):
+        self.result = result
+        self.payloads = []
+
+    def post(self, url, json=None, timeout=None):
+        self.payloads.append(json)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_plot_rows_flattens_profiles(frontend):
+    rows = frontend.plot_rows(PLOT)
+    assert rows == [
+        {"profile_id": 11, "float_id": 1900100, "date": "2020-01-01", "pressure": 5.0, "salinity": 35.0,
+         "temperature": 28.0},
+        {"profile_id": 11, "float_id": 1900100, "date": "2020-01-01", "pressure": 10.0, "salinity": None,
+         "temperature": 27.5},
+        {"profile_id": 12, "float_id": 1900100, "date": "2020-01-11", "pressure": 5.0, "temperature": 27.9},
+    ]
+    assert frontend.plot_rows({}) == []
+
+
+@pytest.mark.parametrize("columns,expected", [
+    (["pressure", "temperature", "salinity"], ("profile", "salinity")),
+    (["date", "temperature"], ("series", "temperature")),
+    (["latitude", "longitude", "float_id"], ("map", None)),
+    (["float_id", "cycle_number"], None),
+])
+def test_choose_plot(frontend, columns, expected):
+    assert frontend.choose_plot(columns) == expected
+
+
+def test_build_figure_kinds(frontend):
+    assert frontend.build_figure([]) is None
+    profile = frontend.build_figure(frontend.plot_rows(PLOT))
+    assert profile.layout.yaxis.autorange == "reversed"
+    assert len(profile.data) == 2  # one line per profile
+    series = frontend.build_figure([{"date": "2020-01-02", "temperature": 27.0},
+                                    {"date": "2020-01-01", "temperature": 28.0}])
+    assert list(series.data[0].y) == [28.0, 27.0]
+    positions = frontend.build_figure([{"latitude": 1.0, "longitude": 80.0}, {"latitude": 1.0, "longitude": 80.0}])
+    assert len(positions.data[0].lat) == 1
+
+
+def test_ask_backend_sends_options_and_reads_pages(frontend, monkeypatch):
+    session = FakeSession(FakeResponse({"summary": "ok", "data": [{"a": 1}], "next_cursor": "c2"}))
+    monkeypatch.setattr(frontend, "get_session", lambda: session)
+    assert frontend.ask_backend("q", cursor="c1") == ("ok", [{"a": 1}], "c2")
+    assert session.payloads[-1] == {"query": "q", "cursor": "c1"}
+
+    session.result = FakeResponse({"summary": "plotted", "plot": PLOT})
+    summary, rows, cursor = frontend.ask_backend("q", plot=True)
+    assert session.payloads[-1] == {"query": "q", "plot": {"points": frontend.PLOT_POINTS}}
+    assert summary == "plotted" and len(rows) == 3 and cursor is None
+
+
+@pytest.mark.parametrize("result,message", [
+    (requests.exceptions.ReadTimeout(), "took too long"),
+    (requests.exceptions.ConnectionError("refused"), "Could not connect"),
+    (FakeResponse({}, status=502), "Could not connect"),
+])
+def test_ask_backend_failures_become_messages(frontend, monkeypatch, result, message):
+    monkeypatch.setattr(frontend, "get_session", lambda: FakeSession(result))
+    summary, rows, cursor = frontend.ask_backend("q")
+    assert message in summary and rows == [] and cursor is None
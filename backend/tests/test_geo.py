@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pytest
+
+from geo import compass_direction, distance_matrix_km, haversine_km, initial_bearing_deg
+from spatial import KM_PER_DEGREE, great_circle_km
+
+
+def test_one_degree_of_latitude_is_about_111_km():
+    assert haversine_km(0.0, 0.0, 1.0, 0.0) == pytest.approx(111.19, abs=0.01)
+    assert haversine_km(45.0, 80.0, 46.0, 80.0) == pytest.approx(111.19, abs=0.01)
+    assert KM_PER_DEGREE == pytest.approx(111.19, abs=0.01)
+
+
+def test_longitude_degrees_shrink_with_latitude():
+    assert haversine_km(0.0, 0.0, 0.0, 1.0) == pytest.approx(111.19, abs=0.01)
+    assert haversine_km(60.0, 0.0, 60.0, 1.0) == pytest.approx(111.19 * math.cos(math.radians(60)), rel=1e-3)
+
+
+def test_scalar_and_sql_distances_agree_with_the_vectorized_one():
+    lats = np.array([-33.9, 12.97, 19.08])
+    lons = np.array([18.4, 77.59, 72.88])
+    matrix = distance_matrix_km(lats, lons, lats, lons)
+    assert matrix.shape == (3, 3)
+    assert np.allclose(np.diag(matrix), 0.0)
+    assert np.allclose(matrix, matrix.T)
+    for i in range(3):
+        for j in range(3):
+            assert great_circle_km(lats[i], lons[i], lats[j], lons[j]) == pytest.approx(matrix[i, j], rel=1e-9)
+    assert great_circle_km(None, 0.0, 1.0, 1.0) is None
+
+
+def test_antipodes_are_half_the_circumference_apart():
+    assert haversine_km(10.0, 20.0, -10.0, -160.0) == pytest.approx(math.pi * 6371.0, rel=1e-6)
+
+
+def test_bearings_and_compass_names():
+    assert initial_bearing_deg(0.0, 0.0, 1.0, 0.0) == pytest.approx(0.0)
+    assert initial_bearing_deg(0.0, 0.0, 0.0, 1.0) == pytest.approx(90.0)
+    assert list(compass_direction([0.0, 90.0, 181.0, 315.0, 359.0])) == ["North", "East", "South", "North-West",
+                                                                       "North"]
+
+
+def test_route_info_reports_great_circle_distance(client):
+    resp = client.post("/api/route_info", json={"start_lat": 0, "start_lon": 80, "end_lat": 1, "end_lon": 80})
+    assert resp.status_code == 200
+    assert resp.get_json()["distance_km"] == pytest.approx(111.19, abs=0.01)
+    assert resp.get_json()["direction"] == "North"
+
+    batch = client.post("/api/route_info/batch", json={"origin": [0, 80], "targets": [[1, 80], [0, 81]]})
+    assert batch.status_code == 200
+    assert batch.get_json()["distance_km"] == pytest.approx([111.19, 111.19], abs=0.01)
+
+
+@pytest.mark.parametrize("start,end", [((12.97, 77.59), (19.08, 72.88)), ((-33.9, 18.4), (51.5, -0.1)),
+                                       ((0.0, 179.5), (0.5, -179.5)), ((10.0, 20.0), (10.0, 20.0))])
+def test_single_and_batch_endpoints_agree(client, start, end):
+    single = client.post("/api/route_info", json={"start_lat": start[0], "start_lon": start[1],
+                                                  "end_lat": end[0], "end_lon": end[1]}).get_json()
+    batch = client.post("/api/route_info/batch", json={"starts": [list(start)], "ends": [list(end)]}).get_json()
+    assert single["distance_km"] == batch["distance_km"][0]
+    assert single["direction"] == batch["direction"][0]
+    assert single["instruction"] == f"Go {single['direction']} for {single['distance_km']} kilometers " \
+        "(straight line distance)."
+
+
+def test_route_info_rejects_bad_coordinates(client):
+    assert client.post("/api/route_info", json={"start_lat": 91, "start_lon": 0, "end_lat": 0, "end_lon": 0}) \
+        .status_code == 400
+    assert client.post("/api/route_info", json={"start_lat": "x", "start_lon": 0, "end_lat": 0, "end_lon": 0}) \
+        .status_code == 400
+    assert client.post("/api/route_info", json={"start_lat": 0}).status_code == 400
@@ -0,0 +1,50 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+from history_store import HistoryStore
+
+DAY = 86400
+
+
+def write_legacy(path, entries):
+    with open(path, "w") as f:
+        json.dump(entries, f)
+    return str(path)
+
+
+def test_imported_histories_get_the_full_ttl_from_import_time(tmp_path):
+    old = (datetime.now() - timedelta(days=60)).isoformat()
+    legacy = write_legacy(tmp_path / "history_store.json", {
+        "abc": {"history": [{"role": "user", "text": "floats near Chennai"}], "timestamp": old},
+        "plain": [{"role": "user", "text": "salinity in March"}],
+    })
+    store = HistoryStore(str(tmp_path / "history.db"), ttl_seconds=30 * DAY)
+    assert store.import_json(legacy, unwrap_key="history") == 2
+    store.evict()
+    assert store.get("abc") == [{"role": "user", "text": "floats near Chennai"}]
+    assert store.get("plain") == [{"role": "user", "text": "salinity in March"}]
+
+
+def test_import_runs_once_per_file(tmp_path):
+    legacy = write_legacy(tmp_path / "history_store.json", {"abc": []})
+    store = HistoryStore(str(tmp_path / "history.db"))
+    assert store.import_json(legacy) == 1
+    assert store.import_json(legacy) == 0
+    assert HistoryStore(str(tmp_path / "history.db")).import_json(legacy) == 0
+
+
+def test_concurrent_puts_count_every_write(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), evict_every=7)
+
+    def writer():
+        for _ in range(50):
+            store.put([{"role": "user", "text": "hi"}])
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store._writes == 400
+    assert len(store) == 400
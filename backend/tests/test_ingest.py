@@ -0,0 +1,48 @@
+import sqlite3
+
+from ingest import TRACKING_DDL, Ingestor, delayed_mode
+from schema import create_schema
+
+
+def profile_file(path, temperature, cycle=1):
+    rows = [(19001210000 + cycle, 1900121, cycle, 10.0, 60.0, "2020-01-01 00:00:00", 1577836800, p, temperature, 35.0)
+            for p in (5.0, 10.0)]
+    profile = {"float_id": 1900121, "cycle_number": cycle, "date": "2020-01-01 00:00:00", "platform_type": "APEX",
+               "country": "India", "rows": rows}
+    return {"path": path, "size": 1, "mtime": 1.0, "profiles": [profile]}
+
+
+def ingest(*results):
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    create_schema(conn, with_indexes=False)
+    conn.executescript(TRACKING_DDL)
+    ingestor = Ingestor(conn)
+    for result in results:
+        ingestor.add(result)
+    ingestor.flush()
+    return conn, ingestor
+
+
+def temperatures(conn):
+    return sorted(t for (t,) in conn.execute("SELECT temperature FROM argo_profiles"))
+
+
+def test_delayed_mode_file_names():
+    assert delayed_mode("/gdac/aoml/1900121/profiles/D1900121_001.nc")
+    assert delayed_mode("BD1900121_001.nc") and delayed_mode("SD1900121_001.nc")
+    assert not delayed_mode("/gdac/aoml/1900121/profiles/R1900121_001.nc")
+    assert not delayed_mode("BR1900121_001.nc")
+
+
+def test_delayed_mode_profile_replaces_real_time_one():
+    conn, ingestor = ingest(profile_file("R1900121_001.nc", 20.0), profile_file("D1900121_001.nc", 21.0))
+    assert temperatures(conn) == [21.0, 21.0]
+    assert ingestor.replaced == 1
+
+
+def test_real_time_profile_arriving_later_keeps_delayed_mode_rows():
+    conn, ingestor = ingest(profile_file("D1900121_001.nc", 21.0), profile_file("R1900121_001.nc", 20.0))
+    assert temperatures(conn) == [21.0, 21.0]
+    assert ingestor.replaced == 0
+    source = conn.execute("SELECT source_file FROM ingested_profiles").fetchone()[0]
+    assert source == "D1900121_001.nc"
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from lazy import Components, LazyComponent
+
+
+class Loader:
+    """Counts calls; fails the first `failures` of them, each after `delay` seconds."""
+
+    def __init__(self, value="value", delay=0.0, failures=0):
+        self.value = value
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise RuntimeError("not yet")
+        return self.value
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def test_get_if_ready_starts_one_background_load():
+    loader = Loader(delay=0.1)
+    component = LazyComponent("slow", loader)
+    callers = [threading.Thread(target=component.get_if_ready) for _ in range(20)]
+    for t in callers:
+        t.start()
+    for t in callers:
+        t.join()
+    assert component.get_if_ready("fallback") == "fallback"
+    assert wait_for(lambda: component.loaded)
+    assert component.get_if_ready("fallback") == "value" and loader.calls == 1
+
+
+def test_failed_load_is_retried_once_due():
+    loader = Loader(failures=1)
+    component = LazyComponent("flaky", loader, default="default", retry_seconds=0.05)
+    assert component.get() == "default"
+    assert not component.loaded and component.error == "not yet"
+    assert component.get() == "default" and loader.calls == 1  # not due yet
+    time.sleep(0.06)
+    assert component.get() == "value"
+    assert component.loaded and component.error is None and loader.calls == 2
+
+
+def test_background_loads_respect_the_retry_interval():
+    loader = Loader(failures=1)
+    component = LazyComponent("flaky", loader, retry_seconds=0.1)
+    component.get_if_ready()
+    assert wait_for(lambda: component.error is not None)
+    for _ in range(10):
+        component.get_if_ready()
+    assert loader.calls == 1
+    time.sleep(0.11)
+    component.get_if_ready()
+    assert wait_for(lambda: component.loaded) and loader.calls == 2
+
+
+def test_readiness_awaits_only_required_components():
+    components = Components()
+    database = Loader(failures=1)
+    components.add("database", database, required=True, retry_seconds=0.0)
+    llm = Loader(delay=5.0)
+    components.add("llm", llm)
+    components.add("faiss", Loader(failures=100))
+    assert not components.ready()
+    start = time.monotonic()
+    assert not components.ready(load=True)  # the first database load fails...
+    assert components.ready(load=True)      # ...and is retried
+    assert time.monotonic() - start < 1.0 and llm.calls == 0
+    assert components.status()["database"]["error"] is None
+
+
+def test_readyz_reports_optional_components_without_waiting(client, app_module, monkeypatch):
+    slow = Loader(delay=0.3)
+    monkeypatch.setitem(app_module.components._components, "slow", LazyComponent("slow", slow))
+    start = time.monotonic()
+    resp = client.get("/readyz")
+    assert time.monotonic() - start < 0.25
+    body = resp.get_json()
+    assert resp.status_code == 200 and body["status"] == "ready"
+    assert body["components"]["slow"]["loaded"] is False and body["warming_up"]
+    assert wait_for(lambda: app_module.components.loaded("slow") and not app_module.components.warming_up())
+
+
+def test_metrics_scrape_does_not_load_the_llm(client, app_module, monkeypatch):
+    llm = Loader(value=None)
+    monkeypatch.setitem(app_module.components._components, "llm", LazyComponent("llm", llm))
+    assert client.get("/metrics").status_code == 200
+    time.sleep(0.05)
+    assert llm.calls == 0
@@ -0,0 +1,65 @@
+import pytest
+
+import llm
+from llm import LLMCache, cache_key
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm.time, "time", clock.time)
+    return clock
+
+
+def test_key_depends_on_every_input():
+    base = cache_key("summary", "salinity near Chennai", "abc", "hi")
+    assert base == cache_key("summary", "salinity near Chennai", "abc", "hi")
+    assert len({base, cache_key("sql", "salinity near Chennai", "abc", "hi"),
+                cache_key("summary", "salinity near Mumbai", "abc", "hi"),
+                cache_key("summary", "salinity near Chennai", "abd", "hi"),
+                cache_key("summary", "salinity near Chennai", "abc", "ta")}) == 5
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = LLMCache(ttl_seconds=60)
+    cache.put("k", "answer")
+    clock.now += 60
+    assert cache.get("k") == "answer"
+    clock.now += 1
+    assert cache.get("k") is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+
+def test_disk_tier_honours_the_ttl_across_restarts(clock, tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+    LLMCache(ttl_seconds=60, disk_path=path).put("k", "answer")
+    clock.now += 30
+    assert LLMCache(ttl_seconds=60, disk_path=path).get("k") == "answer"
+    clock.now += 31
+    assert LLMCache(ttl_seconds=60, disk_path=path).get("k") is None
+
+
+def test_memory_tier_is_bounded_and_falls_back_to_disk(clock, tmp_path):
+    cache = LLMCache(max_entries=2, disk_path=str(tmp_path / "llm_cache.db"))
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+    assert cache.stats()["entries"] == 2
+    assert cache.get("a") == "A"  # evicted from memory, read back from disk
+    assert LLMCache(max_entries=2).get("a") is None
+
+
+def test_expired_disk_rows_are_pruned(clock, tmp_path):
+    cache = LLMCache(ttl_seconds=60, disk_path=str(tmp_path / "llm_cache.db"))
+    cache.put("old", "stale")
+    clock.now += 120
+    for i in range(99):  # the 100th write runs the disk eviction
+        cache.put(f"k{i}", "fresh")
+    assert cache._disk.execute("SELECT COUNT(*) FROM llm_cache WHERE key = 'old'").fetchone()[0] == 0
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from fake_llm_server import FakeLLMServer
+from llm import HttpModel, LLMHTTPError
+from llm_client import LLMCircuitOpen, LLMClient, classify_error
+
+SUMMARY_PROMPT = "Summarize these results in one sentence."
+
+
+@pytest.fixture
+def server():
+    server = FakeLLMServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client_for(server, **kwargs):
+    trips = []
+    kwargs.setdefault("backoff_base", 0.01)
+    model = HttpModel(f"http://127.0.0.1:{server.server_port}/generate", timeout=5)
+    client = LLMClient(model, on_trip=lambda cooldown, failures: trips.append(failures), **kwargs)
+    return client, trips
+
+
+def test_classify_error_uses_status_and_type_not_message_text():
+    assert classify_error(LLMHTTPError(429, "slow down")) == "rate_limited"
+    assert classify_error(LLMHTTPError(503, "unavailable")) == "transient"
+    assert classify_error(ConnectionError("reset")) == "transient"
+    assert classify_error(ValueError("429 rows exceed the quota column")) == "fatal"
+    assert classify_error(LLMHTTPError(400, "quota field invalid: 429")) == "fatal"
+
+
+def test_rate_limit_halves_the_concurrency_limit_and_successes_grow_it(server):
+    client, _ = client_for(server, max_concurrency=8, max_retries=0, breaker_threshold=100)
+    server.configure({"error_rate": 1.0})
+    with pytest.raises(LLMHTTPError):
+        client.generate(SUMMARY_PROMPT)
+    with pytest.raises(LLMHTTPError):
+        client.generate(SUMMARY_PROMPT)
+    stats = client.stats()
+    assert stats["rate_limited"] == 2
+    assert stats["concurrency_limit"] == 4  # one burst of 429s halves the limit once
+
+    server.configure({"error_rate": 0.0})
+    for _ in range(4):
+        client.generate(SUMMARY_PROMPT)
+    assert 4.9 < client.stats()["concurrency_limit"] < 5  # additive increase: +1/limit per success
+
+
+def test_breaker_opens_then_lets_one_probe_through(server):
+    client, trips = client_for(server, max_retries=0, breaker_threshold=2, breaker_cooldown=0.3)
+    server.configure({"error_rate": 1.0})
+    for _ in range(2):
+        with pytest.raises(LLMHTTPError):
+            client.generate(SUMMARY_PROMPT)
+    assert trips == [2]
+    requests = server.stats()["requests"]
+    with pytest.raises(LLMCircuitOpen):
+        client.generate(SUMMARY_PROMPT)
+    assert server.stats()["requests"] == requests  # refused without calling the provider
+
+    time.sleep(0.35)
+    server.configure({"error_rate": 0.0, "latency_ms": 300})
+    probe = threading.Thread(target=client.generate, args=(SUMMARY_PROMPT,))
+    probe.start()
+    time.sleep(0.1)
+    assert client.stats()["breaker"] == "half_open"
+    with pytest.raises(LLMCircuitOpen):
+        client.generate(SUMMARY_PROMPT)  # only the probe is let through while half-open
+    probe.join()
+    assert client.stats()["breaker"] == "closed"
+    assert client.stats()["breaker_trips"] == 1
+
+
+def test_failed_probe_reopens_the_breaker(server):
+    client, trips = client_for(server, max_retries=0, breaker_threshold=1, breaker_cooldown=0.2)
+    server.configure({"error_rate": 1.0})
+    with pytest.raises(LLMHTTPError):
+        client.generate(SUMMARY_PROMPT)
+    time.sleep(0.25)
+    with pytest.raises(LLMHTTPError):
+        client.generate(SUMMARY_PROMPT)  # the probe
+    assert len(trips) == 2
+    assert client.stats()["breaker"] == "open"
+
+
+def test_retry_waits_for_retry_after(server):
+    client, _ = client_for(server, max_retries=2, breaker_threshold=100)
+    server.configure({"error_rate": 1.0, "retry_after": 1})
+    threading.Timer(0.2, server.configure, args=({"error_rate": 0.0},)).start()
+    started = time.monotonic()
+    resp = client.generate(SUMMARY_PROMPT, max_wait=5)
+    assert resp.text
+    assert time.monotonic() - started >= 1.0  # not the ~10 ms jittered backoff
+    assert client.stats()["retries"] == 1
+    assert server.stats()["rate_limited"] == 1
+
+
+def test_retry_after_beyond_the_deadline_gives_up_at_once(server):
+    client, _ = client_for(server, max_retries=3, breaker_threshold=100)
+    server.configure({"error_rate": 1.0, "retry_after": 30})
+    started = time.monotonic()
+    with pytest.raises(LLMHTTPError) as err:
+        client.generate(SUMMARY_PROMPT, max_wait=2)
+    assert err.value.retry_after == 30
+    assert time.monotonic() - started < 1.0
+    assert client.stats()["retries"] == 0
@@ -0,0 +1,90 @@
+import threading
+
+from metrics import Registry, server_timing
+
+
+def samples(text):
+    """{sample name with labels: value} for every non-comment line of a scrape."""
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            out[name] = value
+    return out
+
+
+def test_counters_render_with_escaped_labels():
+    registry = Registry()
+    counter = registry.counter("argo_requests_total", "Requests.", ("path", "status"))
+    counter.inc(path="/api/query", status="200")
+    counter.inc(2, path="/api/query", status="200")
+    counter.inc(path='a"b\\c\nd', status="500")
+    text = registry.render()
+    assert "# HELP argo_requests_total Requests.\n# TYPE argo_requests_total counter\n" in text
+    values = samples(text)
+    assert values['argo_requests_total{path="/api/query",status="200"}'] == "3"
+    assert values['argo_requests_total{path="a\\"b\\\\c\\nd",status="500"}'] == "1"
+    assert text.endswith("\n")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    hist = registry.histogram("argo_latency_seconds", "Latency.", ("path",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        hist.observe(value, path="/q")
+    values = samples(registry.render())
+    assert values['argo_latency_seconds_bucket{path="/q",le="0.1"}'] == "2"
+    assert values['argo_latency_seconds_bucket{path="/q",le="1.0"}'] == "3"
+    assert values['argo_latency_seconds_bucket{path="/q",le="+Inf"}'] == "4"
+    assert values['argo_latency_seconds_count{path="/q"}'] == "4"
+    assert float(values['argo_latency_seconds_sum{path="/q"}']) == 2.65
+
+
+def test_collectors_run_at_scrape_time_and_failures_are_skipped():
+    registry = Registry()
+    state = {"hits": 1}
+    registry.collector("argo_cache_total", "Cache lookups.", lambda: dict(state), "outcome")
+    registry.collector("argo_broken", "Raises.", lambda: 1 / 0, "x")
+    registry.collector("argo_pool_in_use", "Connections.", lambda: {"db": 2}, "pool", metric_type="gauge")
+    state["misses"] = 4
+    text = registry.render()
+    assert "argo_broken" not in text
+    assert "# TYPE argo_pool_in_use gauge" in text
+    values = samples(text)
+    assert values['argo_cache_total{outcome="hits"}'] == "1" and values['argo_cache_total{outcome="misses"}'] == "4"
+
+
+def test_spans_feed_the_histogram_and_this_threads_server_timing():
+    registry = Registry()
+    registry.start_request()
+    with registry.span("sql"):
+        pass
+    with registry.span("sql"):
+        pass
+
+    def other_request():
+        with registry.span("llm"):
+            pass
+
+    other = threading.Thread(target=other_request)
+    other.start()
+    other.join()
+    spans = registry.finish_request()
+    assert [stage for stage, _ in spans] == ["sql", "sql"]
+    values = samples(registry.render())
+    assert values['argo_stage_duration_seconds_count{stage="sql"}'] == "2"
+    assert values['argo_stage_duration_seconds_count{stage="llm"}'] == "1"
+    assert registry.finish_request() == []
+    header = server_timing([("sql", 0.0012), ("llm", 0.25), ("sql", 0.0003)])
+    assert header == "sql;dur=1.5, llm;dur=250.0"
+
+
+def test_metrics_endpoint_serves_the_text_format(client):
+    client.get("/healthz")
+    resp = client.get("/metrics")
+    assert resp.status_code == 200 and resp.mimetype == "text/plain"
+    text = resp.get_data(as_text=True)
+    assert "# TYPE argo_stage_duration_seconds histogram" in text
+    assert 'endpoint="/healthz"' in text
+    for line in text.splitlines():
+        assert line.startswith("# ") or len(line.rsplit(" ", 1)) == 2
@@ -0,0 +1,74 @@
+import sqlite3
+import sys
+
+import pytest
+
+import migrate_db
+from rollups import ROLLUPS, has_rollups
+from schema import SCHEMA_VERSION, detect_schema
+from spatial import has_spatial_index
+
+LEGACY_DDL = """
+CREATE TABLE argo_metadata (float_id TEXT, platform_type TEXT, country TEXT, deployment_date TEXT);
+CREATE TABLE argo_profiles (profile_id INTEGER, float_id TEXT, cycle_number INTEGER, latitude REAL, longitude REAL,
+                            date TEXT, pressure REAL, temperature REAL, salinity REAL);
+"""
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = str(tmp_path / "argo_data.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_DDL)
+    conn.executemany("INSERT INTO argo_metadata VALUES (?, ?, ?, ?)",
+                     [("b'1900121 '", "APEX", "India", "2019/03/04"), ("1900122", "ARVOR", "France", "2020-01-15")])
+    conn.executemany("INSERT INTO argo_profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (i, "b'1900121 '" if i % 2 else "1900122", i // 10, 10.0 + i / 100, 70.0 - i / 100,
+         f"2021/{i % 12 + 1}/{i % 27 + 1} 0{i % 10}:30", float(i % 50) * 10, 20.0 - i / 100, 35.0)
+        for i in range(200)
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def run_migration(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["migrate_db.py", *args])
+    assert migrate_db.main() == 0
+
+
+def snapshot(path):
+    """Every table's rows (minus the migration timestamp), plus the index names."""
+    conn = sqlite3.connect(path)
+    tables = ["argo_metadata", "argo_profiles", *ROLLUPS]
+    data = {t: sorted(conn.execute(f"SELECT * FROM {t}").fetchall(), key=repr) for t in tables}
+    data["schema_info"] = sorted(conn.execute("SELECT * FROM schema_info WHERE key != 'migrated_at'").fetchall())
+    data["indexes"] = sorted(r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    data["flags"] = (detect_schema(conn), has_spatial_index(conn), has_rollups(conn))
+    conn.close()
+    return data
+
+
+def test_migration_normalizes_the_legacy_schema(monkeypatch, legacy_db):
+    run_migration(monkeypatch, legacy_db)
+    conn = sqlite3.connect(legacy_db)
+    assert detect_schema(conn) == SCHEMA_VERSION
+    assert sorted(r[0] for r in conn.execute("SELECT DISTINCT float_id FROM argo_profiles")) == [1900121, 1900122]
+    assert conn.execute("SELECT COUNT(*) FROM argo_profiles WHERE date_epoch IS NULL").fetchone()[0] == 0
+    assert conn.execute("SELECT deployment_date FROM argo_metadata WHERE float_id = 1900121").fetchone()[0] == \
+        "2019-03-04 00:00:00"
+    conn.close()
+
+
+def test_running_the_migration_twice_changes_nothing(monkeypatch, legacy_db):
+    run_migration(monkeypatch, legacy_db)
+    first = snapshot(legacy_db)
+    run_migration(monkeypatch, legacy_db)
+    assert snapshot(legacy_db) == first
+    assert first["flags"][0] == SCHEMA_VERSION and first["flags"][2]
+
+
+def test_migrating_the_same_legacy_file_twice_gives_the_same_database(monkeypatch, legacy_db, tmp_path):
+    run_migration(monkeypatch, legacy_db, "--out", str(tmp_path / "a.db"))
+    run_migration(monkeypatch, legacy_db, "--out", str(tmp_path / "b.db"))
+    assert snapshot(str(tmp_path / "a.db")) == snapshot(str(tmp_path / "b.db"))
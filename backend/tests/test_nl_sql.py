@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from nl_sql import PLOT_COLUMNS, compile_query, inline_params
+from spatial import register_functions
+
+
+@pytest.fixture(scope="module")
+def conn(synth_db_path):
+    conn = sqlite3.connect(f"file:{synth_db_path}?mode=ro", uri=True)
+    register_functions(conn)
+    yield conn
+    conn.close()
+
+
+def test_same_shape_shares_one_template():
+    sql_a, params_a = compile_query("temperature at latitude 12.5 longitude 80.1 in 2019")
+    sql_b, params_b = compile_query("Temperature at latitude -3 longitude 65 in 2021")
+    assert sql_a == sql_b
+    assert "12.5" not in sql_a and "2019" not in sql_a
+    assert params_a != params_b
+    assert sql_a.count("?") == len(params_a)
+
+
+def test_different_shapes_get_different_templates():
+    assert compile_query("salinity in 2019")[0] != compile_query("temperature in 2019")[0]
+    assert compile_query("temperature in 2019")[0] != compile_query("temperature")[0]
+    assert compile_query("temperature limit 5") == compile_query("temperature")[:1] + ((5,),)
+
+
+def test_dates_are_normalized_and_the_end_day_is_inclusive():
+    _, params = compile_query("salinity from 2020/1/5 to 2020-02-01")
+    assert params[:2] == ("2020-01-05 00:00:00", "2020-02-01 23:59:59")
+    _, params = compile_query("salinity in 2019")
+    assert params[:2] == ("2019-01-01 00:00:00", "2019-12-31 23:59:59")
+
+
+def test_legacy_schema_keeps_the_join_and_text_float_ids():
+    sql, params = compile_query("location of float 1900100", legacy=True)
+    assert "JOIN argo_metadata" in sql and "ORDER BY date DESC" in sql
+    assert params == ("b'1900100 '", 1)
+    assert "JOIN" not in compile_query("location of float 1900100")[0]
+
+
+def test_plot_queries_select_the_resampling_columns():
+    sql, _ = compile_query("temperature in 2019", for_plot=True)
+    select = sql.split(" FROM ")[0]
+    assert all(col in select for col in PLOT_COLUMNS)
+
+
+def test_aggregates():
+    sql, params = compile_query("average of temperature between latitude between 0 and 10")
+    assert sql.startswith("SELECT AVG(temperature) as avg_temperature FROM argo_profiles WHERE latitude BETWEEN")
+    assert params == (0.0, 10.0, 100)
+
+
+@pytest.mark.parametrize("question", [
+    "temperature at latitude 12.5 longitude 80.1",
+    "salinity and pressure in 2019 limit 20",
+    "max of salinity from 2019-01-01 to 2019-06-30",
+    "location of float 1901961",
+    "temperature near the equator",
+])
+def test_templates_run_against_the_database(conn, question):
+    for has_spatial in (False, True):
+        sql, params = compile_query(question, has_spatial=has_spatial)
+        rows = conn.execute(sql, params).fetchall()
+        assert len(rows) <= params[-1]
+
+
+def test_rtree_box_covers_the_plain_nearby_filter(conn):
+    question = "temperature and latitude at latitude -14.9 longitude 98.5 limit 9999"
+    plain = conn.execute(*compile_query(question)).fetchall()
+    indexed = conn.execute(*compile_query(question, has_spatial=True)).fetchall()
+    assert plain and set(plain) <= set(indexed)  # the box is widened by 1/cos(latitude)
+
+
+def test_inline_params_quotes_strings():
+    assert inline_params("SELECT ? WHERE a = ? AND b = ?", ("it's", 3, 1.5)) == \
+        "SELECT 'it''s' WHERE a = 3 AND b = 1.5"
@@ -0,0 +1,53 @@
+import pytest
+
+from qr_render import QRRenderer
+
+URL = "http://localhost:8501/?history_id=abc"
+
+
+def test_renders_are_cached_by_content():
+    renderer = QRRenderer()
+    body, etag = renderer.render(URL)
+    assert body.startswith(b"\x89PNG")
+    assert renderer.render(URL) == (body, etag)
+    assert renderer.render(URL, fmt="svg")[1] != etag
+    assert renderer.render(URL, box_size=4)[1] != etag
+    assert (renderer.renders, renderer.hits) == (3, 1)
+
+
+def test_cache_dir_is_shared_between_renderers(tmp_path):
+    body, etag = QRRenderer(cache_dir=str(tmp_path)).render(URL, fmt="svg")
+    other = QRRenderer(cache_dir=str(tmp_path))
+    assert other.render(URL, fmt="svg") == (body, etag)
+    assert other.renders == 0
+
+
+@pytest.fixture
+def history_id(app_module):
+    return app_module.history_store.put([{"role": "user", "content": "salinity near Chennai"}])
+
+
+def test_history_qr_is_cacheable_and_revalidates_with_304(client, app_module, history_id):
+    first = client.get(f"/api/qr/{history_id}")
+    assert first.status_code == 200 and first.mimetype == "image/png"
+    etag = first.headers["ETag"].strip('"')
+    assert "public" in first.headers["Cache-Control"] and "max-age=86400" in first.headers["Cache-Control"]
+
+    renders = app_module.qr_renderer.renders
+    again = client.get(f"/api/qr/{history_id}", headers={"If-None-Match": f'"{etag}"'})
+    assert again.status_code == 304 and again.data == b""
+    assert again.headers["ETag"].strip('"') == etag
+    assert app_module.qr_renderer.renders == renders
+
+    svg = client.get(f"/api/qr/{history_id}?format=svg", headers={"If-None-Match": f'"{etag}"'})
+    assert svg.status_code == 200 and svg.mimetype == "image/svg+xml"
+
+
+def test_unknown_history_is_404(client):
+    assert client.get("/api/qr/no-such-history").status_code == 404
+
+
+def test_post_stores_the_history_and_returns_an_etagged_image(client):
+    resp = client.post("/api/qr_code", json={"history": [{"role": "user", "content": "hi"}]})
+    assert resp.status_code == 200 and resp.mimetype == "image/png" and resp.headers.get("ETag")
+    assert client.post("/api/qr_code", json={"history": []}).status_code == 400
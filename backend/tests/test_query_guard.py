@@ -0,0 +1,142 @@
+import sqlite3
+import time
+
+import pytest
+
+from query_guard import CursorError, QueryGuard, QueryRejected, decode_cursor, encode_cursor, paginate, split_page
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE argo_profiles (float_id INTEGER, date TEXT, temperature REAL)")
+    conn.execute("CREATE INDEX idx_profiles_float_date ON argo_profiles(float_id, date)")
+    conn.executemany("INSERT INTO argo_profiles VALUES (?, ?, ?)",
+                     [(1900100 + i % 5, f"2020-01-{i % 28 + 1:02d}", float(i)) for i in range(1000)])
+    return conn
+
+
+class CannedPlan:
+    """A connection whose EXPLAIN QUERY PLAN returns fixed rows (another SQLite version's format)."""
+
+    def __init__(self, conn, plan):
+        self.conn = conn
+        self.plan = plan
+
+    def execute(self, sql, params=()):
+        if sql.startswith("EXPLAIN QUERY PLAN"):
+            return self.conn.execute("SELECT * FROM (VALUES " + ", ".join("(?, ?, ?, ?)" for _ in self.plan) + ")",
+                                     [v for row in self.plan for v in row])
+        return self.conn.execute(sql, params)
+
+
+def test_full_scan_with_sort_of_a_large_table_is_rejected(conn):
+    guard = QueryGuard(large_table_rows=100)
+    with pytest.raises(QueryRejected, match="full scan of argo_profiles"):
+        guard.check_plan(conn, "SELECT * FROM argo_profiles ORDER BY temperature")
+    guard.check_plan(conn, "SELECT * FROM argo_profiles WHERE float_id = ? ORDER BY date", (1900101,))
+    assert QueryGuard(large_table_rows=10 ** 6).check_plan(conn, "SELECT * FROM argo_profiles ORDER BY temperature") \
+        is None
+
+
+def test_pre_3_36_plan_format_is_understood(conn):
+    guard = QueryGuard(large_table_rows=100)
+    old = CannedPlan(conn, [(3, 0, 0, "SCAN TABLE argo_profiles"), (9, 0, 0, "USE TEMP B-TREE FOR ORDER BY")])
+    with pytest.raises(QueryRejected, match="full scan of argo_profiles"):
+        guard.check_plan(old, "SELECT * FROM argo_profiles ORDER BY temperature")
+    indexed = CannedPlan(conn, [(3, 0, 0, "SEARCH TABLE argo_profiles USING INDEX idx_profiles_float_date (float_id=?)")])
+    guard.check_plan(indexed, "SELECT * FROM argo_profiles WHERE float_id = 1900101 ORDER BY date")
+
+
+def test_unrecognized_plan_fails_closed(conn):
+    guard = QueryGuard(large_table_rows=100)
+    odd = CannedPlan(conn, [(3, 0, 0, "VISIT argo_profiles IN SOME NEW WAY")])
+    with pytest.raises(QueryRejected, match="no table access recognized"):
+        guard.check_plan(odd, "SELECT * FROM argo_profiles")
+    assert guard.stats()["unparsed"] == 1
+
+
+def test_unsupported_sqlite_version_fails_closed(conn):
+    guard = QueryGuard(large_table_rows=100)
+    guard.plan_supported = False
+    with pytest.raises(QueryRejected, match="not supported"):
+        guard.check_plan(conn, "SELECT * FROM argo_profiles WHERE float_id = 1900101")
+
+
+def test_cursor_round_trips_and_is_bound_to_its_query():
+    sql, params = "SELECT * FROM argo_profiles WHERE float_id = ?", (1900101,)
+    cursor = encode_cursor(sql, params, ["2020-01-02", 17], 500)
+    assert decode_cursor(cursor, sql, params) == (["2020-01-02", 17], 500)
+    with pytest.raises(CursorError):
+        decode_cursor(cursor, sql, (1900102,))
+    with pytest.raises(CursorError):
+        decode_cursor("not-a-cursor", sql, params)
+
+
+def test_pages_cover_every_row_once(conn):
+    sql, params = "SELECT float_id, date, temperature FROM argo_profiles WHERE float_id = ? ORDER BY date", (1900101,)
+    expected = conn.execute(sql + ", rowid", params).fetchall()
+    pages, cursor = [], None
+    while True:
+        page_sql, page_params, key_count, page_limit, seen = paginate(sql, params, 30, cursor)
+        cursor_rows = conn.execute(page_sql, page_params)
+        col_names = [d[0] for d in cursor_rows.description]
+        col_names, rows, cursor = split_page(sql, params, col_names, cursor_rows.fetchall(), key_count, page_limit,
+                                             seen)
+        assert col_names == ["float_id", "date", "temperature"]
+        pages.append(rows)
+        if cursor is None:
+            break
+    assert [row for page in pages for row in page] == expected
+    assert len(pages) == 7 and all(len(page) == 30 for page in pages[:-1])
+
+
+def test_explicit_limit_is_honoured_across_pages(conn):
+    sql = "SELECT float_id, temperature FROM argo_profiles ORDER BY float_id LIMIT 45"
+    total, cursor = 0, None
+    while True:
+        page_sql, page_params, key_count, page_limit, seen = paginate(sql, (), 20, cursor)
+        result = conn.execute(page_sql, page_params)
+        _, rows, cursor = split_page(sql, (), [d[0] for d in result.description], result.fetchall(), key_count,
+                                     page_limit, seen)
+        total += len(rows)
+        if cursor is None:
+            break
+    assert total == 45
+
+
+def all_pages(conn, sql, params, page_size):
+    pages, cursor = [], None
+    while True:
+        page_sql, page_params, key_count, page_limit, seen = paginate(sql, params, page_size, cursor)
+        result = conn.execute(page_sql, page_params)
+        _, rows, cursor = split_page(sql, params, [d[0] for d in result.description], result.fetchall(), key_count,
+                                     page_limit, seen)
+        pages.append(rows)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("direction", ["ASC", "DESC"])
+@pytest.mark.parametrize("page_size", [1, 7, 30])
+def test_pages_continue_through_null_sort_keys(conn, direction, page_size):
+    conn.executemany("INSERT INTO argo_profiles VALUES (?, ?, ?)",
+                     [(1900101, None if i % 3 else f"2021-02-{i % 5 + 1:02d}", None if i % 4 else float(i))
+                      for i in range(60)])
+    sql = f"SELECT float_id, date, temperature FROM argo_profiles WHERE float_id = ? ORDER BY date {direction}, " \
+          f"temperature {direction}"
+    expected = conn.execute(sql + f", rowid {direction}", (1900101,)).fetchall()
+    pages = all_pages(conn, sql, (1900101,), page_size)
+    assert [row for page in pages for row in page] == expected
+    assert sum(row[1] is None for row in expected) == 40
+
+
+def test_table_sizes_are_remeasured_after_the_ttl(conn):
+    guard = QueryGuard(large_table_rows=1500, table_rows_ttl=0.05)
+    sql = "SELECT * FROM argo_profiles ORDER BY temperature"
+    guard.check_plan(conn, sql)  # 1000 rows: small
+    conn.executemany("INSERT INTO argo_profiles VALUES (?, ?, ?)", [(1900200, "2020-02-01", 1.0)] * 1000)
+    guard.check_plan(conn, sql)  # still the cached size
+    time.sleep(0.06)
+    with pytest.raises(QueryRejected, match="full scan of argo_profiles"):
+        guard.check_plan(conn, sql)
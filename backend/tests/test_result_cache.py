@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from result_cache import ResultCache, canonicalize_sql
+
+ROWS = [(1900100, 28.5), (1900101, 27.9)]
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "argo_data.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE argo_profiles (float_id INTEGER, temperature REAL)")
+    yield path, conn
+    conn.close()
+
+
+def test_equivalent_sql_shares_a_key_but_literals_and_params_do_not():
+    assert canonicalize_sql("SELECT  *\nFROM argo_profiles WHERE float_id = 1 ;") == \
+        canonicalize_sql("select * from argo_profiles where float_id=1")
+    assert canonicalize_sql("SELECT * FROM t WHERE c = 'Arabian  Sea'") != \
+        canonicalize_sql("SELECT * FROM t WHERE c = 'arabian sea'")
+    assert ResultCache.key("SELECT ?", (1,)) != ResultCache.key("SELECT ?", (2,))
+
+
+def test_hit_after_put(db):
+    path, _ = db
+    cache = ResultCache(path)
+    assert cache.get("SELECT * FROM argo_profiles") is None
+    cache.put("SELECT * FROM argo_profiles", ["float_id", "temperature"], ROWS)
+    assert cache.get("select *  from argo_profiles;") == (("float_id", "temperature"), ROWS)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("statement", [
+    "INSERT INTO argo_profiles VALUES (1900102, 26.0)",
+    "DELETE FROM argo_profiles",
+])
+def test_writes_to_the_database_or_its_wal_invalidate(db, statement):
+    path, conn = db
+    conn.execute("INSERT INTO argo_profiles VALUES (1900100, 28.5)")  # creates the -wal file
+    cache = ResultCache(path)
+    cache.put("SELECT * FROM argo_profiles", ["float_id", "temperature"], ROWS)
+    assert cache.get("SELECT * FROM argo_profiles") is not None
+    conn.execute(statement)
+    assert cache.get("SELECT * FROM argo_profiles") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_checkpoint_into_the_main_file_invalidates(db):
+    path, conn = db
+    conn.execute("INSERT INTO argo_profiles VALUES (1900100, 28.5)")
+    cache = ResultCache(path)
+    cache.put("SELECT 1", ["1"], [(1,)])
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    assert cache.get("SELECT 1") is None
+
+
+def test_result_read_before_a_write_is_not_cached(db):
+    path, conn = db
+    cache = ResultCache(path)
+    version = cache.db_version()  # taken before the query ran
+    conn.execute("INSERT INTO argo_profiles VALUES (1900100, 28.5)")
+    cache.put("SELECT * FROM argo_profiles", ["float_id", "temperature"], [], version=version)
+    assert cache.get("SELECT * FROM argo_profiles") is None
+
+
+def test_byte_bound_evicts_least_recently_used(db):
+    path, _ = db
+    rows = [("x" * 100,)] * 10  # about 1.6 kB
+    cache = ResultCache(path, max_bytes=4000, max_entry_bytes=4000)
+    cache.put("SELECT 1", ["c"], rows)
+    cache.put("SELECT 2", ["c"], rows)
+    cache.get("SELECT 1")
+    cache.put("SELECT 3", ["c"], rows)
+    assert cache.get("SELECT 2") is None
+    assert cache.get("SELECT 1") is not None and cache.get("SELECT 3") is not None
+    assert cache.stats()["bytes"] <= 4000
+
+
+def test_oversized_results_are_not_cached(db):
+    path, _ = db
+    cache = ResultCache(path, max_bytes=8000)  # entries up to 1000 bytes
+    cache.put("SELECT big", ["c"], [("x" * 2000,)])
+    assert cache.get("SELECT big") is None
@@ -0,0 +1,75 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from result_formats import PACKED_MAGIC, encode_result, negotiate_format
+
+COLUMNS = ["float_id", "date", "pressure", "temperature", "qc"]
+ROWS = [
+    (1900100, "2020-01-01", 5.0, 28.123456789, None),
+    (1900101, "2020-01-02", 10, None, "good"),
+    (1900102, None, 15.5, 27.5, b"bad"),
+]
+
+
+def decode_packed(body):
+    assert body[:4] == PACKED_MAGIC
+    (header_len,) = struct.unpack("<I", body[4:8])
+    header = json.loads(body[8:8 + header_len])
+    data = body[8 + header_len:]
+    columns = {}
+    for col in header["columns"]:
+        buf = data[col["offset"]:col["offset"] + col["length"]]
+        if col["dtype"] == "json":
+            values = json.loads(buf)
+        else:
+            values = np.frombuffer(buf, dtype="<f4" if col["dtype"] == "float32" else "<i8")
+        columns[col["name"]] = (col["dtype"], values)
+    return header, columns
+
+
+def test_columnar_round_trips_values_and_labels_their_types():
+    result = encode_result(COLUMNS, ROWS, "columnar")
+    assert result["columns"] == COLUMNS and result["row_count"] == 3
+    assert result["dtypes"] == ["int64", "json", "float64", "float64", "json"]
+    rows = list(zip(*result["values"]))
+    assert rows[0] == (1900100, "2020-01-01", 5.0, 28.123456789, None)  # full float64 precision
+    assert rows[1][3] is None and rows[2][4] == "bad"
+    assert json.loads(json.dumps(result)) == result
+
+
+def test_packed_round_trips_with_float32_buffers():
+    header, columns = decode_packed(encode_result(COLUMNS, ROWS, "packed", summary="three rows"))
+    assert header["summary"] == "three rows" and header["row_count"] == 3
+    assert [c["name"] for c in header["columns"]] == COLUMNS
+    assert columns["float_id"][1].tolist() == [1900100, 1900101, 1900102]
+    dtype, temperature = columns["temperature"]
+    assert dtype == "float32" and temperature.dtype == np.float32
+    assert temperature[0] == pytest.approx(28.123456789, rel=1e-6) and np.isnan(temperature[1])
+    assert columns["date"] == ("json", ["2020-01-01", "2020-01-02", None])
+    assert columns["qc"] == ("json", [None, "good", "bad"])
+
+
+def test_empty_results_keep_their_columns():
+    assert encode_result(COLUMNS, [], "columnar")["values"] == [[] for _ in COLUMNS]
+    header, columns = decode_packed(encode_result(COLUMNS, [], "packed"))
+    assert header["row_count"] == 0 and all(len(values) == 0 for _, values in columns.values())
+
+
+def test_arrow_round_trips():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.ipc.open_stream(encode_result(COLUMNS, ROWS, "arrow", summary="s")).read_all()
+    assert table.column_names == COLUMNS
+    assert table.schema.metadata[b"summary"] == b"s"
+    assert table.column("temperature").to_pylist()[1] is None
+    assert table.column("float_id").to_pylist() == [1900100, 1900101, 1900102]
+
+
+def test_format_negotiation():
+    assert negotiate_format(None) == "rows"
+    assert negotiate_format("application/json; format=columnar") == "columnar"
+    assert negotiate_format("application/x-argo-packed") == "packed"
+    assert negotiate_format("", "PACKED") == "packed"
+    assert negotiate_format("", "xml") == "rows"
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import numpy as np
+
+from retrieval import EmbeddingBatcher, EmbeddingCache, FloatRetriever
+
+
+class FakeEncoder:
+    """sentence-transformers encode() stand-in: one vector per text, records the batches it was given."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        time.sleep(self.delay)
+        with self._lock:
+            self.batches.append(list(texts))
+        return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in texts], dtype=np.float32)
+
+
+class FakeIndex:
+    def __init__(self):
+        self.queries = []
+
+    def search(self, vectors, k):
+        self.queries.append(vectors.copy())
+        return [[{"float_id": 1900100 + i} for i in range(k)] for _ in vectors]
+
+
+def test_cache_key_ignores_case_and_spacing_but_not_the_model():
+    cache = EmbeddingCache("model-a")
+    assert cache.key("Salinity  near Chennai ") == cache.key("salinity near chennai")
+    assert cache.key("salinity") != EmbeddingCache("model-b").key("salinity")
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = EmbeddingCache("m", max_entries=2)
+    for name in ("a", "b"):
+        cache.put(name, np.ones(3))
+    assert cache.get("a") is not None  # "a" is now the most recent
+    cache.put("c", np.ones(3))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    EmbeddingCache("m", disk_path=path).put("k", np.arange(4))
+    vec = EmbeddingCache("m", disk_path=path).get("k")
+    assert vec.dtype == np.float32 and vec.tolist() == [0, 1, 2, 3]
+
+
+def test_concurrent_requests_share_one_encode_call():
+    encoder = FakeEncoder()
+    batcher = EmbeddingBatcher(encoder, max_batch=32, window_ms=50)
+    futures = [batcher.submit(f"query {i}") for i in range(10)]
+    vectors = [f.result(timeout=2) for f in futures]
+    assert len(encoder.batches) == 1 and len(encoder.batches[0]) == 10
+    assert vectors[3].tolist() == encoder.encode(["query 3"])[0].tolist()
+
+
+def test_batches_are_capped_at_max_batch():
+    encoder = FakeEncoder()
+    batcher = EmbeddingBatcher(encoder, max_batch=4, window_ms=50)
+    for f in [batcher.submit(str(i)) for i in range(10)]:
+        f.result(timeout=2)
+    assert max(len(b) for b in encoder.batches) <= 4
+    assert sum(len(b) for b in encoder.batches) == 10
+
+
+def test_encode_errors_reach_every_caller_in_the_batch():
+    class Broken:
+        def encode(self, texts, **kwargs):
+            raise RuntimeError("model crashed")
+
+    batcher = EmbeddingBatcher(Broken(), window_ms=20)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    assert all(isinstance(f.exception(timeout=2), RuntimeError) for f in futures)
+
+
+def test_retrieve_uses_the_cache_on_repeat_queries():
+    encoder, index = FakeEncoder(), FakeIndex()
+    retriever = FloatRetriever(index, encoder, "m", budget_ms=1000, batch_window_ms=1)
+    assert retriever.retrieve("floats near Chennai", k=2) == [{"float_id": 1900100}, {"float_id": 1900101}]
+    time.sleep(0.05)  # the cache is filled by the future's callback
+    retriever.retrieve("Floats  near chennai", k=2)
+    assert len(encoder.batches) == 1
+    assert retriever.cache.hits == 1
+
+
+def test_slow_embedding_is_skipped_but_still_cached():
+    encoder = FakeEncoder(delay=0.2)
+    retriever = FloatRetriever(FakeIndex(), encoder, "m", budget_ms=50, batch_window_ms=1)
+    assert retriever.retrieve("slow question") == []
+    assert retriever.skipped == 1
+    time.sleep(0.3)
+    assert retriever.retrieve("slow question") != []
+
+
+def test_budget_counts_from_the_callers_start_time():
+    retriever = FloatRetriever(FakeIndex(), FakeEncoder(delay=0.05), "m", budget_ms=100, batch_window_ms=1)
+    assert retriever.retrieve("late question", started=time.monotonic() - 0.1) == []
+    assert retriever.skipped == 1
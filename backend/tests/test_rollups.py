@@ -0,0 +1,73 @@
+import random
+import sqlite3
+
+import pytest
+
+from nl_sql import compile_query
+from rollups import has_rollups, refresh_rollups
+from schema import PROFILE_COLUMNS, create_schema, normalize_date
+
+QUESTIONS = [
+    "average of temperature for float 1900101",
+    "max of salinity for float 1900103",
+    "min of temperature from 2021-03-01 to 2021-05-31",
+    "count of salinity in 2021",
+    "average of pressure with latitude between 10 and 20",
+    "max of temperature with latitude between -5 and 5 and longitude between 60 and 70",
+    "count of temperature",
+]
+
+
+def add_rows(conn, n, seed):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        iso, epoch = normalize_date(f"2021-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} 06:00:00")
+        # Whole-degree positions put rows on cell edges, the case the rollups keep apart.
+        lat = float(rnd.randint(-10, 25)) if i % 4 == 0 else round(rnd.uniform(-10, 25), 3)
+        rows.append((i, 1900100 + rnd.randint(0, 4), rnd.randint(1, 50), lat, round(rnd.uniform(55, 75), 3), iso,
+                     epoch, round(rnd.uniform(0, 2000), 1),
+                     None if i % 7 == 0 else round(rnd.uniform(2, 30), 3), round(rnd.uniform(33, 37), 3)))
+    conn.executemany(f"INSERT INTO argo_profiles ({', '.join(PROFILE_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' for _ in PROFILE_COLUMNS)})", rows)
+    conn.commit()
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+    add_rows(conn, 3000, seed=1)
+    refresh_rollups(conn)
+    return conn
+
+
+def answer(conn, question, rollups):
+    sql, params = compile_query(question, has_rollups=rollups)
+    assert ("rollup_" in sql) == rollups, sql
+    return conn.execute(sql, params).fetchone()[0]
+
+
+def assert_rollups_match_raw(conn):
+    for question in QUESTIONS:
+        assert answer(conn, question, True) == pytest.approx(answer(conn, question, False), rel=1e-9), question
+
+
+def test_rollup_answers_match_raw_aggregates(conn):
+    assert has_rollups(conn)
+    assert_rollups_match_raw(conn)
+
+
+def test_incremental_refresh_matches_raw_aggregates(conn):
+    add_rows(conn, 500, seed=2)
+    assert not has_rollups(conn)  # stale until refreshed
+    assert refresh_rollups(conn) == 500
+    assert has_rollups(conn)
+    assert_rollups_match_raw(conn)
+
+
+def test_rebuild_after_deletes_matches_raw_aggregates(conn):
+    conn.execute("DELETE FROM argo_profiles WHERE float_id = 1900101 AND rowid % 3 = 0")
+    conn.commit()
+    refresh_rollups(conn, rebuild=True)
+    assert_rollups_match_raw(conn)
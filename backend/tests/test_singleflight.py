@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from singleflight import CoalesceTimeout, SingleFlight, coalesce_key
+
+
+def run_concurrently(n, target):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_coalesce_key_normalizes_query_text():
+    assert coalesce_key("Show  Temperature ", "en") == coalesce_key("show temperature", "en")
+    assert coalesce_key("show temperature", "en") != coalesce_key("show temperature", "hi")
+
+
+def test_identical_concurrent_calls_run_the_loader_once():
+    flight = SingleFlight(timeout=5)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"rows": 3}
+
+    results, errors = run_concurrently(2, lambda: flight.do("k", loader))
+    assert errors == []
+    assert results == [{"rows": 3}, {"rows": 3}]
+    assert len(calls) == 1
+    assert flight.stats()["leaders"] == 1 and flight.stats()["followers"] == 1
+
+
+def test_errors_propagate_to_waiters():
+    flight = SingleFlight(timeout=5)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        raise ValueError("bad query")
+
+    results, errors = run_concurrently(3, lambda: flight.do("k", loader))
+    assert results == [] and len(errors) == 3
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert len(calls) == 1
+
+
+def test_waiters_time_out():
+    flight = SingleFlight(timeout=0.1)
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("k", lambda: release.wait(5)))
+    leader.start()
+    time.sleep(0.05)
+    with pytest.raises(CoalesceTimeout):
+        flight.do("k", lambda: None)
+    release.set()
+    leader.join()
+
+
+def test_lone_request_writes_no_result_file(tmp_path):
+    flight = SingleFlight(timeout=5, shared_dir=str(tmp_path))
+    assert flight.do(coalesce_key("q"), lambda: {"rows": 1}) == {"rows": 1}
+    assert [name for name in os.listdir(tmp_path) if name != "coalesce.lock"] == []
+    assert flight.stats()["published"] == 0
+
+
+def _shared_worker(shared_dir, key, calls_path, out):
+    flight = SingleFlight(timeout=10, shared_dir=shared_dir)
+
+    def loader():
+        with open(calls_path, "a") as f:
+            f.write("x")
+        time.sleep(0.5)
+        return {"rows": [1, 2, 3]}
+
+    out.put(flight.do(key, loader))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="cross-process coalescing needs POSIX locks")
+def test_identical_queries_in_two_processes_run_the_loader_once(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    calls_path = str(tmp_path / "calls")
+    shared_dir = str(tmp_path / "coalesce")
+    key = coalesce_key("salinity at 100 dbar", "en")
+    procs = [ctx.Process(target=_shared_worker, args=(shared_dir, key, calls_path, out)) for _ in range(2)]
+    for p in procs:
+        p.start()
+    results = [out.get(timeout=20) for _ in procs]
+    for p in procs:
+        p.join(timeout=20)
+    assert results == [{"rows": [1, 2, 3]}] * 2
+    with open(calls_path) as f:
+        assert f.read() == "x"
+    assert os.listdir(shared_dir) == ["coalesce.lock"]  # the published result was cleaned up
@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from spatial import box_predicate, ensure_spatial_index, great_circle_km, nearest_profiles, register_functions
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    register_functions(conn)
+    return conn
+
+
+def brute_force_nearest_floats(conn, lat, lon, k):
+    best = {}
+    for float_id, p_lat, p_lon in conn.execute("SELECT float_id, latitude, longitude FROM argo_profiles"):
+        d = great_circle_km(lat, lon, p_lat, p_lon)
+        if d is not None and d < best.get(float_id, float("inf")):
+            best[float_id] = d
+    return sorted(best.items(), key=lambda item: item[1])[:k]
+
+
+@pytest.mark.parametrize("lat,lon,k", [(12.0, 80.0, 5), (-10.0, 60.0, 3), (20.0, 65.0, 12), (0.0, -150.0, 2)])
+def test_nearest_floats_match_a_brute_force_search(synth_db_path, lat, lon, k):
+    conn = connect(synth_db_path)
+    col_names, rows = nearest_profiles(conn, lat, lon, k=k)
+    expected = brute_force_nearest_floats(conn, lat, lon, k)
+    conn.close()
+    assert col_names[-1] == "distance_km"
+    assert [row[0] for row in rows] == [float_id for float_id, _ in expected]
+    assert [row[-1] for row in rows] == pytest.approx([d for _, d in expected])
+
+
+def test_grouping_modes(synth_db_path):
+    conn = connect(synth_db_path)
+    _, floats = nearest_profiles(conn, 12.0, 80.0, k=4)
+    cols, profiles = nearest_profiles(conn, 12.0, 80.0, k=4, group_by="profile_id", columns=["latitude"])
+    _, levels = nearest_profiles(conn, 12.0, 80.0, k=4, group_by=None)
+    conn.close()
+    assert len({row[0] for row in floats}) == 4
+    assert cols == ["profile_id", "latitude", "distance_km"] and len({row[0] for row in profiles}) == 4
+    assert len(levels) == 4 and [row[-1] for row in levels] == sorted(row[-1] for row in levels)
+    with pytest.raises(ValueError):
+        nearest_profiles(sqlite3.connect(":memory:"), 0.0, 0.0, group_by="date")
+
+
+@pytest.fixture
+def dateline_conn():
+    conn = sqlite3.connect(":memory:")
+    register_functions(conn)
+    conn.execute("CREATE TABLE argo_profiles (float_id INTEGER, date TEXT, latitude REAL, longitude REAL, "
+                 "pressure REAL, temperature REAL, salinity REAL)")
+    conn.executemany("INSERT INTO argo_profiles VALUES (?, '2020-01-01', ?, ?, 5, 20, 35)",
+                     [(1, 0.0, 179.8), (2, 0.0, -179.8), (3, 0.0, 170.0), (4, 0.0, -170.0), (5, 0.0, 0.0)])
+    ensure_spatial_index(conn)
+    return conn
+
+
+def ids_in_box(conn, lat, lon, radius_deg):
+    clauses, params = box_predicate(lat, lon, radius_deg)
+    return sorted(r[0] for r in conn.execute(
+        f"SELECT float_id FROM argo_profiles WHERE rowid IN (SELECT id FROM argo_positions WHERE {clauses})", params))
+
+
+def test_box_wraps_across_the_dateline(dateline_conn):
+    assert ids_in_box(dateline_conn, 0.0, 179.9, 1.0) == [1, 2]
+    assert ids_in_box(dateline_conn, 0.0, -179.9, 1.0) == [1, 2]
+    assert ids_in_box(dateline_conn, 0.0, 179.9, 12.0) == [1, 2, 3, 4]
+    assert ids_in_box(dateline_conn, 0.0, 175.0, 1.0) == []
+
+
+def test_nearest_neighbour_across_the_dateline(dateline_conn):
+    _, rows = nearest_profiles(dateline_conn, 0.0, 179.9, k=2)
+    assert [row[0] for row in rows] == [1, 2]
+    assert rows[1][-1] == pytest.approx(great_circle_km(0.0, 179.9, 0.0, -179.8))
+
+
+def test_box_near_the_poles_spans_every_longitude():
+    clauses, params = box_predicate(89.5, 10.0, 1.0)
+    assert "lon" not in clauses and params == [88.5, 90.0]
+    clauses, params = box_predicate(60.0, 10.0, 1.0)
+    lon_lo, lon_hi = params[2:]
+    assert lon_hi - 10.0 == pytest.approx(1.0 / 0.4848, rel=1e-3)  # widened by 1/cos(61 deg)
+    assert lon_lo == pytest.approx(20.0 - lon_hi)
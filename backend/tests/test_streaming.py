@@ -0,0 +1,62 @@
+import datetime
+import json
+
+QUESTION = "show temperature of floats"
+
+
+def ndjson_events(resp):
+    body = resp.get_data(as_text=True)
+    assert body.endswith("\n")
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def sse_events(resp):
+    body = resp.get_data(as_text=True)
+    assert body.endswith("\n\n")
+    events = []
+    for block in body.split("\n\n")[:-1]:
+        event_line, data_line = block.split("\n")
+        assert event_line.startswith("event: ") and data_line.startswith("data: ")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def test_formatters_put_one_event_per_frame(app_module):
+    events = [("rows", {"rows": [{"date": datetime.date(2020, 1, 2), "note": "two\nlines"}]}),
+              ("summary", {"summary": "ok"})]
+    lines = list(app_module.format_ndjson(iter(events)))
+    assert [json.loads(line)["event"] for line in lines] == ["rows", "summary"]
+    assert all(line.count("\n") == 1 for line in lines)
+    assert json.loads(lines[0])["rows"][0] == {"date": "2020-01-02", "note": "two\nlines"}
+    frames = list(app_module.format_sse(iter(events)))
+    assert frames[0].startswith("event: rows\ndata: ") and frames[0].count("\n") == 3
+
+
+def test_ndjson_stream_is_columns_then_row_batches_then_summary(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "STREAM_BATCH_SIZE", 30)
+    resp = client.post("/api/query", json={"query": QUESTION}, headers={"Accept": "application/x-ndjson"})
+    assert resp.status_code == 200 and resp.mimetype == "application/x-ndjson"
+    assert resp.headers["Cache-Control"] == "no-cache" and resp.headers["X-Accel-Buffering"] == "no"
+    events = ndjson_events(resp)
+    assert events[0]["event"] == "columns" and events[-1]["event"] == "summary"
+    batches = [e["rows"] for e in events[1:-1]]
+    assert all(e["event"] == "rows" for e in events[1:-1])
+    assert len(batches) > 1 and all(len(batch) == 30 for batch in batches[:-1])
+    assert events[-1]["row_count"] == sum(len(batch) for batch in batches)
+    assert set(batches[0][0]) == set(events[0]["columns"])
+
+
+def test_sse_stream_carries_the_same_events(client):
+    ndjson = ndjson_events(client.post("/api/query", json={"query": QUESTION},
+                                       headers={"Accept": "application/x-ndjson"}))
+    resp = client.post("/api/query", json={"query": QUESTION}, headers={"Accept": "text/event-stream"})
+    assert resp.status_code == 200 and resp.mimetype == "text/event-stream"
+    sse = sse_events(resp)
+    assert [name for name, _ in sse] == [e["event"] for e in ndjson]
+    assert sse[0][1] == {"columns": ndjson[0]["columns"]}
+
+
+def test_plain_json_without_a_stream_accept_header(client):
+    resp = client.post("/api/query", json={"query": QUESTION})
+    assert resp.status_code == 200 and resp.mimetype == "application/json"
+    assert "summary" in resp.get_json()
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from summaries import SummaryJobs
+
+
+def test_finished_jobs_are_evicted_after_the_ttl():
+    jobs = SummaryJobs(ttl_seconds=0.05)
+    job_id = jobs.submit(lambda: "done")
+    assert jobs.get(job_id, wait=2) == {"status": "done", "summary": "done"}
+    time.sleep(0.1)
+    jobs.submit(lambda: "next")  # eviction runs on submit
+    assert jobs.get(job_id) is None
+    assert jobs.stats()["jobs"] == 1
+
+
+def test_jobs_within_the_ttl_are_kept():
+    jobs = SummaryJobs(ttl_seconds=600)
+    first = jobs.submit(lambda: "a")
+    jobs.get(first, wait=2)
+    jobs.submit(lambda: "b")
+    assert jobs.get(first)["summary"] == "a"
+
+
+def test_running_jobs_are_never_evicted():
+    release = threading.Event()
+    jobs = SummaryJobs(ttl_seconds=0)
+    slow = jobs.submit(lambda: release.wait(2) and "slow")
+    time.sleep(0.05)
+    jobs.submit(lambda: "fast")
+    assert jobs.get(slow) == {"status": "pending", "summary": None}
+    release.set()
+    assert jobs.get(slow, wait=2)["summary"] == "slow"
+
+
+def test_full_backlog_rejects_new_jobs():
+    release = threading.Event()
+    jobs = SummaryJobs(max_workers=1, max_pending=2)
+    ids = [jobs.submit(release.wait, 2) for _ in range(2)]
+    assert jobs.submit(lambda: "overflow") is None
+    assert jobs.stats() == {"jobs": 2, "pending": 2}
+    release.set()
+    for job_id in ids:
+        jobs.get(job_id, wait=2)
+    assert jobs.stats()["pending"] == 0
+    assert jobs.submit(lambda: "room again") is not None
+
+
+def test_failures_are_reported_as_errors():
+    def boom():
+        raise RuntimeError("LLM down")
+
+    jobs = SummaryJobs()
+    result = jobs.get(jobs.submit(boom), wait=2)
+    assert result["status"] == "error" and "LLM down" in result["summary"]
+    assert jobs.get("no-such-job") is None
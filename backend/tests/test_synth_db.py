@@ -0,0 +1,47 @@
+import sqlite3
+
+import synth_db
+from rollups import has_rollups
+from schema import SCHEMA_VERSION, detect_schema
+from spatial import has_spatial_index
+
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT * FROM argo_profiles ORDER BY rowid").fetchall()
+    metadata = conn.execute("SELECT * FROM argo_metadata ORDER BY float_id").fetchall()
+    conn.close()
+    return rows, metadata
+
+
+def test_same_seed_builds_the_same_database(tmp_path):
+    assert synth_db.build(str(tmp_path / "a.db"), 3000, seed=3, cycles=5) == \
+        synth_db.build(str(tmp_path / "b.db"), 3000, seed=3, cycles=5)
+    assert dump(str(tmp_path / "a.db")) == dump(str(tmp_path / "b.db"))
+    synth_db.build(str(tmp_path / "c.db"), 3000, seed=4, cycles=5)
+    assert dump(str(tmp_path / "c.db")) != dump(str(tmp_path / "a.db"))
+
+
+def test_v2_database_is_indexed_and_rolled_up(synth_db_path):
+    conn = sqlite3.connect(synth_db_path)
+    assert detect_schema(conn) == SCHEMA_VERSION
+    assert has_spatial_index(conn) and has_rollups(conn)
+    n, floats, profiles, bad = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT float_id), COUNT(DISTINCT profile_id), "
+        "SUM(date_epoch IS NULL OR temperature IS NULL OR latitude NOT BETWEEN -90 AND 90) FROM argo_profiles"
+    ).fetchone()
+    assert n == 20000 and floats > 20 and profiles == n // 40 and bad == 0
+    orphans = conn.execute("SELECT COUNT(*) FROM argo_profiles WHERE float_id NOT IN "
+                           "(SELECT float_id FROM argo_metadata)").fetchone()[0]
+    assert orphans == 0
+    conn.close()
+
+
+def test_legacy_layout_uses_text_float_ids(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    synth_db.build(path, 2000, seed=3, cycles=5, legacy=True)
+    conn = sqlite3.connect(path)
+    assert detect_schema(conn) == 1
+    float_id = conn.execute("SELECT float_id FROM argo_profiles LIMIT 1").fetchone()[0]
+    assert float_id.startswith("b'") and float_id.endswith(" '")
+    conn.close()
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+import vector_index  # noqa: E402
+from vector_index import SqliteMetadata, VectorIndex, VectorStore  # noqa: E402
+
+DIM = 8
+
+
+def unit(rng, n):
+    v = rng.normal(size=(n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "faiss_index.bin"), str(tmp_path / "vector_meta.db")
+
+
+def open_index(paths):
+    return VectorIndex(paths[0], SqliteMetadata(paths[1]), reload_seconds=0)
+
+
+def nearest_float(paths, vector, k=1):
+    return [hit["float_id"] for hit in open_index(paths).search(vector[None, :], k)[0]]
+
+
+def test_flat_upsert_replaces_and_remove_deletes(paths):
+    rng = np.random.default_rng(0)
+    vectors = unit(rng, 50)
+    ids = list(range(1900100, 1900150))
+    store = VectorStore(*paths)
+    assert store.upsert(ids, [f"float {i}" for i in ids], vectors, "m") == "flat"
+    assert nearest_float(paths, vectors[7]) == [1900107]
+
+    moved = unit(rng, 1)
+    assert store.upsert([1900107], ["float 1900107 (re-embedded)"], moved, "m") == "flat"
+    assert nearest_float(paths, moved[0]) == [1900107]
+    assert store.count() == 50 and faiss.read_index(paths[0]).ntotal == 50
+
+    store.remove([1900107, 1900108])
+    assert 1900107 not in nearest_float(paths, moved[0], k=5)
+    assert faiss.read_index(paths[0]).ntotal == 48 and store.count() == 48
+    store.close()
+
+
+def test_hnsw_upserts_leave_stale_vectors_that_search_skips(paths):
+    rng = np.random.default_rng(1)
+    cluster = unit(rng, 1) + 0.01 * rng.normal(size=(15, DIM)).astype(np.float32)
+    vectors = np.vstack([unit(rng, 185), cluster]).astype(np.float32)
+    ids = list(range(1900000, 1900200))
+    store = VectorStore(*paths)
+    store.upsert(ids, [str(i) for i in ids], vectors, "m")
+    assert store.rebuild("hnsw") == "hnsw"
+
+    # Re-embed the 15 clustered floats elsewhere: their old vectors stay in the index, unreachable.
+    moved = unit(rng, 15)
+    assert store.upsert(ids[185:], [str(i) for i in ids[185:]], moved, "m") == "hnsw"
+    assert int(store.info("stale")) == 15 and faiss.read_index(paths[0]).ntotal == 215
+
+    # The 15 nearest candidates (more than k * 2) are all stale: search must keep fetching.
+    live = np.vstack([vectors[:185], moved])
+    expected = np.argsort(((live - cluster[0]) ** 2).sum(axis=1))[:5]
+    assert nearest_float(paths, cluster[0], k=5) == [ids[i] for i in expected]
+
+    # Once stale vectors pass HNSW_STALE_FRACTION, the next change rebuilds the index without them.
+    store.remove(ids[:10])
+    assert int(store.info("stale")) == 25 and faiss.read_index(paths[0]).ntotal == 215
+    store.remove(ids[10:11])
+    assert int(store.info("stale")) == 0 and faiss.read_index(paths[0]).ntotal == 189
+    store.close()
+
+
+def test_search_stops_when_the_index_runs_out(paths):
+    rng = np.random.default_rng(2)
+    store = VectorStore(*paths)
+    store.upsert([1, 2, 3], ["a", "b", "c"], unit(rng, 3), "m")
+    store.close()
+    results = open_index(paths).search(unit(rng, 2), k=10)
+    assert [len(r) for r in results] == [3, 3]
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc/self/maps")
+def test_mmapped_reports_what_faiss_did(paths, monkeypatch):
+    rng = np.random.default_rng(3)
+    store = VectorStore(*paths)
+    store.upsert([1, 2], ["a", "b"], unit(rng, 2), "m")
+    store.close()
+    # A flat index ignores IO_FLAG_MMAP on its own (it needs IO_FLAG_MMAP_IFC) and is read into memory.
+    monkeypatch.setattr(vector_index, "_mmap_flags", lambda faiss: [faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY])
+    stats = open_index(paths).stats()
+    assert stats["mmap_requested"] is True and stats["mmapped"] is False
@@ -0,0 +1,419 @@
+"""Float retrieval index: a FAISS index keyed by float_id plus a SQLite metadata table.
+
+Usage:
+    python vector_index.py convert [--index faiss_index.bin] [--legacy-metadata metadata_map.npy] [--meta vector_meta.db]
+    python vector_index.py rebuild [--type auto|flat|hnsw|ivf]
+    python vector_index.py stats
+
+Vector ids (labels) are float IDs, so a float can be re-embedded or removed without touching the others.
+HNSW cannot remove vectors, so a re-embedded float gets a fresh label there (vectors.label); search
+resolves hits by label, so the superseded vector no longer matches any metadata row and is dropped.
+Embeddings are kept next to their metadata (vector_meta.db), which lets the index be rebuilt with
+another type, or retrained, without re-encoding. The index type follows the corpus size: exact flat
+search for small catalogues, HNSW for mid-sized ones and IVF with 8-bit scalar quantization (4x
+smaller, memory-mapped, removable) beyond that. Serving processes open the index memory-mapped and
+read metadata from SQLite, so gunicorn workers share the same pages instead of each holding a copy.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+FLAT_MAX_VECTORS = 50000
+HNSW_MAX_VECTORS = 1000000
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+HNSW_M = 32
+HNSW_STALE_FRACTION = 0.1  # HNSW cannot delete: rebuild once this share of its vectors is superseded
+HNSW_LABEL_BASE = 1 << 40  # fresh labels for re-embedded floats start here (above any float ID)
+IVF_RETRAIN_GROWTH = 4     # retrain IVF centroids once the corpus has grown this much since training
+
+META_DDL = """
+CREATE TABLE IF NOT EXISTS vectors (
+    id INTEGER PRIMARY KEY, float_id INTEGER NOT NULL, summary TEXT NOT NULL, embedding BLOB NOT NULL,
+    label INTEGER
+);
+CREATE TABLE IF NOT EXISTS index_info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def choose_index_type(n):
+    if n <= FLAT_MAX_VECTORS:
+        return "flat"
+    return "hnsw" if n <= HNSW_MAX_VECTORS else "ivf"
+
+
+def _mmap_flags(faiss):
+    """Read flags to try in order: IO_FLAG_MMAP_IFC (faiss >= 1.10) maps flat code storage, IO_FLAG_MMAP
+    maps IVF inverted lists (the two cannot be combined for IVF)."""
+    flags = [faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY]
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        flags.insert(0, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    return flags
+
+
+def _is_mapped(path):
+    """Whether `path` is memory-mapped into this process, from /proc/self/maps (None where that is unavailable).
+
+    faiss silently reads an index into memory when its type does not support the mmap flags it was given.
+    """
+    path = os.path.realpath(path)
+    try:
+        with open("/proc/self/maps") as maps:
+            return any(line.rstrip("\n").endswith(" " + path) for line in maps)
+    except OSError:
+        return None
+
+
+def _write_atomic(faiss, index, path):
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+# --------------------------
+# Metadata lookups (by vector id)
+# --------------------------
+class SqliteMetadata:
+    """Read-only, per-thread connections to vector_meta.db; rows are fetched by primary key."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._key = None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        if self._key is None:  # files written before labels existed are keyed by id only
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(vectors)")}
+            self._key = "label" if "label" in columns else "id"
+        return conn
+
+    def lookup(self, ids):
+        """Metadata by FAISS label; labels of superseded or removed vectors are simply absent."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT {self._key}, float_id, summary FROM vectors WHERE {self._key} IN ({', '.join('?' for _ in ids)})",
+            ids,
+        )
+        return {i: {"float_id": float_id, "summary": summary} for i, float_id, summary in rows}
+
+
+class ArrayMetadata:
+    """Legacy metadata_map.npy ({position: metadata}) for indexes that predate vector_meta.db."""
+
+    def __init__(self, metadata_map):
+        self.table = np.empty(max(metadata_map) + 1 if metadata_map else 0, dtype=object)
+        for i, meta in metadata_map.items():
+            self.table[i] = meta
+
+    def lookup(self, ids):
+        return {int(i): self.table[i] for i in ids if 0 <= i < len(self.table) and self.table[i] is not None}
+
+
+# --------------------------
+# Serving side
+# --------------------------
+class VectorIndex:
+    """Memory-mapped FAISS index + metadata lookups; picks up a rewritten index file on its own."""
+
+    def __init__(self, index_path, metadata, nprobe=16, ef_search=64, reload_seconds=30):
+        self.index_path = index_path
+        self.metadata = metadata
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.reload_seconds = reload_seconds
+        self.mmap_requested = False
+        self.mmapped = False
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._mtime = None
+        self.index = self._open()
+
+    @classmethod
+    def open(cls, index_path, meta_path, legacy_metadata_path=None, **kwargs):
+        """Opens index + vector_meta.db, or the legacy pickled metadata map if only that exists."""
+        if os.path.exists(meta_path):
+            return cls(index_path, SqliteMetadata(meta_path), **kwargs)
+        print(f"{meta_path} not found; using legacy {legacy_metadata_path} (run `python vector_index.py convert`).")
+        metadata_map = np.load(legacy_metadata_path, allow_pickle=True).item()
+        return cls(index_path, ArrayMetadata(metadata_map), **kwargs)
+
+    def _open(self):
+        import faiss
+        self._mtime = os.stat(self.index_path).st_mtime
+        for flags in _mmap_flags(faiss):
+            try:
+                index = faiss.read_index(self.index_path, flags)
+                self.mmap_requested = True
+                break
+            except RuntimeError:
+                continue
+        else:
+            index = faiss.read_index(self.index_path)
+            self.mmap_requested = False
+        self.mmapped = _is_mapped(self.index_path) if self.mmap_requested else False
+        inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+        if hasattr(inner, "nprobe"):
+            inner.nprobe = self.nprobe
+        if hasattr(inner, "hnsw"):
+            inner.hnsw.efSearch = self.ef_search
+        return index
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_seconds:
+            return
+        with self._lock:
+            if now - self._checked < self.reload_seconds:
+                return
+            self._checked = now
+            try:
+                if os.stat(self.index_path).st_mtime != self._mtime:
+                    self.index = self._open()
+                    print(f"Reloaded vector index ({self.index.ntotal} vectors).")
+            except (OSError, RuntimeError) as e:
+                print(f"Warning: Could not reload vector index: {e}")
+
+    def search(self, vectors, k):
+        """One FAISS search for a (n, d) block of vectors; returns a list of metadata lists (<= k each).
+
+        Hits whose label has no metadata (superseded HNSW vectors, removed floats) are dropped; rows left
+        with fewer than k hits are searched again with a 4x larger fetch until the index has no more.
+        """
+        self.maybe_reload()
+        index = self.index
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        results = [[] for _ in range(len(vectors))]
+        fetch = min(k * 2 if hasattr(index, "id_map") else k, index.ntotal)  # room for superseded HNSW ids
+        pending = list(range(len(vectors)))
+        while pending and fetch > 0:
+            _, ids = index.search(vectors[pending], fetch)
+            found = self.metadata.lookup(np.unique(ids[ids >= 0]).tolist())
+            short = []
+            for row_i, row in zip(pending, ids):
+                seen, hits = set(), []
+                for i in row.tolist():
+                    if i in found and i not in seen:
+                        seen.add(i)
+                        hits.append(found[i])
+                        if len(hits) == k:
+                            break
+                results[row_i] = hits
+                if len(hits) < k and (row >= 0).all():  # a -1 means the index ran out of candidates
+                    short.append(row_i)
+            if fetch >= index.ntotal:
+                break
+            pending, fetch = short, min(fetch * 4, index.ntotal)
+        return results
+
+    def stats(self):
+        return {"vectors": int(self.index.ntotal), "mmapped": self.mmapped, "mmap_requested": self.mmap_requested}
+
+
+# --------------------------
+# Writing side (ingest.py / this CLI): incremental upserts and removals, rebuilds when needed
+# --------------------------
+class VectorStore:
+    """Owns vector_meta.db (the source of truth) and rewrites the FAISS index file from it."""
+
+    def __init__(self, index_path, meta_path):
+        import faiss
+        self.faiss = faiss
+        self.index_path = index_path
+        self.conn = sqlite3.connect(meta_path)
+        self.conn.executescript(META_DDL)
+        if "label" not in {row[1] for row in self.conn.execute("PRAGMA table_info(vectors)")}:
+            self.conn.execute("ALTER TABLE vectors ADD COLUMN label INTEGER")
+        self.conn.execute("UPDATE vectors SET label = id WHERE label IS NULL")
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS vectors_label ON vectors(label)")
+        self.conn.commit()
+
+    def info(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM index_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_info(self, **values):
+        self.conn.executemany("INSERT OR REPLACE INTO index_info (key, value) VALUES (?, ?)",
+                              [(k, str(v)) for k, v in values.items()])
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    @property
+    def model(self):
+        return self.info("model")
+
+    def _new_labels(self, n):
+        start = max(int(self.info("next_label", HNSW_LABEL_BASE)),
+                    (self.conn.execute("SELECT MAX(label) FROM vectors").fetchone()[0] or 0) + 1)
+        self._set_info(next_label=start + n)
+        return list(range(start, start + n))
+
+    def upsert(self, float_ids, summaries, vectors, model_name):
+        """Stores (or replaces) float embeddings and applies them to the index incrementally if possible.
+
+        New floats are labelled by their ID. Replaced floats keep their label (the old vector is removed
+        first), except in an HNSW index, which cannot remove: they get a fresh label and the old vector
+        is left unreachable until the next rebuild.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(float_ids, dtype=np.int64)
+        existing = dict(self.conn.execute(
+            f"SELECT id, label FROM vectors WHERE id IN ({', '.join('?' for _ in ids)})", ids.tolist())) if len(ids) else {}
+        index_type = self.info("type")
+        relabel = [int(i) for i in ids if int(i) in existing] if index_type == "hnsw" else []
+        fresh = dict(zip(relabel, self._new_labels(len(relabel))))
+        labels = np.asarray([fresh.get(int(i), existing.get(int(i), int(i))) for i in ids], dtype=np.int64)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO vectors (id, float_id, summary, embedding, label) VALUES (?, ?, ?, ?, ?)",
+            [(int(i), int(i), s, v.tobytes(), int(l)) for i, s, v, l in zip(ids, summaries, vectors, labels)],
+        )
+        self._set_info(model=model_name, dim=vectors.shape[1] if len(vectors) else self.info("dim", 0))
+        self.conn.commit()
+
+        index = self._load_for_update()
+        if index is None or not self._fits(index):
+            return self.rebuild()
+        if index_type == "hnsw":
+            self._set_info(stale=int(self.info("stale", 0)) + len(existing))
+        elif existing:
+            index.remove_ids(np.fromiter(existing.values(), dtype=np.int64))
+        index.add_with_ids(vectors, labels)
+        _write_atomic(self.faiss, index, self.index_path)
+        self.conn.commit()
+        return index_type
+
+    def remove(self, float_ids):
+        ids = [int(i) for i in float_ids]
+        labels = [row[0] for row in self.conn.execute(
+            f"SELECT label FROM vectors WHERE id IN ({', '.join('?' for _ in ids)})", ids)] if ids else []
+        self.conn.executemany("DELETE FROM vectors WHERE id = ?", [(i,) for i in ids])
+        self.conn.commit()
+        index = self._load_for_update()
+        if index is None or not self._fits(index):
+            return self.rebuild()
+        if self.info("type") == "hnsw":
+            self._set_info(stale=int(self.info("stale", 0)) + len(ids))  # hidden by the metadata lookup
+        else:
+            index.remove_ids(np.asarray(labels, dtype=np.int64))
+        _write_atomic(self.faiss, index, self.index_path)
+        self.conn.commit()
+        return self.info("type")
+
+    def _load_for_update(self):
+        if not os.path.exists(self.index_path) or self.info("type") not in INDEX_TYPES:
+            return None
+        index = self.faiss.read_index(self.index_path)
+        return index if hasattr(index, "id_map") or self.info("type") == "ivf" else None
+
+    def _fits(self, index):
+        """Whether the current index can still take incremental changes (else rebuild)."""
+        n, index_type = self.count(), self.info("type")
+        if choose_index_type(n) != index_type and self.info("pinned") != "1":
+            return False
+        if index.d != int(self.info("dim", 0)):
+            return False
+        if index_type == "hnsw":
+            return int(self.info("stale", 0)) <= HNSW_STALE_FRACTION * max(n, 1)
+        if index_type == "ivf":
+            return n <= IVF_RETRAIN_GROWTH * int(self.info("trained_on", 0))
+        return True
+
+    def _vectors(self):
+        ids, blobs = [], []
+        for i, blob in self.conn.execute("SELECT label, embedding FROM vectors ORDER BY label"):
+            ids.append(i)
+            blobs.append(blob)
+        if not ids:
+            return np.empty(0, dtype=np.int64), None
+        return np.asarray(ids, dtype=np.int64), np.vstack([np.frombuffer(b, dtype=np.float32) for b in blobs])
+
+    def rebuild(self, index_type=None):
+        """Builds a fresh index of `index_type` (default: by corpus size) from every stored embedding."""
+        ids, matrix = self._vectors()
+        if matrix is None:
+            return None
+        n, d = matrix.shape
+        pinned = index_type is not None
+        index_type = index_type or choose_index_type(n)
+        if index_type == "flat":
+            index = self.faiss.index_factory(d, "IDMap2,Flat")
+        elif index_type == "hnsw":
+            index = self.faiss.index_factory(d, f"IDMap2,HNSW{HNSW_M}")
+        else:
+            nlist = int(min(max(4 * np.sqrt(n), 16), 65536, max(n // 39, 1)))
+            index = self.faiss.index_factory(d, f"IVF{nlist},SQ8")
+            sample = matrix if n <= 256 * nlist else matrix[np.random.default_rng(0).choice(n, 256 * nlist, replace=False)]
+            index.train(sample)
+        index.add_with_ids(matrix, ids)
+        _write_atomic(self.faiss, index, self.index_path)
+        self._set_info(type=index_type, dim=d, stale=0, trained_on=n, pinned=int(pinned))
+        self.conn.commit()
+        print(f"Built {index_type} index with {n} vectors.")
+        return index_type
+
+    def close(self):
+        self.conn.close()
+
+
+def convert_legacy(index_path, legacy_metadata_path, meta_path, model_name="all-MiniLM-L6-v2"):
+    """Moves a positional IndexFlatL2 + pickled metadata_map.npy to float_id keyed vectors + vector_meta.db."""
+    import faiss
+    from schema import normalize_float_id
+    legacy = faiss.read_index(index_path)
+    metadata_map = np.load(legacy_metadata_path, allow_pickle=True).item()
+    vectors = legacy.reconstruct_n(0, legacy.ntotal)
+    ids, summaries, rows = [], [], []
+    for position, meta in sorted(metadata_map.items()):
+        float_id = normalize_float_id(meta.get("float_id"))
+        if float_id is None or position >= legacy.ntotal:
+            continue
+        ids.append(float_id)
+        summaries.append(meta.get("summary", "").replace(str(meta.get("float_id")), str(float_id)))
+        rows.append(vectors[position])
+    store = VectorStore(index_path, meta_path)
+    store.upsert(ids, summaries, np.vstack(rows), model_name)
+    store.close()
+    return len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the float retrieval index.")
+    parser.add_argument("command", choices=["convert", "rebuild", "stats"])
+    parser.add_argument("--index", default="faiss_index.bin")
+    parser.add_argument("--meta", default="vector_meta.db")
+    parser.add_argument("--legacy-metadata", default="metadata_map.npy")
+    parser.add_argument("--type", choices=("auto",) + INDEX_TYPES, default="auto")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if os.path.exists(args.meta):
+            print(f"{args.meta} already exists.")
+            return 1
+        print(f"Converted {convert_legacy(args.index, args.legacy_metadata, args.meta)} vectors to {args.meta}.")
+        return 0
+    store = VectorStore(args.index, args.meta)
+    if args.command == "rebuild":
+        store.rebuild(None if args.type == "auto" else args.type)
+    else:
+        info = dict(store.conn.execute("SELECT key, value FROM index_info"))
+        print({"vectors": store.count(), **info, "index_bytes": os.path.getsize(args.index)})
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())